@@ -0,0 +1,67 @@
+"""
+Compares parse / transform / write times of the ElementTree and lxml backends
+on a large synthetic DEFTABLE (see synthetic_deftable.py).
+
+Usage:
+  python3 benchmarks/bench_backends.py --folders 100 --jobs-per-folder 100
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_deftable import generate_deftable
+from src import xml_backend
+from src.step_engine import apply_steps
+
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+
+def time_backend(backend: str, input_path: str, output_path: str) -> dict:
+    """Returns parse/transform/write wall times in seconds for one backend."""
+    xml_backend.set_backend(backend)
+    start = time.perf_counter()
+    tree = xml_backend.parse(input_path)
+    parsed = time.perf_counter()
+    apply_steps(tree.getroot(), ALL_STEPS, 'preprod')
+    transformed = time.perf_counter()
+    xml_backend.write(tree, output_path)
+    written = time.perf_counter()
+    return {'parse': parsed - start, 'transform': transformed - parsed, 'write': written - transformed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ElementTree and lxml backends.")
+    parser.add_argument("--folders", type=int, default=100, help="Number of folders (default: 100).")
+    parser.add_argument("--jobs-per-folder", type=int, default=100, help="Jobs per folder (default: 100).")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    backends = ['etree'] + (['lxml'] if xml_backend.lxml_module() is not None else [])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, "synthetic.xml")
+        jobs = generate_deftable(input_path, args.folders, args.jobs_per_folder)['jobs']
+        size_mb = os.path.getsize(input_path) / 1e6
+        print(f"Synthetic DEFTABLE: {jobs} jobs, {size_mb:.1f} MB")
+
+        results = {}
+        for backend in backends:
+            results[backend] = time_backend(backend, input_path, os.path.join(tmp_dir, f"out_{backend}.xml"))
+
+    print(f"{'backend':<8} {'parse':>8} {'transform':>10} {'write':>8} {'total':>8}")
+    for backend, timings in results.items():
+        total = sum(timings.values())
+        print(f"{backend:<8} {timings['parse']:>8.3f} {timings['transform']:>10.3f} {timings['write']:>8.3f} {total:>8.3f}")
+    if 'lxml' in results:
+        for phase in ('parse', 'transform', 'write'):
+            print(f"lxml speedup ({phase}): {results['etree'][phase] / results['lxml'][phase]:.2f}x")
+    else:
+        print("lxml is not installed; only the ElementTree backend was measured.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compares transforming a gzip-compressed DEFTABLE directly (see
+compression.py) with decompressing it to disk first and compressing the
+result afterwards, on a large synthetic file.
+
+Usage:
+  python3 benchmarks/bench_compression.py                     # 100k jobs, streaming
+  python3 benchmarks/bench_compression.py --folders 100 --no-stream
+"""
+import argparse
+import gzip
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_deftable import generate_deftable
+from src.modify_controlm_xml import transform_file
+
+STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time compressed input and output against decompressing to disk.")
+    parser.add_argument("--folders", type=int, default=1000, help="Number of folders (default: 1000).")
+    parser.add_argument("--jobs-per-folder", type=int, default=100, help="Jobs per folder (default: 100).")
+    parser.add_argument("--no-stream", action="store_true", help="Parse the whole file instead of streaming it.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR, format="%(message)s")
+    stream = not args.no_stream
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        plain_path = os.path.join(tmp_dir, "synthetic.xml")
+        jobs = generate_deftable(plain_path, args.folders, args.jobs_per_folder)['jobs']
+        input_path = plain_path + ".gz"
+        with open(plain_path, 'rb') as f_in, gzip.open(input_path, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(plain_path)
+        print(f"Synthetic DEFTABLE: {jobs} jobs, {os.path.getsize(input_path) / 1e6:.1f} MB gzipped")
+
+        # Decompress to disk, transform the plain file, compress the result
+        start = time.perf_counter()
+        with gzip.open(input_path, 'rb') as f_in, open(plain_path, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        staged_path = os.path.join(tmp_dir, "staged_out.xml")
+        transform_file(plain_path, staged_path, 'preprod', STEPS, stream=stream)
+        with open(staged_path, 'rb') as f_in, gzip.open(staged_path + ".gz", 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        staged_time = time.perf_counter() - start
+        scratch_mb = (os.path.getsize(plain_path) + os.path.getsize(staged_path)) / 1e6
+        os.remove(plain_path)
+        os.remove(staged_path)
+
+        start = time.perf_counter()
+        direct_path = os.path.join(tmp_dir, "direct_out.xml.gz")
+        transform_file(input_path, direct_path, 'preprod', STEPS, stream=stream)
+        direct_time = time.perf_counter() - start
+
+        print(f"{'decompress to disk':<19} {staged_time:7.2f}s  {scratch_mb:6.1f} MB of plain XML on disk")
+        print(f"{'direct':<19} {direct_time:7.2f}s  {0:6.1f} MB of plain XML on disk")
+        print(f"output {os.path.getsize(direct_path) / 1e6:.1f} MB gzipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares the resident size of a parsed DEFTABLE with and without --compact
+(see xml_backend.parse_compact()) on a large synthetic file.
+
+Each parse runs in a fresh process, so its peak RSS is its own.
+
+Usage:
+  python3 benchmarks/bench_memory.py                          # 100k jobs
+  python3 benchmarks/bench_memory.py --folders 100 --jobs-per-folder 100
+"""
+import argparse
+import gc
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_deftable import generate_deftable
+from src import xml_backend
+from src.metrics import peak_rss_mb
+
+
+def _current_rss_mb() -> float:
+    # Resident pages as counted by the kernel; None where /proc is not available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+def measure_parse(mode: str, input_path: str) -> dict:
+    """Parses input_path in one mode ('etree', 'lxml' or 'compact') and measures it. Runs in a worker process."""
+    logging.disable(logging.INFO)
+    rss_before = _current_rss_mb()
+    start = time.perf_counter()
+    if mode == 'compact':
+        tree = xml_backend.parse_compact(input_path)
+    else:
+        xml_backend.set_backend(mode)
+        tree = xml_backend.parse(input_path)
+    seconds = time.perf_counter() - start
+    gc.collect()
+    rss_after = _current_rss_mb()
+    return {
+        'mode': mode,
+        'seconds': seconds,
+        'tree_mb': rss_after - rss_before if rss_after is not None else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'elements': sum(1 for _ in tree.iter()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the memory of a parsed DEFTABLE with and without --compact.")
+    parser.add_argument("--folders", type=int, default=1000, help="Number of folders (default: 1000).")
+    parser.add_argument("--jobs-per-folder", type=int, default=100, help="Jobs per folder (default: 100).")
+    args = parser.parse_args()
+
+    modes = ['etree'] + (['lxml'] if xml_backend.lxml_module() is not None else []) + ['compact']
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, "synthetic.xml")
+        jobs = generate_deftable(input_path, args.folders, args.jobs_per_folder)['jobs']
+        print(f"Synthetic DEFTABLE: {jobs} jobs, {os.path.getsize(input_path) / 1e6:.1f} MB")
+        results = []
+        for mode in modes:
+            with context.Pool(1) as pool:
+                results.append(pool.apply(measure_parse, (mode, input_path)))
+
+    print(f"{'mode':<8} {'parse s':>8} {'tree MB':>8} {'peak RSS MB':>12}")
+    for result in results:
+        tree_mb = f"{result['tree_mb']:.0f}" if result['tree_mb'] is not None else 'n/a'
+        print(f"{result['mode']:<8} {result['seconds']:>8.2f} {tree_mb:>8} {result['peak_rss_mb']:>12.0f}")
+    plain, compact = results[0], results[-1]
+    print(f"compact peak RSS vs etree: {100 * (1 - compact['peak_rss_mb'] / plain['peak_rss_mb']):.0f}% lower")
+
+
+if __name__ == "__main__":
+    main()
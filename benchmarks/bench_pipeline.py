@@ -0,0 +1,80 @@
+"""
+Compares a batch run with and without --pipeline (see batch_pipeline.py)
+on synthetic files, optionally adding latency to every read and write to
+stand in for network storage.
+
+Both runs use one transform worker, so the difference is the reading and
+writing the pipeline overlaps with transforming.
+
+Usage:
+  python3 benchmarks/bench_pipeline.py                     # 12 files of 10k jobs, 0.5s latency
+  python3 benchmarks/bench_pipeline.py --files 4 --latency 0
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_deftable import generate_deftable
+from src import batch_pipeline, modify_controlm_xml
+from src.batch import collect_input_files, log_pipeline_stats, run_batch
+from src.xml_writer import IncrementalXmlWriter
+
+STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+
+def _with_latency(func, seconds: float):
+    def slow(*args, **kwargs):
+        time.sleep(seconds)
+        return func(*args, **kwargs)
+    return slow
+
+
+def add_latency(seconds: float) -> None:
+    """Makes every input read and output write of both kinds of batch run take seconds longer."""
+    modify_controlm_xml.parse_xml = _with_latency(modify_controlm_xml.parse_xml, seconds)
+    IncrementalXmlWriter.finish = _with_latency(IncrementalXmlWriter.finish, seconds)
+    batch_pipeline._read_file = _with_latency(batch_pipeline._read_file, seconds)
+    batch_pipeline.write_xml_bytes = _with_latency(batch_pipeline.write_xml_bytes, seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time batch runs with and without --pipeline.")
+    parser.add_argument("--files", type=int, default=12, help="Number of input files (default: 12).")
+    parser.add_argument("--folders", type=int, default=100, help="Folders per file (default: 100).")
+    parser.add_argument("--jobs-per-folder", type=int, default=100, help="Jobs per folder (default: 100).")
+    parser.add_argument("--latency", type=float, default=0.5,
+                        help="Seconds added to every read and write (default: 0.5).")
+    parser.add_argument("--queue-depth", type=int, default=None, help="Pipeline queue depth (default: 4).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR, format="%(message)s")
+    if args.latency:
+        add_latency(args.latency)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_dir = os.path.join(tmp_dir, "in")
+        os.makedirs(input_dir)
+        generate_deftable(os.path.join(input_dir, "file_0.xml"), args.folders, args.jobs_per_folder)
+        for i in range(1, args.files):
+            shutil.copy(os.path.join(input_dir, "file_0.xml"), os.path.join(input_dir, f"file_{i}.xml"))
+        files = collect_input_files(input_dir)
+        print(f"{len(files)} files of {args.folders * args.jobs_per_folder} jobs, {args.latency}s latency per read/write")
+
+        for pipeline in (False, True):
+            output_dir = os.path.join(tmp_dir, "pipeline" if pipeline else "plain")
+            start = time.perf_counter()
+            summary = run_batch(files, input_dir, output_dir, 'preprod', STEPS, jobs=1, pipeline=pipeline,
+                                queue_depth=args.queue_depth)
+            print(f"{'pipeline' if pipeline else 'plain':<9} {time.perf_counter() - start:7.2f}s "
+                  f"({len(summary['succeeded'])} files written)")
+        logging.getLogger().setLevel(logging.INFO)
+        log_pipeline_stats(summary['pipeline'])
+
+
+if __name__ == "__main__":
+    main()
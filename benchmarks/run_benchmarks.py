@@ -0,0 +1,119 @@
+"""
+Times parse, every step in STEP_FUNCTION_MAP and write on synthetic
+DEFTABLEs of increasing size, and reports peak memory and jobs/sec.
+
+Each size runs in a fresh process so its peak RSS is not inflated by the
+sizes measured before it.
+
+Usage:
+  python3 benchmarks/run_benchmarks.py                      # 1k, 10k and 100k jobs
+  python3 benchmarks/run_benchmarks.py --jobs 1000 10000 --backend lxml --json results.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_deftable import generate_deftable
+from src import xml_backend
+from src.metrics import peak_rss_mb
+from src.step_engine import STEP_FUNCTION_MAP, ENV_STEPS
+
+# Same order the CLI applies them in by default
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark_size(jobs: int, jobs_per_folder: int, target_env: str, backend: str, density: dict) -> dict:
+    """Generates a DEFTABLE with `jobs` jobs and times each phase on it. Runs in a worker process."""
+    logging.disable(logging.INFO)
+    xml_backend.set_backend(backend)
+    folders = max(1, jobs // jobs_per_folder)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, "synthetic.xml")
+        output_path = os.path.join(tmp_dir, "output.xml")
+        stats = generate_deftable(input_path, folders, jobs_per_folder, **density)
+        size_mb = os.path.getsize(input_path) / 1e6
+        rss_before = peak_rss_mb()
+
+        timings = {}
+        tree, timings['parse'] = _timed(xml_backend.parse, input_path)
+        root = tree.getroot()
+        for step in ALL_STEPS:
+            func = STEP_FUNCTION_MAP[step]
+            if step in ENV_STEPS:
+                _, timings[step] = _timed(func, root, target_env)
+            else:
+                _, timings[step] = _timed(func, root)
+        _, timings['write'] = _timed(xml_backend.write, tree, output_path)
+
+    total = sum(timings.values())
+    return {
+        'jobs': stats['jobs'],
+        'folders': stats['folders'],
+        'size_mb': size_mb,
+        'backend': xml_backend.get_backend(),
+        'timings': timings,
+        'total': total,
+        'jobs_per_sec': stats['jobs'] / total if total else float('inf'),
+        'peak_rss_mb': peak_rss_mb(),
+        'baseline_rss_mb': rss_before,
+    }
+
+
+def _print_report(results: list) -> None:
+    phases = ['parse'] + ALL_STEPS + ['write']
+    header = f"{'jobs':>8} {'MB':>7} " + ' '.join(f"{phase:>13}" for phase in phases) + f" {'total':>8} {'jobs/s':>9} {'peak MB':>8}"
+    print(header)
+    for result in results:
+        cells = ' '.join(f"{result['timings'][phase]:>13.3f}" for phase in phases)
+        print(f"{result['jobs']:>8} {result['size_mb']:>7.1f} {cells} {result['total']:>8.3f} "
+              f"{result['jobs_per_sec']:>9.0f} {result['peak_rss_mb']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parse, each step and write on synthetic DEFTABLEs.")
+    parser.add_argument("--jobs", type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Job counts to benchmark (default: 1000 10000 100000).")
+    parser.add_argument("--jobs-per-folder", type=int, default=100, help="Jobs per folder (default: 100).")
+    parser.add_argument("--on-blocks", type=int, default=2, help="ON blocks per job (default: 2).")
+    parser.add_argument("--quantitatives", type=int, default=2, help="QUANTITATIVE resources per job (default: 2).")
+    parser.add_argument("--variables", type=int, default=2, help="VARIABLEs per job besides %%user (default: 2).")
+    parser.add_argument("-t", "--target-env", default='preprod', choices=['preprod', 'prod'],
+                        help="Target environment (default: preprod).")
+    parser.add_argument("--backend", choices=xml_backend.BACKEND_CHOICES, default='auto',
+                        help="XML backend to benchmark (default: auto).")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    density = {'on_blocks': args.on_blocks, 'quantitatives': args.quantitatives, 'variables': args.variables}
+    # A fresh interpreter per size keeps each peak RSS independent of the others
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for jobs in args.jobs:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(benchmark_size, (jobs, args.jobs_per_folder, args.target_env,
+                                                       args.backend, density)))
+
+    print(f"Backend: {results[0]['backend']}, target: {args.target_env}, times in seconds")
+    _print_report(results)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
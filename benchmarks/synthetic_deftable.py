@@ -0,0 +1,120 @@
+"""
+Generates realistic synthetic Control-M DEFTABLE exports for benchmarks.
+
+The output follows the conventions of sample_data/sample_controlm_dev.xml:
+-DEV- environment tags in folder/application/job names, -ADF-/-DW-/-ADB-/-CMD-
+job types, _dev service accounts, dev_dc_N datacenters, dev host names,
+INCOND/OUTCOND chains between consecutive jobs and dev-style ON/DOMAIL blocks.
+
+Usage:
+  python3 benchmarks/synthetic_deftable.py --output /tmp/synthetic.xml \\
+    --folders 100 --jobs-per-folder 100
+"""
+import argparse
+import random
+from xml.sax.saxutils import quoteattr
+
+BUSINESS_UNITS = [
+    ('FIN', 'GL', 'fin'), ('FIN', 'AP', 'fin'), ('MKT', 'CAMP', 'mkt'),
+    ('OPS', 'SAFETY', 'ops'), ('LOG', 'SHIP', 'log'), ('HR', 'PAY', 'hr'),
+]
+PROCESS_TYPES = ['ETL', 'RPT', 'SYNC', 'LOAD']
+JOB_TYPES = ['ADF', 'DW', 'ADB', 'CMD']
+DEV_RESOURCES = {'ADF': 'ADFDEV', 'DW': 'DWDEV', 'ADB': 'ADBDEV'}
+JOB_ACTIONS = ['Load_Data', 'Process_Transactions', 'Aggregate_Summary', 'Validate_Input',
+               'Export_Report', 'Refresh_Cache', 'Transform_Records', 'Archive_Files']
+
+
+def _attrs(**attributes) -> str:
+    return ' '.join(f'{name}={quoteattr(str(value))}' for name, value in attributes.items())
+
+
+def _job_lines(rng, folder_name, application, sub_application, service, job_index,
+               previous_job, variables, quantitatives, on_blocks):
+    """Returns (jobname, lines) for one JOB element."""
+    job_type = rng.choice(JOB_TYPES)
+    action = rng.choice(JOB_ACTIONS)
+    jobname = f"{folder_name}-{job_type}-{action}_{job_index:04d}"
+    host = 'lnxdevdb' if job_type in ('DW', 'ADB') else 'lnxdevapp'
+    run_as = f"svc_acct_{service}_{job_type.lower()}_dev"
+
+    lines = [f'        <JOB {_attrs(APPLICATION=application, SUB_APPLICATION=sub_application, JOBNAME=jobname, DESCRIPTION=f"{action} (Dev)", RUN_AS=run_as, TASKTYPE="Job", NODEID=f"{host}{rng.randint(1, 9):02d}", CRITICAL="0")}>']
+    for var_index in range(variables):
+        lines.append(f'            <VARIABLE {_attrs(NAME=f"%%PARAM_{var_index}", VALUE=f"/opt/dev/{service}/param_{var_index}")}/>')
+    lines.append(f'            <VARIABLE {_attrs(NAME="%%user", VALUE=run_as)} />')
+    if previous_job is not None:
+        lines.append(f'            <INCOND {_attrs(NAME=f"{previous_job}-OK", ODATE="ODAT", AND_OR="A")}/>')
+    lines.append(f'            <QUANTITATIVE {_attrs(NAME="CONTROLM-RESOURCE", QUANT="1", ONOK="R", ONFAIL="R")}/>')
+    if job_type in DEV_RESOURCES:
+        lines.append(f'            <QUANTITATIVE {_attrs(NAME=DEV_RESOURCES[job_type], QUANT=str(rng.randint(1, 5)), ONOK="R", ONFAIL="R")}/>')
+    for quant_index in range(max(0, quantitatives - 2)):
+        lines.append(f'            <QUANTITATIVE {_attrs(NAME=f"{service.upper()}-POOL-{quant_index}", QUANT="1", ONOK="R", ONFAIL="R")}/>')
+    if previous_job is not None:
+        lines.append(f'            <OUTCOND {_attrs(NAME=f"{previous_job}-OK", ODATE="ODAT", SIGN="-")}/>')
+    lines.append(f'            <OUTCOND {_attrs(NAME=f"{jobname}-OK", ODATE="ODAT", SIGN="+")}/>')
+    for on_index in range(on_blocks):
+        code = 'NOTOK' if on_index % 2 == 0 else 'ENDEDOK'
+        status = 'FAILED' if code == 'NOTOK' else 'OK'
+        lines.append(f'            <ON {_attrs(STMT="*", CODE=code)}>')
+        lines.append(f'                 <DOMAIL {_attrs(URGENCY="R", DEST="dev-alerts@example.com", SUBJECT=f"DEV {status} Job: %%JOBNAME", MESSAGE=f"Job %%JOBNAME {status}.")}/>')
+        lines.append('            </ON>')
+    lines.append('        </JOB>')
+    return jobname, lines
+
+
+def generate_deftable(output_path: str, folders: int, jobs_per_folder: int, on_blocks: int = 2,
+                      quantitatives: int = 2, variables: int = 2, seed: int = 0) -> dict:
+    """
+    Writes a synthetic dev DEFTABLE to output_path.
+
+    Args:
+        folders: Number of top-level FOLDER elements.
+        jobs_per_folder: JOB elements per folder.
+        on_blocks: ON blocks (each with a DOMAIL) per job.
+        quantitatives: QUANTITATIVE resources per job (at least CONTROLM-RESOURCE
+            plus the job type's dev resource).
+        variables: VARIABLE elements per job, in addition to %%user.
+        seed: Seed for the random choices, so runs are reproducible.
+
+    Returns a dict with the number of folders and jobs written.
+    """
+    rng = random.Random(seed)
+    with open(output_path, 'w', encoding='utf-8') as out:
+        out.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        out.write('<DEFTABLE xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:noNamespaceSchemaLocation="Folder.xsd">\n')
+        for folder_index in range(folders):
+            unit, area, service = BUSINESS_UNITS[folder_index % len(BUSINESS_UNITS)]
+            process = PROCESS_TYPES[folder_index % len(PROCESS_TYPES)]
+            application = f"{unit}-DEV-{area}"
+            sub_application = f"{application}-{process}"
+            folder_name = f"{sub_application}-PROJCODE-{folder_index + 1:05d}"
+            order_method = 'SYSTEM' if rng.random() < 0.7 else 'MANUAL'
+            out.write(f'\n    <FOLDER {_attrs(DATACENTER=f"dev_dc_{rng.randint(1, 3)}", VERSION="920", PLATFORM="UNIX", FOLDER_NAME=folder_name, FOLDER_ORDER_METHOD=order_method, TYPE="1")}>\n')
+            previous_job = None
+            for job_index in range(jobs_per_folder):
+                previous_job, lines = _job_lines(rng, folder_name, application, sub_application, service,
+                                                 job_index + 1, previous_job, variables, quantitatives, on_blocks)
+                out.write('\n'.join(lines))
+                out.write('\n')
+            out.write('    </FOLDER>\n')
+        out.write('</DEFTABLE>\n')
+    return {'folders': folders, 'jobs': folders * jobs_per_folder}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Control-M DEFTABLE export.")
+    parser.add_argument("--output", required=True, help="Path for the generated XML file.")
+    parser.add_argument("--folders", type=int, default=10, help="Number of folders (default: 10).")
+    parser.add_argument("--jobs-per-folder", type=int, default=100, help="Jobs per folder (default: 100).")
+    parser.add_argument("--on-blocks", type=int, default=2, help="ON blocks per job (default: 2).")
+    parser.add_argument("--quantitatives", type=int, default=2, help="QUANTITATIVE resources per job (default: 2).")
+    parser.add_argument("--variables", type=int, default=2, help="VARIABLEs per job besides %%user (default: 2).")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0).")
+    args = parser.parse_args()
+    stats = generate_deftable(args.output, args.folders, args.jobs_per_folder, on_blocks=args.on_blocks,
+                              quantitatives=args.quantitatives, variables=args.variables, seed=args.seed)
+    print(f"Wrote {stats['jobs']} jobs in {stats['folders']} folders to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,8 +11,14 @@ setup(
     install_requires=[
         # Only pytest is required for testing, not for runtime
     ],
+    extras_require={
+        # Optional faster XML backend; ElementTree is used when it is missing
+        "lxml": ["lxml"],
+    },
     python_requires=">=3.7",
     include_package_data=True,
+    # The rules used without --config
+    package_data={"": ["default_rules.json"]},
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,184 @@
+import glob
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+from src.condition_check import ConditionIndex, collecting, find_condition_problems, log_condition_problems
+from src.modify_controlm_xml import transform_file
+from src.step_engine import compile_step_visitors
+from src.xml_modifiers import load_rules_config
+from src import compression, xml_backend
+
+
+def collect_input_files(input_dir: str, pattern: str = '*.xml') -> List[str]:
+    """
+    Returns the files under input_dir matching the glob pattern, sorted.
+    The pattern is relative to input_dir and may use '**' to recurse.
+    """
+    matches = glob.glob(os.path.join(input_dir, pattern), recursive=True)
+    return sorted(path for path in matches if os.path.isfile(path))
+
+
+def _output_path_for(input_path: str, input_dir: str, output_dir: str) -> str:
+    """Maps an input file to the same relative path under output_dir."""
+    return os.path.join(output_dir, os.path.relpath(input_path, input_dir))
+
+
+def _init_worker(target_env: str, steps: List[str], backend: str, config_path: Optional[str] = None,
+                 compress_level: Optional[int] = None) -> None:
+    """
+    Runs once in each worker process. The default rules are loaded on
+    first use; a --config rules file is loaded here. Compiling the steps
+    also compiles the promotion patterns, which the re module then caches
+    for every file the worker handles.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    xml_backend.set_backend(backend)
+    compression.set_level(compress_level)
+    try:
+        if config_path:
+            load_rules_config(config_path)
+        compile_step_visitors(steps, target_env)
+    except Exception:
+        # Configuration errors are reported per file by transform_file
+        pass
+
+
+def worker_initargs(target_env: str, steps: List[str], config_path: Optional[str] = None) -> tuple:
+    """The initargs of _init_worker() for a pool of batch workers: the parent's backend and compression level."""
+    return (target_env, steps, xml_backend.get_backend(), config_path, compression.get_level())
+
+
+def _process_file(input_path: str, output_path: str, target_env: str, steps: List[str],
+                  sequential: bool, stream: bool, compact: bool = False) -> dict:
+    """
+    Transforms one file. Never raises, so one bad file cannot abort the others.
+    With a validate step, the file's conditions are returned under 'conditions'
+    so run_batch() can check them against the other files.
+    """
+    conditions = ConditionIndex(source=input_path) if 'validate' in steps else None
+    try:
+        with collecting(conditions):
+            ok = transform_file(input_path, output_path, target_env, steps, sequential=sequential, stream=stream,
+                                compact=compact)
+        error = None if ok else "transform failed (see log)"
+    except Exception as e:
+        ok = False
+        error = str(e)
+    result = {'input': input_path, 'output': output_path, 'ok': ok, 'error': error}
+    if conditions is not None:
+        result['conditions'] = conditions
+    return result
+
+
+def run_batch(input_files: List[str], input_dir: str, output_dir: str, target_env: str, steps: List[str],
+              jobs: Optional[int] = None, sequential: bool = False, stream: bool = False,
+              config_path: Optional[str] = None, compact: bool = False, pipeline: bool = False,
+              queue_depth: Optional[int] = None) -> dict:
+    """
+    Transforms input_files in a process pool and writes each result to the
+    same relative path under output_dir. config_path is the rules file the
+    caller has loaded, if not the default; workers load it too.
+
+    With pipeline, files are read and written in I/O threads while others
+    are transformed, with at most queue_depth files waiting between two
+    stages (see run_pipeline()); the per-stage stats are added to the
+    summary as 'pipeline'. stream is ignored then, since the pipeline hands
+    whole documents from stage to stage. Raises ValueError if jobs is less
+    than 1.
+
+    Returns a summary dict with 'succeeded' and 'failed' lists of per-file
+    results ({'input', 'output', 'ok', 'error'}). With a validate step, the
+    conditions of all succeeded files are checked together and the findings
+    are added as 'validation' (see find_condition_problems()).
+    """
+    if jobs is not None and jobs < 1:
+        raise ValueError(f"jobs must be at least 1, got {jobs}")
+    tasks = [(path, _output_path_for(path, input_dir, output_dir)) for path in input_files]
+    results = []
+    pipeline_stats = None
+    if pipeline:
+        from src.batch_pipeline import run_pipeline
+        if stream:
+            logging.warning("The pipeline hands whole documents between stages; --stream ignored.")
+        results, pipeline_stats = run_pipeline(tasks, target_env, steps, jobs=jobs, sequential=sequential,
+                                               config_path=config_path, compact=compact, queue_depth=queue_depth)
+    elif jobs == 1 or len(tasks) <= 1:
+        for input_path, output_path in tasks:
+            results.append(_process_file(input_path, output_path, target_env, steps, sequential, stream, compact))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=worker_initargs(target_env, steps, config_path)) as executor:
+            futures = [
+                executor.submit(_process_file, input_path, output_path, target_env, steps, sequential, stream, compact)
+                for input_path, output_path in tasks
+            ]
+            for (input_path, output_path), future in zip(tasks, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # The worker itself died (e.g. killed or out of memory)
+                    results.append({'input': input_path, 'output': output_path, 'ok': False, 'error': str(e)})
+
+    summary = {
+        'succeeded': [r for r in results if r['ok']],
+        'failed': [r for r in results if not r['ok']],
+    }
+    if pipeline_stats is not None:
+        summary['pipeline'] = pipeline_stats
+    if 'validate' in steps:
+        merged = ConditionIndex()
+        for result in summary['succeeded']:
+            merged.merge(result.pop('conditions'))
+        summary['validation'] = find_condition_problems(merged)
+    return summary
+
+
+def log_pipeline_stats(stats: dict) -> None:
+    """Logs the utilization of each pipeline stage (see run_pipeline()), to show which one the others wait for."""
+    logging.info(f"Pipeline: {stats['wall_time']:.2f}s, queue depth {stats['queue_depth']}")
+    for name, stage in stats['stages'].items():
+        logging.info(f"  {name:<9} {stage['workers']} workers, {100 * stage['utilization']:.0f}% busy, "
+                     f"starved {stage['starved_time']:.2f}s, blocked {stage['blocked_time']:.2f}s "
+                     f"({stage['files']} files)")
+
+
+def main_batch(input_dir, output_dir, target_env, steps, pattern='*.xml', jobs=None,
+               sequential=False, stream=False, config_path=None, compact=False, pipeline=False, queue_depth=None):
+    """
+    Batch counterpart of main(): transforms every file in input_dir matching
+    pattern, logs one aggregated summary and exits non-zero if any file failed
+    or the condition check of a validate step failed.
+    With pipeline, also logs how busy each stage of the pipeline was.
+    """
+    logging.info(f"--- Starting Control-M XML Batch Modification ---")
+    logging.info(f"Input directory: {input_dir} (pattern: {pattern})")
+    logging.info(f"Output directory: {output_dir}")
+    logging.info(f"Target Environment: {target_env}")
+    logging.info(f"Steps to apply: {', '.join(steps)}")
+
+    if not os.path.isdir(input_dir):
+        logging.error(f"Input directory not found at {input_dir}")
+        sys.exit(1)
+
+    input_files = collect_input_files(input_dir, pattern)
+    if not input_files:
+        logging.warning(f"No files matching '{pattern}' found in {input_dir}.")
+        return
+
+    logging.info(f"Processing {len(input_files)} files with {jobs or os.cpu_count()} workers...")
+    summary = run_batch(input_files, input_dir, output_dir, target_env, steps,
+                        jobs=jobs, sequential=sequential, stream=stream, config_path=config_path, compact=compact,
+                        pipeline=pipeline, queue_depth=queue_depth)
+
+    logging.info("--- Batch Modification Finished ---")
+    logging.info(f"Succeeded: {len(summary['succeeded'])}, Failed: {len(summary['failed'])}")
+    for result in summary['failed']:
+        logging.error(f"  FAILED {result['input']}: {result['error']}")
+    if 'pipeline' in summary:
+        log_pipeline_stats(summary['pipeline'])
+    # A failed condition check fails the run, as in main()
+    validation_passed = 'validation' not in summary or log_condition_problems(summary['validation'])
+    if summary['failed'] or not validation_passed:
+        sys.exit(1)
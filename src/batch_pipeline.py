@@ -0,0 +1,221 @@
+import asyncio
+import io
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from src.batch import _init_worker, worker_initargs
+from src.compression import decompression_errors, open_input
+from src.condition_check import ConditionIndex, collecting
+from src.errors import ControlMXmlError
+from src.modify_controlm_xml import write_xml_bytes
+from src.step_engine import apply_steps
+from src import xml_backend
+
+# Files each queue between two stages holds by default; with the files
+# being read, transformed and written, it bounds how many are in memory
+PIPELINE_QUEUE_DEPTH = 4
+# Threads reading and writing files. Several requests in flight hide the
+# latency of network storage; local disks are not slowed down by them
+PIPELINE_IO_THREADS = 4
+
+
+class StageStats:
+    """
+    Where the time of one pipeline stage went: busy working on a file,
+    starved waiting for input from the stage before, or blocked waiting
+    for room in the queue to the stage after. Times are summed over the
+    stage's workers.
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.files = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+
+    def as_dict(self, wall_time: float) -> Dict:
+        return {
+            'workers': self.workers,
+            'files': self.files,
+            'busy_time': self.busy,
+            'starved_time': self.starved,
+            'blocked_time': self.blocked,
+            # Share of the workers' time spent working
+            'utilization': self.busy / (wall_time * self.workers) if wall_time else 0.0,
+        }
+
+
+def _read_file(input_path: str) -> bytes:
+    """Read stage: the input file's bytes, decompressed if it is compressed (see open_input())."""
+    with open_input(input_path) as f:
+        return f.read()
+
+
+def _transform_document(input_path: str, data: bytes, target_env: str, steps: List[str], sequential: bool,
+                        compact: bool) -> Tuple[Optional[bytes], Dict]:
+    """
+    Transform stage, run in the CPU executor: parses the input file's bytes,
+    applies the steps and serializes the result as transform_file() would
+    write it. Returns (serialized document or None, result). Never raises,
+    so one bad file cannot abort the others. With a validate step, the
+    file's conditions are returned in the result under 'conditions'.
+    """
+    conditions = ConditionIndex(source=input_path) if 'validate' in steps else None
+    result = {'input': input_path, 'ok': False, 'error': None}
+    if conditions is not None:
+        result['conditions'] = conditions
+    try:
+        source = io.BytesIO(data)
+        tree = xml_backend.parse_compact(source) if compact else xml_backend.parse(source)
+    except xml_backend.parse_errors() as e:
+        logging.error(f"Failed to parse XML file {input_path}. Details: {e}")
+        result['error'] = f"parse error: {e}"
+        return None, result
+    try:
+        with collecting(conditions):
+            steps_applied, steps_failed = apply_steps(tree.getroot(), steps, target_env, sequential=sequential)
+    except ControlMXmlError as e:
+        logging.error(f"Error during [{e.step}] step: {e}")
+        result['error'] = str(e)
+        return None, result
+    except Exception as e:
+        result['error'] = str(e)
+        return None, result
+    if steps_failed or not steps_applied:
+        result['error'] = "transform failed (see log)"
+        return None, result
+    result['ok'] = True
+    return xml_backend.serialize(tree), result
+
+
+async def _pipeline(tasks, transform_args: tuple, cpu_executor, cpu_workers: int, io_executor, queue_depth: int,
+                    stats: Dict[str, StageStats]) -> List[Dict]:
+    """
+    Runs the read, transform and write stages concurrently over tasks, a
+    list of (input_path, output_path), with a bounded queue between each
+    two stages. transform_args are the arguments of _transform_document()
+    after the file's path and bytes. Returns one result per task, in order.
+    """
+    loop = asyncio.get_running_loop()
+    read_queue = asyncio.Queue(maxsize=queue_depth)
+    write_queue = asyncio.Queue(maxsize=queue_depth)
+    results = [None] * len(tasks)
+    # Shared by the readers, so each file is read once
+    pending = iter(enumerate(tasks))
+
+    async def run(stage: StageStats, executor, func, *args):
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, func, *args)
+        finally:
+            stage.busy += time.perf_counter() - start
+            stage.files += 1
+
+    async def put(stage: StageStats, queue, item):
+        start = time.perf_counter()
+        await queue.put(item)
+        stage.blocked += time.perf_counter() - start
+
+    async def get(stage: StageStats, queue):
+        start = time.perf_counter()
+        item = await queue.get()
+        stage.starved += time.perf_counter() - start
+        return item
+
+    async def read():
+        for index, (input_path, output_path) in pending:
+            try:
+                data = await run(stats['read'], io_executor, _read_file, input_path)
+            except (OSError,) + decompression_errors() as e:
+                logging.error(f"Could not read input file {input_path}. Details: {e}")
+                results[index] = {'input': input_path, 'output': output_path, 'ok': False, 'error': str(e)}
+                continue
+            await put(stats['read'], read_queue, (index, data))
+
+    async def transform_files():
+        while True:
+            item = await get(stats['transform'], read_queue)
+            if item is None:
+                return
+            index, data = item
+            input_path, output_path = tasks[index]
+            try:
+                serialized, result = await run(stats['transform'], cpu_executor, _transform_document,
+                                               input_path, data, *transform_args)
+            except Exception as e:
+                # The worker itself died (e.g. killed or out of memory)
+                serialized, result = None, {'input': input_path, 'ok': False, 'error': str(e)}
+            # Only the serialized result is kept while waiting for room downstream
+            item = data = None
+            result['output'] = output_path
+            results[index] = result
+            if serialized is not None:
+                await put(stats['transform'], write_queue, (index, serialized))
+
+    async def write():
+        while True:
+            item = await get(stats['write'], write_queue)
+            if item is None:
+                return
+            index, serialized = item
+            if not await run(stats['write'], io_executor, write_xml_bytes, serialized, tasks[index][1]):
+                results[index].update(ok=False, error="write failed (see log)")
+
+    async def then_close(workers, queue, consumers: int):
+        # Once a stage is done, each worker of the next one gets None to stop
+        await asyncio.gather(*workers)
+        for _ in range(consumers):
+            await queue.put(None)
+
+    io_workers = stats['read'].workers
+    await asyncio.gather(
+        then_close([read() for _ in range(io_workers)], read_queue, cpu_workers),
+        then_close([transform_files() for _ in range(cpu_workers)], write_queue, io_workers),
+        *[write() for _ in range(io_workers)],
+    )
+    return results
+
+
+def run_pipeline(tasks: List[Tuple[str, str]], target_env: str, steps: List[str], jobs: Optional[int] = None,
+                 sequential: bool = False, config_path: Optional[str] = None, compact: bool = False,
+                 queue_depth: Optional[int] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Transforms tasks, a list of (input_path, output_path), in a pipeline
+    that overlaps reading, transforming and writing: while some files are
+    read from or written to slow (e.g. network) storage in I/O threads,
+    others are transformed in jobs worker processes (a thread when jobs is
+    1). The outputs are the same as transform_file()'s.
+
+    Each queue between two stages holds at most queue_depth files (default
+    PIPELINE_QUEUE_DEPTH), so a stage that falls behind stops the one before
+    it and memory stays bounded by the depths plus the files in flight.
+
+    Returns (per-file results as run_batch() collects them, pipeline stats):
+    the stats give the wall time and, per stage, its workers, busy, starved
+    and blocked time and utilization (see StageStats). Raises ValueError if
+    jobs is less than 1.
+    """
+    if jobs is not None and jobs < 1:
+        raise ValueError(f"jobs must be at least 1, got {jobs}")
+    cpu_workers = jobs or os.cpu_count() or 1
+    queue_depth = queue_depth or PIPELINE_QUEUE_DEPTH
+    stats = {'read': StageStats('read', PIPELINE_IO_THREADS),
+             'transform': StageStats('transform', cpu_workers),
+             'write': StageStats('write', PIPELINE_IO_THREADS)}
+
+    if cpu_workers == 1:
+        cpu_executor = ThreadPoolExecutor(max_workers=1)
+    else:
+        cpu_executor = ProcessPoolExecutor(max_workers=cpu_workers, initializer=_init_worker,
+                                           initargs=worker_initargs(target_env, steps, config_path))
+    start = time.perf_counter()
+    with cpu_executor, ThreadPoolExecutor(max_workers=PIPELINE_IO_THREADS) as io_executor:
+        results = asyncio.run(_pipeline(tasks, (target_env, steps, sequential, compact), cpu_executor, cpu_workers,
+                                        io_executor, queue_depth, stats))
+    wall_time = time.perf_counter() - start
+    return results, {'wall_time': wall_time, 'queue_depth': queue_depth,
+                     'stages': {name: stage.as_dict(wall_time) for name, stage in stats.items()}}
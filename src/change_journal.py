@@ -0,0 +1,215 @@
+import xml.etree.ElementTree as ET
+import json
+import logging
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Journal that the mutation helpers below record into, if any
+_ACTIVE_JOURNAL = None
+# Set while the mutation helpers leave the tree unchanged (see dry_run())
+_DRY_RUN = False
+
+
+class ChangeJournal:
+    """
+    Records every change the modifiers make to a tree, so the tree can be
+    modified in place and still be restored if a step fails.
+
+    Entries are kept in the order they happen:
+      ('set', element, attribute, old_value, new_value)  old_value None = absent
+      ('insert', parent, child, index)
+      ('remove', parent, child, index)
+    """
+
+    def __init__(self):
+        self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def record_set(self, element: ET.Element, attribute: str, old_value: Optional[str], new_value: str) -> None:
+        self.entries.append(('set', element, attribute, old_value, new_value))
+
+    def record_insert(self, parent: ET.Element, child: ET.Element, index: int) -> None:
+        self.entries.append(('insert', parent, child, index))
+
+    def record_remove(self, parent: ET.Element, child: ET.Element, index: int) -> None:
+        self.entries.append(('remove', parent, child, index))
+
+    def rollback(self) -> None:
+        """Undoes every recorded change, newest first, and empties the journal."""
+        logging.info(f"Rolling back {len(self.entries)} recorded changes...")
+        for entry in reversed(self.entries):
+            action = entry[0]
+            if action == 'set':
+                _, element, attribute, old_value, _ = entry
+                if old_value is None:
+                    element.attrib.pop(attribute, None)
+                else:
+                    element.set(attribute, old_value)
+            elif action == 'insert':
+                _, parent, child, _ = entry
+                parent.remove(child)
+            elif action == 'remove':
+                _, parent, child, index = entry
+                parent.insert(index, child)
+        self.entries = []
+
+    def to_records(self, root: ET.Element) -> List[Dict]:
+        """
+        Returns the journal as JSON-serializable dicts. Elements are located
+        by an XPath-like path (e.g. /DEFTABLE/FOLDER[2]/JOB[1]) in the tree
+        under root as it is now; elements no longer in the tree get None.
+        """
+        paths = _element_paths(root)
+        records = []
+        for entry in self.entries:
+            action = entry[0]
+            if action == 'set':
+                _, element, attribute, old_value, new_value = entry
+                records.append({
+                    'action': 'set', 'path': paths.get(element), 'tag': element.tag,
+                    'attribute': attribute, 'old': old_value, 'new': new_value
+                })
+            else:
+                _, parent, child, index = entry
+                records.append({
+                    'action': action, 'path': paths.get(parent), 'tag': child.tag,
+                    'index': index, 'attributes': dict(child.attrib)
+                })
+        return records
+
+    def write_json(self, root: ET.Element, output_path: str) -> bool:
+        """Writes the change log to output_path as JSON."""
+        try:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_records(root), f, indent=2)
+            logging.info(f"Wrote change log with {len(self.entries)} entries to: {output_path}")
+            return True
+        except IOError as e:
+            logging.error(f"Could not write change log {output_path}. Details: {e}")
+            return False
+
+
+def _element_paths(root: ET.Element) -> Dict[ET.Element, str]:
+    """Maps every element under root to its XPath-like location."""
+    paths = {root: '/' + root.tag}
+    stack = [root]
+    while stack:
+        parent = stack.pop()
+        base = paths[parent]
+        tag_counts = {}
+        for child in parent:
+            position = tag_counts.get(child.tag, 0) + 1
+            tag_counts[child.tag] = position
+            paths[child] = f"{base}/{child.tag}[{position}]"
+            stack.append(child)
+    return paths
+
+
+@contextmanager
+def recording(journal: Optional[ChangeJournal]):
+    """Makes journal the target of the mutation helpers for the duration of the block."""
+    global _ACTIVE_JOURNAL
+    previous = _ACTIVE_JOURNAL
+    _ACTIVE_JOURNAL = journal
+    try:
+        yield journal
+    finally:
+        _ACTIVE_JOURNAL = previous
+
+
+@contextmanager
+def dry_run():
+    """
+    Makes the mutation helpers below change nothing, and record nothing, for
+    the duration of the block. The modifiers still decide and count every
+    change as usual, so a run in this mode reports what it would change.
+    """
+    global _DRY_RUN
+    previous = _DRY_RUN
+    _DRY_RUN = True
+    try:
+        yield
+    finally:
+        _DRY_RUN = previous
+
+
+def in_dry_run() -> bool:
+    """True inside dry_run(), where a modifier can skip building what the mutation helpers would discard."""
+    return _DRY_RUN
+
+
+# --- Mutation helpers used by the modifiers ---
+
+def set_attribute(element: ET.Element, attribute: str, value: str) -> None:
+    """element.set() that records the previous value in the active journal."""
+    if _DRY_RUN:
+        return
+    if _ACTIVE_JOURNAL is not None:
+        _ACTIVE_JOURNAL.record_set(element, attribute, element.get(attribute), value)
+    element.set(attribute, value)
+
+def insert_child(parent: ET.Element, index: int, child: ET.Element) -> None:
+    """parent.insert() that records the insertion in the active journal."""
+    if _DRY_RUN:
+        return
+    parent.insert(index, child)
+    if _ACTIVE_JOURNAL is not None:
+        _ACTIVE_JOURNAL.record_insert(parent, child, min(index, len(parent) - 1))
+
+def insert_children(parent: ET.Element, index: int, children: List[ET.Element]) -> None:
+    """
+    Inserts children, in order, at index. Records the same entries as
+    calling insert_child() at index, index + 1, ...
+
+    Plain insert() is used rather than one slice assignment: it is a pointer
+    move on ElementTree, while lxml walks the whole child list on a slice.
+    """
+    if _DRY_RUN:
+        return
+    index = min(index, len(parent))
+    for offset, child in enumerate(children):
+        parent.insert(index + offset, child)
+    if _ACTIVE_JOURNAL is not None:
+        for offset, child in enumerate(children):
+            _ACTIVE_JOURNAL.record_insert(parent, child, index + offset)
+
+def append_child(parent: ET.Element, child: ET.Element) -> None:
+    """parent.append() that records the insertion in the active journal."""
+    if _DRY_RUN:
+        return
+    parent.append(child)
+    if _ACTIVE_JOURNAL is not None:
+        _ACTIVE_JOURNAL.record_insert(parent, child, len(parent) - 1)
+
+def remove_child(parent: ET.Element, child: ET.Element) -> None:
+    """parent.remove() that records the removed child and its position in the active journal."""
+    if _DRY_RUN:
+        return
+    if _ACTIVE_JOURNAL is not None:
+        _ACTIVE_JOURNAL.record_remove(parent, child, list(parent).index(child))
+    parent.remove(child)
+
+def remove_children(parent: ET.Element, tag: str) -> int:
+    """
+    Removes every child of parent with the given tag in a single scan and
+    one rebuild of the child list, instead of one remove() (itself a scan)
+    per child. Records the same entries as calling remove_child() on each
+    in document order. Returns the number of children removed.
+    """
+    if _DRY_RUN:
+        return sum(1 for child in parent if child.tag == tag)
+    kept = []
+    removed = 0
+    for index, child in enumerate(parent):
+        if child.tag == tag:
+            if _ACTIVE_JOURNAL is not None:
+                # Position at the time of removal, after the earlier ones are gone
+                _ACTIVE_JOURNAL.record_remove(parent, child, index - removed)
+            removed += 1
+        else:
+            kept.append(child)
+    if removed:
+        parent[:] = kept
+    return removed
@@ -0,0 +1,90 @@
+import json
+import logging
+from typing import List
+
+
+class ChangeCounter:
+    """
+    Minimal stand-in for a change journal that only counts the changes
+    recorded while it is active. Used in streaming mode to tell whether
+    the folder just processed was modified.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def record_set(self, element, attribute, old_value, new_value) -> None:
+        self.count += 1
+
+    def record_insert(self, parent, child, index) -> None:
+        self.count += 1
+
+    def record_remove(self, parent, child, index) -> None:
+        self.count += 1
+
+
+def _changes_per_top_level(root, journal) -> List[int]:
+    """
+    Returns, for each direct child of root, how many journal entries
+    changed it or one of its descendants.
+    """
+    touched = {}
+    for entry in journal.entries:
+        # 'set' entries change the element itself; insert/remove change the parent
+        element = entry[1]
+        touched[element] = touched.get(element, 0) + 1
+    if not touched:
+        return [0] * len(root)
+    return [sum(touched.get(element, 0) for element in top.iter()) for top in root]
+
+
+class ChangeSet:
+    """The top-level folders a run modified, for --changed-only output and its summary."""
+
+    def __init__(self):
+        self.changed = []
+        self.total = 0
+
+    def add(self, index: int, element, source_name, changes: int) -> None:
+        self.changed.append({
+            'index': index,
+            'tag': element.tag,
+            'name': element.get('FOLDER_NAME'),
+            'source_name': source_name,
+            'changes': changes,
+        })
+
+    def drop_unchanged(self, root, journal, source_names: List) -> None:
+        """
+        Removes every direct child of root that the journal shows unchanged,
+        so only the modified folders are written, and records the others.
+        """
+        counts = _changes_per_top_level(root, journal)
+        self.total = len(counts)
+        for index, (top, changes) in enumerate(zip(list(root), counts)):
+            if changes:
+                self.add(index, top, source_names[index], changes)
+            else:
+                root.remove(top)
+
+    def write_summary(self, summary_path: str, **context) -> bool:
+        """Logs the changed folders and writes them, with the run context, to summary_path as JSON."""
+        logging.info(f"{len(self.changed)} of {self.total} top-level folders changed.")
+        for entry in self.changed:
+            logging.info(f"  Changed: {entry['name']} ({entry['changes']} changes)")
+        summary = {**context, 'total_folders': self.total, 'changed_count': len(self.changed),
+                   'changed_folders': self.changed}
+        try:
+            with open(summary_path, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+            logging.info(f"Wrote change-set summary to: {summary_path}")
+            return True
+        except IOError as e:
+            logging.error(f"Could not write change-set summary {summary_path}. Details: {e}")
+            return False
+
+
+def summary_path_for(output_path: str) -> str:
+    """Path of the change-set summary written next to output_path."""
+    base = output_path[:-4] if output_path.lower().endswith('.xml') else output_path
+    return base + '.summary.json'
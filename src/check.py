@@ -0,0 +1,131 @@
+import xml.etree.ElementTree as ET
+import json
+import os
+import logging
+from typing import Dict, List, Optional
+from src.change_journal import dry_run
+from src.compression import decompression_errors, input_source
+from src.step_engine import compile_step_visitors, apply_visitors_to_children, finish_visitors
+
+
+class CheckReport:
+    """The changes applying the steps to one file would make, per step and per top-level folder (see check_file())."""
+
+    def __init__(self, input_path: str, target_env: str, steps: List[str]):
+        self.input_path = input_path
+        self.target_env = target_env
+        # Steps skipped for target_env stay at 0
+        self.steps = {step: 0 for step in steps}
+        self.folders = []
+        self.total_folders = 0
+        # Set by run_check() when a validate step among the steps fails
+        self.condition_check_failed = False
+
+    @property
+    def pending(self) -> int:
+        """Total number of changes pending."""
+        return sum(self.steps.values())
+
+    def add(self, index: int, element, changes: Dict[str, int]) -> None:
+        """Records the changes pending in a top-level element, by step."""
+        self.total_folders += 1
+        for step, count in changes.items():
+            self.steps[step] += count
+        if any(changes.values()):
+            self.folders.append({
+                'index': index,
+                'tag': element.tag,
+                'name': element.get('FOLDER_NAME'),
+                'changes': changes,
+            })
+
+    def as_dict(self) -> Dict:
+        return {
+            'input': self.input_path,
+            'target_env': self.target_env,
+            'pending_changes': self.pending,
+            'steps': self.steps,
+            'total_folders': self.total_folders,
+            'changed_count': len(self.folders),
+            'changed_folders': self.folders,
+            'condition_check_failed': self.condition_check_failed,
+        }
+
+    def log(self) -> None:
+        """Logs the pending changes per step and per folder."""
+        for step, count in self.steps.items():
+            logging.info(f"Step [{step}] would make {count} changes.")
+        for entry in self.folders:
+            per_step = ', '.join(f"{step}: {count}" for step, count in entry['changes'].items() if count)
+            logging.info(f"  Pending: {entry['name']} ({per_step})")
+        if self.pending:
+            logging.warning(f"{self.pending} changes pending in {len(self.folders)} of {self.total_folders} "
+                            f"top-level folders of {self.input_path}.")
+        else:
+            logging.info(f"No changes pending in {self.input_path} for '{self.target_env}'.")
+        if self.condition_check_failed:
+            logging.warning(f"Condition check failed for {self.input_path} (see above).")
+
+    def write_json(self, report_path: str) -> bool:
+        """Writes the report to report_path as JSON."""
+        try:
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(self.as_dict(), f, indent=2)
+            logging.info(f"Wrote check report to: {report_path}")
+            return True
+        except IOError as e:
+            logging.error(f"Could not write check report {report_path}. Details: {e}")
+            return False
+
+
+def check_file(input_path: str, target_env: str, steps: List[str]) -> Optional[CheckReport]:
+    """
+    Works out what applying steps to a Control-M XML file would change,
+    without changing, copying or writing anything.
+
+    The file is read one top-level FOLDER at a time with iterparse, as in
+    streaming mode, and the compiled steps run on each folder under
+    dry_run(): every modifier decides and counts its changes as usual while
+    the tree is left as read, and the folder is released once checked.
+    Nothing is cloned either: the notification templates are not copied.
+
+    Each step therefore sees the folder as read rather than as the earlier
+    steps left it, so where a step's changes depend on an earlier step's
+    the counts can differ from a real run: resources, for example, picks
+    the resources a job needs from its JOBNAME as read, before promote
+    renamed it, and inserts them before the ON blocks notifications has not
+    replaced. Whether a folder has pending changes is exact, since the
+    first step that changes it in a real run sees it as read there too; the
+    counts per step are estimates.
+
+    Raises ControlMXmlError if a step fails. Returns None on parse errors.
+    """
+    if not os.path.exists(input_path):
+        logging.error(f"Input XML file not found at {input_path}")
+        return None
+
+    visitors = compile_step_visitors(steps, target_env)
+    report = CheckReport(input_path, target_env, steps)
+    try:
+        with dry_run(), input_source(input_path) as source:
+            root = None
+            depth = 0
+            for event, element in ET.iterparse(source, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if depth == 1:
+                        root = element
+                    continue
+                if depth == 2:
+                    before = [visitor.changes for visitor in visitors]
+                    apply_visitors_to_children([element], visitors)
+                    report.add(report.total_folders, element,
+                               {visitor.step: visitor.changes - count for visitor, count in zip(visitors, before)})
+                    root.remove(element)
+                    element.clear()
+                depth -= 1
+    except (ET.ParseError, OSError) + decompression_errors() as e:
+        logging.error(f"Failed to parse XML file {input_path}. Details: {e}")
+        return None
+    finish_visitors(visitors)
+    return report
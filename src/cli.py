@@ -1,9 +1,52 @@
 import argparse
-from modify_controlm_xml import main
+import os
+import sys
+from typing import Optional
 
-def parse_args():
+# Allow running as `python src/cli.py` from the repository root
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Only what a call answered by the daemon needs is imported up front
+from src.daemon_client import daemon_address, send_request
+from src import compression, xml_backend
+
+# Options that only apply to a single target, by their name in parsed arguments and daemon requests
+SINGLE_TARGET_OPTIONS = {'stream': '--stream', 'change_log': '--change-log', 'metrics_json': '--metrics-json',
+                         'cache_dir': '--cache-dir', 'changed_only': '--changed-only',
+                         'parallel_folders': '--parallel-folders', 'check': '--check'}
+
+def _terminal_columns() -> int:
+    """The terminal width as shutil.get_terminal_size() gives it: $COLUMNS, else stdout's terminal, else 80."""
+    try:
+        columns = int(os.environ['COLUMNS'])
+    except (KeyError, ValueError):
+        columns = 0
+    if columns <= 0:
+        try:
+            columns = os.get_terminal_size(sys.__stdout__.fileno()).columns
+        except (AttributeError, ValueError, OSError):
+            columns = 0
+    return columns or 80
+
+class _HelpFormatter(argparse.RawDescriptionHelpFormatter):
+    """
+    argparse's RawDescriptionHelpFormatter with the width argparse would
+    pick, found without importing shutil: argparse creates a formatter for
+    every argument added, and shutil loads bz2 and lzma.
     """
-    Parse command-line arguments for the Control-M XML automation tool.
+
+    def __init__(self, prog, indent_increment=2, max_help_position=24, width=None):
+        if width is None:
+            width = _terminal_columns() - 2
+        super().__init__(prog, indent_increment, max_help_position, width)
+
+def build_parser(daemon: bool = True) -> argparse.ArgumentParser:
+    """
+    The parser of a transform run's arguments, used by cli.py and by
+    `python src/modify_controlm_xml.py`, which always runs in-process and
+    passes daemon=False to leave out --daemon and --no-daemon.
+    check_args() checks the parsed arguments.
     """
     parser = argparse.ArgumentParser(
         description="Modify Control-M XML files for different environments.",
@@ -14,26 +57,304 @@ Example usage:
     --output sample_output/sample_controlm_preprod.xml \\
     --target-env preprod \\
     --steps activate promote resources notifications
+
+  python3 src/cli.py serve &    # later calls with --input run in this warm process
+
+  python3 src/cli.py graph --input-dir exports/dev --output deps.json --partitions 8
+
+  python3 src/cli.py \\
+    --input-dir exports/dev --output-dir exports/preprod --jobs 8 \\
+    --target-env preprod \\
+    --steps activate promote resources notifications
+
+Steps:
+  promote       Update env-specific attributes.
+  activate      Set FOLDER_ORDER_METHOD='SYSTEM'.
+  resources     Standardize QUANTITATIVE resources.
+  notifications Standardize ON blocks.
+  validate      Check INCOND/OUTCOND chains and JOBNAMEs (changes nothing).
         """,
-        formatter_class=argparse.RawDescriptionHelpFormatter
+        formatter_class=_HelpFormatter
     )
-    parser.add_argument('--input', required=True, help='Path to input XML file')
-    parser.add_argument('--output', required=True, help='Path to output XML file')
-    parser.add_argument('--target-env', required=True, help='Target environment (e.g., preprod)')
-    parser.add_argument('--steps', nargs='+', required=True, help='Steps to apply in order (e.g., activate promote resources notifications)')
-    return parser.parse_args()
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument('-i', '--input', help='Path to input XML file')
+    input_group.add_argument('--input-dir', help='Directory of input XML files to process in batch')
+    parser.add_argument('-o', '--output', nargs='+', help='Path to output XML file (with --input); one per --target-env')
+    parser.add_argument('--output-dir', help='Directory for output XML files (with --input-dir)')
+    parser.add_argument('--pattern', default='*.xml', help="Glob pattern relative to --input-dir (default: '*.xml')")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes for --input-dir (default: number of CPUs)')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Overlap reading, transforming and writing the --input-dir files and report how busy '
+                             'each stage is')
+    parser.add_argument('--queue-depth', type=int, metavar='N',
+                        help='Files held between two --pipeline stages (default: 4)')
+    parser.add_argument('-t', '--target-env', required=True, nargs='+',
+                        help='Target environment, as named in the rules file (e.g., preprod); '
+                             'several (e.g., preprod prod) parse the input once and promote along the chain')
+    parser.add_argument('--config', help='JSON or TOML rules file defining the environments (default: src/default_rules.json)')
+    parser.add_argument('-s', '--steps', nargs='+', required=True,
+                        help='Steps to apply in order (e.g., activate promote resources notifications; see below)')
+    parser.add_argument('--sequential', action='store_true', help='Apply each step in its own pass instead of a single fused pass')
+    parser.add_argument('--stream', action='store_true', help='Process one top-level FOLDER at a time to bound memory on very large files')
+    parser.add_argument('--backend', choices=xml_backend.BACKEND_CHOICES,
+                        default=os.environ.get(xml_backend.BACKEND_ENV_VAR, 'auto'),
+                        help="XML library: 'lxml', 'etree' (stdlib) or 'auto' (lxml when installed)")
+    parser.add_argument('--change-log', help='Path for a JSON log of every change made (with --input)')
+    parser.add_argument('--metrics-json', metavar='PATH',
+                        help='Path for JSON per-step metrics, parse/write timings and peak RSS (with --input)')
+    parser.add_argument('--cache-dir', help='Reuse transformed folders cached in this directory (with --input)')
+    parser.add_argument('--cache-max-mb', type=int, default=1024,
+                        help='Size limit of --cache-dir in MB, least recently used folders are evicted (default: 1024)')
+    parser.add_argument('--changed-only', action='store_true',
+                        help='Write only the folders the steps modified, plus <output>.summary.json (with --input)')
+    parser.add_argument('--parallel-folders', type=int, metavar='N',
+                        help='Transform the top-level folders of the --input file in N processes (same output)')
+    parser.add_argument('--compact', action='store_true',
+                        help='Share repeated attribute values and whitespace while parsing for a smaller tree (uses etree)')
+    parser.add_argument('--compress-level', type=int, choices=range(10), metavar='0-9',
+                        help='Level for outputs ending in .gz, .bz2 or .xz, which are written compressed '
+                             '(default: 9 for gzip and bz2, 6 for xz); compressed inputs are detected by content')
+    parser.add_argument('--check', action='store_true',
+                        help='Write nothing; report the changes the steps would make per step and folder and exit '
+                             'with 1 if any are pending, 2 on errors (with --input)')
+    parser.add_argument('--check-report', metavar='PATH', help='Also write the --check report as JSON to PATH')
+    if not daemon:
+        return parser
+    daemon_group = parser.add_mutually_exclusive_group()
+    daemon_group.add_argument('--daemon', metavar='ADDRESS',
+                              help='Send the work (with --input) to the daemon at this socket path or '
+                                   'http://127.0.0.1:PORT (default: $CONTROLM_DAEMON, else the default '
+                                   'socket when a daemon is running); runs in-process if none answers')
+    daemon_group.add_argument('--no-daemon', action='store_true', help='Always run in-process')
+    return parser
 
-def cli():
+def multi_target_error(target_envs, output_paths=None, input_dir=None, options=None) -> Optional[str]:
     """
-    Entry point for the CLI.
+    Checks a run's --target-env values against its --output paths, its
+    --input-dir and the options in use: options maps the names of
+    SINGLE_TARGET_OPTIONS (as in parsed arguments or a daemon request) to
+    their values. Returns an error message, or None if they are usable.
+    """
+    if output_paths and len(output_paths) != len(target_envs):
+        return "give one --output per --target-env, in the same order"
+    if len(target_envs) == 1:
+        return None
+    if len(set(target_envs)) != len(target_envs):
+        return "each --target-env may only be given once"
+    if input_dir:
+        return "--input-dir takes a single --target-env"
+    used = [option for name, option in SINGLE_TARGET_OPTIONS.items() if (options or {}).get(name)]
+    if used:
+        return f"{', '.join(used)} can only be used with a single --target-env"
+    return None
+
+def check_args(parser, args) -> None:
+    """Reports arguments parsed by build_parser() that cannot be used together through parser.error()."""
+    if args.input_dir and not args.output_dir:
+        parser.error('--output-dir is required with --input-dir')
+    if args.input and not args.output and not args.check:
+        parser.error('--output is required with --input')
+    if args.input_dir and args.check:
+        parser.error('--check works on a single --input file')
+    if args.check_report and not args.check:
+        parser.error('--check-report is only written with --check')
+    if (args.pipeline or args.queue_depth) and not args.input_dir:
+        parser.error('--pipeline and --queue-depth apply to --input-dir runs')
+    if args.queue_depth is not None and args.queue_depth < 1:
+        parser.error('--queue-depth must be at least 1')
+    if args.jobs is not None and args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.input_dir and args.parallel_folders:
+        parser.error('--parallel-folders splits a single --input file; use --jobs with --input-dir')
+    error = multi_target_error(args.target_env, args.output, args.input_dir, vars(args))
+    if error:
+        parser.error(error)
+
+def _absolute(path):
+    # The daemon does not share our working directory
+    return os.path.abspath(path) if path else None
+
+def run_on_daemon(parser, args) -> bool:
+    """
+    Sends an --input run to the daemon, if one answers, and reports its
+    outcome as an in-process run would. Returns False when the run has to
+    happen in-process instead.
+    """
+    # --check exits with its own status, which the daemon's response does not carry
+    address = None if args.no_daemon or args.input_dir or args.check else daemon_address(args.daemon)
+    if address is None:
+        return False
+    response = send_request(address, '/transform', {
+        'input_path': _absolute(args.input),
+        'output_path': [_absolute(path) for path in args.output],
+        'target_env': args.target_env,
+        'steps': args.steps,
+        'config': _absolute(args.config),
+        'backend': args.backend,
+        'sequential': args.sequential,
+        'stream': args.stream,
+        'change_log': _absolute(args.change_log),
+        'metrics_json': _absolute(args.metrics_json),
+        'cache_dir': _absolute(args.cache_dir),
+        'cache_max_mb': args.cache_max_mb,
+        'changed_only': args.changed_only,
+        'parallel_folders': args.parallel_folders,
+        'compact': args.compact,
+        'compress_level': args.compress_level,
+    })
+    if response is None:
+        return False
+    for line in response.get('log', []):
+        print(line, file=sys.stderr)
+    if response.get('error'):
+        parser.error(response['error'])
+    if not response.get('ok'):
+        sys.exit(1)
+    return True
+
+def serve_cli(argv):
+    """
+    Entry point for `cli.py serve`: runs the daemon in the foreground.
+    """
+    parser = argparse.ArgumentParser(
+        prog='cli.py serve',
+        description='Keep a warm process that runs transform requests sent by cli.py (see --daemon).')
+    address_group = parser.add_mutually_exclusive_group()
+    address_group.add_argument('--socket', help='Unix socket to listen on (default: a socket in $XDG_RUNTIME_DIR, '
+                                                'else in a private per-user directory in the temp dir)')
+    address_group.add_argument('--port', type=int,
+                               help='Listen on http://127.0.0.1:PORT instead of a Unix socket; requests must carry '
+                                    'the token written to a file only the current user can read')
+    parser.add_argument('--allow-root', action='append', metavar='DIR',
+                        help='Directory whose files requests may read and write; repeat for several '
+                             '(default: the current directory)')
+    parser.add_argument('--backend', choices=xml_backend.BACKEND_CHOICES,
+                        default=os.environ.get(xml_backend.BACKEND_ENV_VAR, 'auto'),
+                        help="XML library: 'lxml', 'etree' (stdlib) or 'auto' (lxml when installed)")
+    args = parser.parse_args(argv)
+
+    import logging
+    from src.daemon import serve
+    from src.errors import ControlMXmlError
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s",
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    try:
+        serve(socket_path=args.socket, port=args.port, backend=args.backend, allowed_roots=args.allow_root)
+    except ControlMXmlError as e:
+        parser.error(str(e))
+
+def graph_cli(argv):
+    """
+    Entry point for `cli.py graph`: exports the job dependency graph of the
+    input files and logs how their folders split into independent components.
     """
-    args = parse_args()
+    parser = argparse.ArgumentParser(
+        prog='cli.py graph',
+        description='Export the INCOND/OUTCOND dependency graph of Control-M XML files as JSON or DOT.')
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument('--input', nargs='+', help='Input XML file(s)')
+    input_group.add_argument('--input-dir', help='Directory of input XML files')
+    parser.add_argument('--pattern', default='*.xml', help="Glob for files under --input-dir (default: *.xml)")
+    parser.add_argument('--output', required=True, help='Graph file to write (.json, or .dot/.gv for Graphviz)')
+    parser.add_argument('--format', choices=['json', 'dot'], help='Output format (default: from the --output extension)')
+    parser.add_argument('--partitions', type=int, metavar='N',
+                        help='Also group the folder components into N balanced partitions (JSON only)')
+    parser.add_argument('--backend', choices=xml_backend.BACKEND_CHOICES,
+                        default=os.environ.get(xml_backend.BACKEND_ENV_VAR, 'auto'),
+                        help="XML library: 'lxml', 'etree' (stdlib) or 'auto' (lxml when installed)")
+    args = parser.parse_args(argv)
+    if args.partitions is not None and args.partitions < 1:
+        parser.error("--partitions must be at least 1")
+
+    import logging
+    from src.dependency_graph import graph_from_files, write_graph
+    from src.errors import ControlMXmlError
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s",
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    xml_backend.set_backend(args.backend)
+    paths = args.input
+    if args.input_dir:
+        from src.batch import collect_input_files
+        paths = collect_input_files(args.input_dir, args.pattern)
+    try:
+        graph = graph_from_files(paths)
+        write_graph(graph, args.output, args.format, args.partitions)
+    except (ControlMXmlError, OSError) as e:
+        logging.error(str(e))
+        sys.exit(1)
+    components = graph.folder_components()
+    largest = max((len(component) for component in components), default=0)
+    logging.info(f"{len(graph.node_jobs)} nodes, {len(graph.conditions)} conditions, {graph.edge_count} edges, "
+                 f"{len(graph.folders)} folders in {len(components)} components (largest: {largest} folders). "
+                 f"Graph written to {args.output}")
+
+def run_in_process(parser, args) -> None:
+    """
+    Runs checked arguments in this process: activates the rules file,
+    checks the target environments against it and runs the batch or the
+    single-file transform.
+    """
+    from src.errors import ControlMXmlError
+    from src.xml_modifiers import load_rules_config
+    try:
+        load_rules_config(args.config, args.target_env)
+    except ControlMXmlError as e:
+        parser.error(str(e))
+    xml_backend.set_backend(args.backend)
+    compression.set_level(args.compress_level)
+    if args.input_dir:
+        from src.batch import main_batch
+        main_batch(
+            input_dir=args.input_dir,
+            output_dir=args.output_dir,
+            target_env=args.target_env[0],
+            steps=args.steps,
+            pattern=args.pattern,
+            jobs=args.jobs,
+            sequential=args.sequential,
+            stream=args.stream,
+            config_path=args.config,
+            compact=args.compact,
+            pipeline=args.pipeline or bool(args.queue_depth),
+            queue_depth=args.queue_depth
+        )
+        return
+    from src.modify_controlm_xml import main
     main(
         input_path=args.input,
         output_path=args.output,
         target_env=args.target_env,
-        steps=args.steps
+        steps=args.steps,
+        sequential=args.sequential,
+        stream=args.stream,
+        change_log=args.change_log,
+        metrics_json=args.metrics_json,
+        cache_dir=args.cache_dir,
+        cache_max_mb=args.cache_max_mb,
+        changed_only=args.changed_only,
+        parallel_folders=args.parallel_folders,
+        compact=args.compact,
+        check=args.check,
+        check_report=args.check_report
     )
 
+def cli():
+    """
+    Entry point for the CLI.
+    """
+    if sys.argv[1:2] == ['serve']:
+        serve_cli(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['graph']:
+        graph_cli(sys.argv[2:])
+        return
+    parser = build_parser()
+    args = parser.parse_args()
+    check_args(parser, args)
+    if run_on_daemon(parser, args):
+        return
+    run_in_process(parser, args)
+
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,101 @@
+import os
+from contextlib import contextmanager
+from typing import Optional
+from src.errors import ControlMXmlError
+
+# Leading bytes of each compressed input format; anything else is read as plain XML
+MAGIC_NUMBERS = ((b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz'))
+# Output formats, by extension of the output path
+EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+
+# Level of compressed outputs, 0 (fastest) to 9 (smallest); None keeps each codec's default
+_LEVEL = None
+
+
+def set_level(level: Optional[int]) -> None:
+    """Sets the level compressed outputs are written with; None restores the codec defaults."""
+    global _LEVEL
+    if level is not None and not 0 <= level <= 9:
+        raise ControlMXmlError(f"Compression level must be between 0 and 9, not {level}.")
+    _LEVEL = level
+
+
+def get_level() -> Optional[int]:
+    return _LEVEL
+
+
+def decompression_errors() -> tuple:
+    """
+    Exception types reading a truncated or corrupt compressed input raises,
+    besides the plain OSError of bz2. The codecs are only imported for
+    compressed files, so plain runs do not pay for loading them.
+    """
+    import gzip
+    import lzma
+    # gzip.BadGzipFile is new in Python 3.8; before it, gzip raised a plain OSError
+    return (EOFError, getattr(gzip, 'BadGzipFile', OSError), lzma.LZMAError)
+
+
+def input_format(path: str) -> Optional[str]:
+    """The compression of the file at path ('gzip', 'bz2' or 'xz'), from its first bytes rather than its name; None if plain."""
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for magic, name in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def output_format(path: str) -> Optional[str]:
+    """The compression an output written to path gets, from its extension (.gz, .bz2 or .xz); None if plain."""
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def open_input(path: str):
+    """Opens path as a binary file, decompressing it while it is read if it is compressed (see input_format())."""
+    name = input_format(path)
+    if name == 'gzip':
+        import gzip
+        return gzip.open(path, 'rb')
+    if name == 'bz2':
+        import bz2
+        return bz2.open(path, 'rb')
+    if name == 'xz':
+        import lzma
+        return lzma.open(path, 'rb')
+    return open(path, 'rb')
+
+
+@contextmanager
+def input_source(path: str):
+    """
+    Yields what a parser should read path from: path itself when it is
+    plain XML, so the parser keeps reading the file natively, or a file
+    decompressing it on the fly (see open_input()).
+    """
+    if input_format(path) is None:
+        yield path
+        return
+    with open_input(path) as f:
+        yield f
+
+
+def compressing(f, name: str):
+    """
+    Returns a binary file compressing what is written to it into the open
+    binary file f, in format name, at the level set with set_level().
+    Closing it writes the end of the compressed stream and leaves f open.
+    """
+    if name == 'gzip':
+        import gzip
+        # No file name or time in the header, so equal documents compress to equal bytes
+        return gzip.GzipFile(filename='', mode='wb', fileobj=f, mtime=0,
+                             compresslevel=9 if _LEVEL is None else _LEVEL)
+    if name == 'bz2':
+        import bz2
+        # bzip2 has no level 0
+        return bz2.BZ2File(f, 'wb', compresslevel=9 if _LEVEL is None else max(_LEVEL, 1))
+    if name == 'xz':
+        import lzma
+        return lzma.LZMAFile(f, 'wb', preset=_LEVEL)
+    raise ValueError(f"Unknown compression format '{name}'")
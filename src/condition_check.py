@@ -0,0 +1,247 @@
+import xml.etree.ElementTree as ET
+import logging
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Elements that own INCOND/OUTCOND children
+CONDITION_OWNER_TAGS = frozenset(('FOLDER', 'SMART_FOLDER', 'SUB_FOLDER', 'JOB'))
+CONDITION_TAGS = frozenset(('INCOND', 'OUTCOND'))
+# Top-level folders, whose FOLDER_NAME labels everything below them in reports
+TOP_FOLDER_TAGS = frozenset(('FOLDER', 'SMART_FOLDER'))
+
+# OUTCOND SIGN values that add the condition (the others delete it)
+ADDING_SIGNS = frozenset(('+', 'ADD'))
+# ODATEs that can refer to any day, so they match a condition of any ODATE
+FLEXIBLE_ODATES = frozenset(('ODAT', '****', '$$$$'))
+
+# How many findings of each kind are logged; the counts are always complete
+MAX_LOGGED_FINDINGS = 20
+
+
+class ConditionIndex:
+    """
+    Hash indexes of the conditions and job names of one or more files,
+    filled in a single pre-order pass by visit():
+      produced: OUTCOND name -> ODATE -> locations adding it
+      required: INCOND name -> ODATE -> locations waiting for it
+      jobs: JOBNAME -> locations
+      folders: (source, folder) of every top-level folder, in order
+    A location is (source, folder, job); job is None for conditions set
+    on a folder.
+    """
+
+    def __init__(self, source: Optional[str] = None):
+        self.source = source
+        self.produced = {}
+        self.required = {}
+        self.jobs = {}
+        self.folders = []
+        self._folder = None
+        # INCOND/OUTCOND element -> owning job name, set when the owner is visited
+        self._owners = {}
+
+    def visit(self, element: ET.Element) -> int:
+        """
+        Indexes one element. Elements must come in document order, owners
+        before their conditions, as in a depth-first pass. Returns 0: the
+        tree is not changed.
+        """
+        tag = element.tag
+        if tag in CONDITION_TAGS:
+            job = self._owners.pop(element, None)
+            location = (self.source, self._folder, job)
+            name, odate = element.get('NAME'), element.get('ODATE', 'ODAT')
+            if tag == 'INCOND':
+                _add_location(self.required, name, odate, location)
+            elif element.get('SIGN', '+') in ADDING_SIGNS:
+                _add_location(self.produced, name, odate, location)
+            return 0
+        if tag in TOP_FOLDER_TAGS:
+            self._folder = element.get('FOLDER_NAME')
+            self.folders.append((self.source, self._folder))
+        job = None
+        if tag == 'JOB':
+            job = element.get('JOBNAME')
+            self.jobs.setdefault(job, []).append((self.source, self._folder))
+        for child in element:
+            if child.tag in CONDITION_TAGS:
+                self._owners[child] = job
+        return 0
+
+    def visit_tree(self, root: ET.Element) -> None:
+        """Indexes every element below root (a DEFTABLE)."""
+        tags = CONDITION_OWNER_TAGS | CONDITION_TAGS
+        for top in root:
+            for element in top.iter():
+                if element.tag in tags:
+                    self.visit(element)
+
+    def merge(self, other: 'ConditionIndex') -> None:
+        """Adds the entries of other (e.g. another file of a batch) to this index."""
+        for mine, theirs in ((self.produced, other.produced), (self.required, other.required)):
+            for name, by_odate in theirs.items():
+                for odate, locations in by_odate.items():
+                    mine.setdefault(name, {}).setdefault(odate, []).extend(locations)
+        for jobname, locations in other.jobs.items():
+            self.jobs.setdefault(jobname, []).extend(locations)
+        self.folders.extend(other.folders)
+
+    def __getstate__(self):
+        # Sent back from batch workers once the pass is over
+        state = dict(self.__dict__)
+        state['_owners'] = {}
+        return state
+
+
+def _add_location(index: dict, name: str, odate: str, location: tuple) -> None:
+    by_odate = index.get(name)
+    if by_odate is None:
+        by_odate = index[name] = {}
+    locations = by_odate.get(odate)
+    if locations is None:
+        by_odate[odate] = [location]
+    else:
+        locations.append(location)
+
+
+def _is_produced(produced_odates: Optional[Dict[str, list]], odate: str) -> bool:
+    if not produced_odates:
+        return False
+    if odate in produced_odates or odate in FLEXIBLE_ODATES:
+        return True
+    return any(produced in FLEXIBLE_ODATES for produced in produced_odates)
+
+
+def find_condition_problems(index: ConditionIndex) -> dict:
+    """
+    Checks an index in time linear in its size. Returns:
+      dangling_inputs: INCONDs no OUTCOND adds (same NAME, and the same
+                       ODATE unless either side is ODAT, **** or $$$$)
+      orphan_outputs: OUTCONDs adding a NAME no INCOND waits for
+      duplicate_jobnames: JOBNAMEs defined more than once in one folder;
+                          Control-M only needs them unique per folder
+    Each finding is a dict; locations are (source, folder, job) lists, or
+    (source, folder) for duplicates, which also give their count.
+    """
+    dangling = []
+    for name, by_odate in index.required.items():
+        produced_odates = index.produced.get(name)
+        for odate, locations in by_odate.items():
+            if not _is_produced(produced_odates, odate):
+                dangling.append({'name': name, 'odate': odate, 'locations': locations})
+    orphans = [
+        {'name': name, 'odate': odate, 'locations': locations}
+        for name, by_odate in index.produced.items() if name not in index.required
+        for odate, locations in by_odate.items()
+    ]
+    duplicates = []
+    for jobname, locations in index.jobs.items():
+        if len(locations) > 1:
+            counts = {}
+            for location in locations:
+                counts[location] = counts.get(location, 0) + 1
+            duplicates.extend({'jobname': jobname, 'locations': [location], 'count': count}
+                              for location, count in counts.items() if count > 1)
+    return {'dangling_inputs': dangling, 'orphan_outputs': orphans, 'duplicate_jobnames': duplicates}
+
+
+def _describe(location) -> str:
+    source, folder, *job = location
+    parts = [f"job {job[0]}" if job and job[0] else None, f"folder {folder}" if folder else None, source]
+    return ', '.join(part for part in parts if part)
+
+
+def log_condition_problems(problems: dict) -> bool:
+    """
+    Logs the findings of find_condition_problems(). Dangling inputs and
+    duplicate JOBNAMEs are warnings; orphan outputs are only logged at INFO,
+    since the last job of a chain often sets a condition nothing waits for.
+    Returns True if there were no warnings.
+    """
+    kinds = [
+        ('dangling_inputs', logging.WARNING, "INCOND {name} (ODATE {odate}) has no OUTCOND adding it"),
+        ('duplicate_jobnames', logging.WARNING, "JOBNAME {jobname} is defined {count} times in one folder"),
+        ('orphan_outputs', logging.INFO, "OUTCOND {name} (ODATE {odate}) is not waited for by any INCOND"),
+    ]
+    counts = (f"{len(problems['dangling_inputs'])} dangling inputs, "
+              f"{len(problems['duplicate_jobnames'])} duplicate JOBNAMEs, "
+              f"{len(problems['orphan_outputs'])} orphan outputs")
+    passed = not problems['dangling_inputs'] and not problems['duplicate_jobnames']
+    if passed:
+        logging.info(f"Condition check passed: {counts}.")
+    else:
+        logging.warning(f"Condition check: {counts}.")
+    for kind, level, message in kinds:
+        findings = problems[kind]
+        for finding in findings[:MAX_LOGGED_FINDINGS]:
+            locations = finding['locations']
+            text = message.format(**{'count': len(locations), **finding})
+            logging.log(level, f"  {text}: {'; '.join(_describe(location) for location in locations[:3])}")
+        if len(findings) > MAX_LOGGED_FINDINGS:
+            logging.log(level, f"  ... and {len(findings) - MAX_LOGGED_FINDINGS} more {kind.replace('_', ' ')}")
+    return passed
+
+
+# --- Collecting across files ---
+
+_ACTIVE_INDEX = None
+
+@contextmanager
+def collecting(index: Optional[ConditionIndex]):
+    """
+    Makes validate steps run in the block add to index instead of reporting
+    on their own, so the caller can check several files together.
+    """
+    global _ACTIVE_INDEX
+    previous = _ACTIVE_INDEX
+    _ACTIVE_INDEX = index
+    try:
+        yield index
+    finally:
+        _ACTIVE_INDEX = previous
+
+
+def start_validation() -> ConditionIndex:
+    """Index a validate step should fill: the collecting() one, else a new one."""
+    return _ACTIVE_INDEX if _ACTIVE_INDEX is not None else ConditionIndex()
+
+
+_FAILED_CHECKS = None
+
+@contextmanager
+def recording_failures():
+    """
+    Yields a list to which every validate step reporting in the block (see
+    finish_validation()) adds its findings when the check fails, so the
+    caller can fail the run.
+    """
+    global _FAILED_CHECKS
+    previous = _FAILED_CHECKS
+    _FAILED_CHECKS = []
+    try:
+        yield _FAILED_CHECKS
+    finally:
+        _FAILED_CHECKS = previous
+
+
+def finish_validation(index: ConditionIndex) -> None:
+    """
+    Reports on index, unless it belongs to a collecting() caller that
+    reports itself. A failed check is recorded for recording_failures().
+    """
+    if index is not _ACTIVE_INDEX:
+        problems = find_condition_problems(index)
+        if not log_condition_problems(problems) and _FAILED_CHECKS is not None:
+            _FAILED_CHECKS.append(problems)
+
+
+def validate_conditions(root: ET.Element) -> int:
+    """
+    Checks the INCOND/OUTCOND chains and the JOBNAMEs of each folder in one
+    pass (see find_condition_problems()). Changes nothing; returns 0.
+    """
+    logging.info("Checking INCOND/OUTCOND consistency and JOBNAME uniqueness...")
+    index = start_validation()
+    index.visit_tree(root)
+    finish_validation(index)
+    return 0
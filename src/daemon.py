@@ -0,0 +1,282 @@
+import hmac
+import http.server
+import json
+import logging
+import os
+import secrets
+import shutil
+import signal
+import socketserver
+import tempfile
+from typing import Optional
+from src.errors import ControlMXmlError
+from src.daemon_client import default_socket_path, send_request, token_path
+from src.cli import multi_target_error
+from src.modify_controlm_xml import run_transform
+from src.step_engine import STEP_VISITOR_FACTORIES, compile_step_visitors
+from src import compression, xml_backend, xml_modifiers
+
+# Request fields passed on to run_transform(), with their defaults
+TRANSFORM_OPTIONS = {'sequential': False, 'stream': False, 'change_log': None, 'metrics_json': None,
+                     'cache_dir': None, 'cache_max_mb': 1024, 'changed_only': False, 'parallel_folders': None,
+                     'compact': False}
+# Request fields naming files or directories the run reads or writes
+PATH_FIELDS = ('input_path', 'output_path', 'change_log', 'metrics_json', 'cache_dir', 'config')
+# Host headers a request may carry: anything else is a page reaching 127.0.0.1 through a rebound name
+ALLOWED_HOSTS = ('localhost', '127.0.0.1')
+
+
+class _CapturedLog(logging.Handler):
+    """Collects a request's warnings and errors so the client can show them as an in-process run would."""
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value or [])
+
+
+def _transform_xml_text(request: dict, target_envs, options: dict) -> dict:
+    """Runs a request carrying the input document itself; returns the output document per target."""
+    work_dir = tempfile.mkdtemp(prefix='controlm-daemon-')
+    try:
+        input_path = os.path.join(work_dir, 'input.xml')
+        with open(input_path, 'wb') as f:
+            f.write(request['xml'].encode('utf-8'))
+        output_paths = [os.path.join(work_dir, f"output-{index}.xml") for index in range(len(target_envs))]
+        ok = run_transform(input_path, output_paths, target_envs, request['steps'], **options)
+        outputs = {}
+        for target_env, output_path in zip(target_envs, output_paths):
+            if os.path.exists(output_path):
+                with open(output_path, 'rb') as f:
+                    outputs[target_env] = f.read().decode('utf-8')
+        return {'ok': ok, 'outputs': outputs}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _check_paths(request: dict, allowed_roots) -> None:
+    """Raises ControlMXmlError if a path of the request lies outside allowed_roots, following symlinks."""
+    for field in PATH_FIELDS:
+        for path in _as_list(request.get(field)):
+            real_path = os.path.realpath(path)
+            if not any(os.path.commonpath([real_path, root]) == root for root in allowed_roots):
+                raise ControlMXmlError(f"'{field}' {path} is outside the directories this daemon may use "
+                                       f"({', '.join(allowed_roots)}).")
+
+
+def handle_request(request: dict, allowed_roots=None) -> dict:
+    """
+    Runs one transform request:
+      'input_path' and 'output_path' (a path or one per target), or 'xml'
+      (the UTF-8 input document, answered with 'outputs' per target)
+      'target_env' (a name or a list), 'steps', and optionally 'config',
+      'backend', 'compress_level' (see compression.set_level()) and the
+      TRANSFORM_OPTIONS of main().
+    When allowed_roots (real paths) is given, every path of the request
+    (PATH_FIELDS) must lie under one of them.
+    Returns {'ok': bool, 'log': [warnings and errors], ...}, with 'error'
+    when the request could not be run.
+    """
+    captured = _CapturedLog()
+    # The format of a cli.py run, whose logging.warning()/error() calls configure the root logger
+    captured.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    logging.getLogger().addHandler(captured)
+    try:
+        target_envs = _as_list(request.get('target_env'))
+        output_paths = _as_list(request.get('output_path'))
+        if not target_envs or not request.get('steps'):
+            raise ControlMXmlError("A request needs 'target_env' and 'steps'.")
+        if 'xml' not in request and not (request.get('input_path') and output_paths):
+            raise ControlMXmlError("A request needs 'xml', or 'input_path' and 'output_path'.")
+        if allowed_roots is not None:
+            _check_paths(request, allowed_roots)
+        options = {name: request.get(name, default) for name, default in TRANSFORM_OPTIONS.items()}
+        error = multi_target_error(target_envs, output_paths, options=options)
+        if error:
+            raise ControlMXmlError(error)
+        # Both are cheap: validating the rules takes under a millisecond and the backend only switches modules
+        xml_backend.set_backend(request.get('backend') or 'auto')
+        compression.set_level(request.get('compress_level'))
+        xml_modifiers.load_rules_config(request.get('config'), target_envs)
+
+        logging.info(f"Request: {request.get('input_path', '<xml>')} -> {', '.join(target_envs)}")
+        if 'xml' in request:
+            response = _transform_xml_text(request, target_envs, options)
+        else:
+            response = {'ok': run_transform(request['input_path'], output_paths, target_envs,
+                                            request['steps'], **options)}
+    except Exception as e:
+        response = {'ok': False, 'error': str(e)}
+    finally:
+        logging.getLogger().removeHandler(captured)
+    if response.get('error'):
+        logging.error(f"Request failed. Details: {response['error']}")
+    response['log'] = captured.lines
+    return response
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    GET /health reports the daemon's state; POST /transform runs
+    handle_request(). Requests must name localhost as their Host and, on a
+    TCP port, carry the daemon's token (see make_server()).
+    """
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _refused(self) -> bool:
+        # Sends the error and returns True when the request may not be served
+        host = self.headers.get('Host', '')
+        if (host.rsplit(':', 1)[0] if ':' in host else host) not in ALLOWED_HOSTS:
+            self._send_json(403, {'ok': False, 'error': f"Host '{host}' is not allowed."})
+            return True
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get('Authorization', ''), f"Bearer {token}"):
+            self._send_json(401, {'ok': False, 'error': "Missing or wrong daemon token."})
+            return True
+        return False
+
+    def do_GET(self):
+        if self._refused():
+            return
+        if self.path != '/health':
+            self._send_json(404, {'ok': False, 'error': f"Unknown path {self.path}"})
+            return
+        self._send_json(200, {'ok': True, 'pid': os.getpid(), 'backend': xml_backend.get_backend(),
+                              'rules': xml_modifiers.rules_config_hash()})
+
+    def do_POST(self):
+        if self._refused():
+            return
+        if self.path != '/transform':
+            self._send_json(404, {'ok': False, 'error': f"Unknown path {self.path}"})
+            return
+        if self.headers.get_content_type() != 'application/json':
+            self._send_json(415, {'ok': False, 'error': "A request must be sent as application/json."})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+        except ValueError as e:
+            self._send_json(400, {'ok': False, 'error': f"Invalid JSON request. Details: {e}"})
+            return
+        if not isinstance(request, dict):
+            self._send_json(400, {'ok': False, 'error': "A request must be a JSON object."})
+            return
+        self._send_json(200, handle_request(request, self.server.allowed_roots))
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+class _UnixHTTPServer(socketserver.UnixStreamServer):
+    def get_request(self):
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        request, _ = super().get_request()
+        return request, ('local', 0)
+
+
+def _write_token(path: str) -> str:
+    """Writes a new random token to path, readable by the current user only, and returns it."""
+    if os.path.lexists(path):
+        os.remove(path)
+    token = secrets.token_urlsafe(32)
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w', encoding='ascii') as f:
+        f.write(token)
+    return token
+
+
+def make_server(socket_path: Optional[str] = None, port: Optional[int] = None, allowed_roots=None):
+    """
+    Binds the daemon: on 127.0.0.1:port when port is given (0 picks a free
+    port), else on the Unix socket at socket_path (default:
+    default_socket_path()), readable by the current user only. A stale
+    socket left by a daemon that died is replaced.
+
+    The Unix socket admits the current user only. A TCP port admits any
+    local user, so requests to it must carry a random token the daemon
+    writes to token_path(port), a file only the current user can read;
+    cli.py reads it from there. Requests may only name files under
+    allowed_roots (default: the current directory).
+
+    Requests are handled one at a time: the active rules and XML backend
+    are process-wide. Release the server with close_server().
+    """
+    roots = [os.path.realpath(root) for root in (allowed_roots or [os.getcwd()])]
+    if port is not None:
+        server = http.server.HTTPServer(('127.0.0.1', port), _RequestHandler)
+        server.token_path = token_path(server.server_address[1], create=True)
+        if server.token_path is None:
+            server.server_close()
+            raise ControlMXmlError("No private directory for the daemon's token; set XDG_RUNTIME_DIR.")
+        server.token = _write_token(server.token_path)
+        server.allowed_roots = roots
+        return server
+    socket_path = socket_path or default_socket_path(create=True)
+    if socket_path is None:
+        raise ControlMXmlError("No private directory for the daemon's socket; pass --socket, or serve on a --port.")
+    if os.path.exists(socket_path):
+        if send_request(socket_path, '/health', timeout=5) is not None:
+            raise ControlMXmlError(f"A daemon is already serving on {socket_path}.")
+        os.remove(socket_path)
+    old_umask = os.umask(0o177)
+    try:
+        server = _UnixHTTPServer(socket_path, _RequestHandler)
+    finally:
+        os.umask(old_umask)
+    server.token_path = server.token = None
+    server.allowed_roots = roots
+    return server
+
+
+def close_server(server) -> None:
+    """Closes a server from make_server() and removes its socket or token file."""
+    server.server_close()
+    path = server.token_path or server.server_address
+    if isinstance(path, str) and os.path.lexists(path):
+        os.remove(path)
+
+
+def warm_up() -> None:
+    """Compiles every step for each promotion target once, loading the lazily imported code they use."""
+    for target_env, env_cfg in xml_modifiers.ENV_CONFIG.items():
+        if env_cfg.get('promotes_from'):
+            compile_step_visitors(list(STEP_VISITOR_FACTORIES), target_env)
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(socket_path: Optional[str] = None, port: Optional[int] = None, backend: str = 'auto',
+          allowed_roots=None) -> None:
+    """
+    Runs the daemon until interrupted (Ctrl-C or SIGTERM). See make_server().
+    Each request activates the rules file it names (the default rules when
+    it names none).
+    """
+    xml_backend.set_backend(backend)
+    warm_up()
+    server = make_server(socket_path, port, allowed_roots)
+    address = f"http://127.0.0.1:{server.server_address[1]}" if port is not None else server.server_address
+    signal.signal(signal.SIGTERM, _stop)
+    logging.info(f"Serving on {address} (backend: {xml_backend.get_backend()}, pid {os.getpid()}), "
+                 f"for files under {', '.join(server.allowed_roots)}")
+    if server.token_path:
+        logging.info(f"Requests must send 'Authorization: Bearer <token>', with the token in {server.token_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Stopping")
+    finally:
+        close_server(server)
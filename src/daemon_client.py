@@ -0,0 +1,150 @@
+import json
+import os
+import socket
+import stat
+from typing import Optional
+
+# Address of a running `cli.py serve` daemon: a Unix socket path or http://127.0.0.1:PORT
+DAEMON_ENV_VAR = 'CONTROLM_DAEMON'
+
+# This module is imported before anything else on each CLI call, so it sticks
+# to a plain HTTP/1.0 exchange over a socket instead of importing http.client.
+
+# Hosts of an http:// address a daemon token may be sent to; `cli.py serve --port` only binds 127.0.0.1
+LOOPBACK_HOSTS = ('127.0.0.1', '::1', 'localhost')
+
+
+def _is_private(st) -> bool:
+    # Owned by the current user, and nobody else can add or replace entries in it
+    return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+
+def runtime_dir(create: bool = False) -> Optional[str]:
+    """
+    Directory of the current user's daemon socket and token files:
+    $XDG_RUNTIME_DIR, else a controlm-xml-automation-UID directory under
+    $TMPDIR (or /tmp), made with mode 0700 when create is true. None when it
+    does not exist, or when it is not owned by the current user or is
+    writable by others, so a socket or token planted by another user is
+    never used.
+    """
+    if not hasattr(os, 'getuid'):
+        return None
+    path = os.environ.get('XDG_RUNTIME_DIR')
+    if not path:
+        path = os.path.join(os.environ.get('TMPDIR') or '/tmp', f"controlm-xml-automation-{os.getuid()}")
+        if create:
+            try:
+                os.mkdir(path, 0o700)
+            except FileExistsError:
+                pass
+            except OSError:
+                return None
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    return path if stat.S_ISDIR(st.st_mode) and _is_private(st) else None
+
+
+def default_socket_path(create: bool = False) -> Optional[str]:
+    """Socket a daemon listens on by default, in runtime_dir(create); None where there is none."""
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    directory = runtime_dir(create)
+    return os.path.join(directory, "controlm-xml-automation.sock") if directory else None
+
+
+def token_path(port: int, create: bool = False) -> Optional[str]:
+    """File holding the token a daemon on http://127.0.0.1:port expects, in runtime_dir(create)."""
+    directory = runtime_dir(create)
+    return os.path.join(directory, f"controlm-xml-automation-{port}.token") if directory else None
+
+
+def _http_host_port(address: str):
+    """The (host, port) of an http://HOST:PORT address; an IPv6 host may be written in brackets."""
+    host, _, port = address[len('http://'):].rstrip('/').rpartition(':')
+    if host.startswith('[') and host.endswith(']'):
+        host = host[1:-1]
+    return host, int(port)
+
+
+def read_token(address: str) -> Optional[str]:
+    """
+    The token of the current user's daemon at an http:// address; None if
+    there is none, others can read it, or the address is not on this
+    machine (see LOOPBACK_HOSTS), so the token never leaves it.
+    """
+    try:
+        host, port = _http_host_port(address)
+        path = token_path(port) if host.lower() in LOOPBACK_HOSTS else None
+        if path is None:
+            return None
+        with open(path, encoding='ascii') as f:
+            st = os.fstat(f.fileno())
+            if st.st_uid != os.getuid() or st.st_mode & 0o077:
+                return None
+            return f.read().strip()
+    except (OSError, ValueError):
+        return None
+
+
+def daemon_address(address: Optional[str] = None) -> Optional[str]:
+    """
+    Address to send requests to: address, else $CONTROLM_DAEMON, else the
+    default socket when it exists and belongs to the current user. None
+    means run in-process.
+    """
+    address = address or os.environ.get(DAEMON_ENV_VAR)
+    if address:
+        return address
+    path = default_socket_path()
+    if path is None:
+        return None
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    return path if stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid() else None
+
+
+def _connect(address: str, timeout=None) -> socket.socket:
+    if address.startswith('http://'):
+        return socket.create_connection(_http_host_port(address), timeout=timeout)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(address)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def send_request(address: str, path: str, request: Optional[dict] = None, timeout=None) -> Optional[dict]:
+    """
+    Sends request (JSON) to the daemon at address: a POST when request is
+    given, else a GET. Returns the decoded response, or None when no daemon
+    answers there so the caller can fall back to in-process execution.
+    """
+    body = b'' if request is None else json.dumps(request).encode('utf-8')
+    method = 'GET' if request is None else 'POST'
+    head = f"{method} {path} HTTP/1.0\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+    token = read_token(address) if address.startswith('http://') else None
+    if token:
+        head += f"Authorization: Bearer {token}\r\n"
+    head += f"Content-Length: {len(body)}\r\n\r\n"
+    try:
+        with _connect(address, timeout) as sock:
+            sock.sendall(head.encode('ascii') + body)
+            chunks = []
+            # HTTP/1.0: the daemon closes the connection after its response
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        _, _, response_body = b''.join(chunks).partition(b'\r\n\r\n')
+        return json.loads(response_body.decode('utf-8'))
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,213 @@
+import heapq
+import json
+from array import array
+from typing import Dict, List, Optional
+from src.condition_check import ConditionIndex
+from src.errors import ControlMXmlError
+
+GRAPH_FORMATS = ('json', 'dot')
+
+
+class DependencyGraph:
+    """
+    Job dependency graph of one or more files, held in integer-indexed arrays:
+      folders: (source, folder name) per folder id
+      node_folder / node_jobs: folder id and JOBNAME per node id; the job is
+                               None for a node carrying a folder's own conditions
+      conditions: name per condition id, for the conditions both added and
+                  waited for
+      producer_offsets / producers: the nodes adding condition c are
+                               producers[producer_offsets[c]:producer_offsets[c + 1]]
+      consumer_offsets / consumers: the nodes waiting for it, in the same way
+    Jobs depend on each other through a node per condition: edges run from
+    each job adding it (OUTCOND) to the condition, and from the condition to
+    each job waiting for it (INCOND). A condition of p producers and c
+    consumers takes p + c edges rather than p * c, so the graph stays linear
+    in the size of the export. Conditions are matched by name whatever their
+    ODATE, so folders that might depend on each other always share a component.
+    """
+
+    def __init__(self, folders, node_folder, node_jobs, conditions, producer_offsets, producers,
+                 consumer_offsets, consumers):
+        self.folders = folders
+        self.node_folder = node_folder
+        self.node_jobs = node_jobs
+        self.conditions = conditions
+        self.producer_offsets = producer_offsets
+        self.producers = producers
+        self.consumer_offsets = consumer_offsets
+        self.consumers = consumers
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.producers) + len(self.consumers)
+
+    def condition_edges(self):
+        """Yields (condition id, producer nodes, consumer nodes) for every condition."""
+        producer_offsets, consumer_offsets = self.producer_offsets, self.consumer_offsets
+        for condition in range(len(self.conditions)):
+            yield (condition,
+                   self.producers[producer_offsets[condition]:producer_offsets[condition + 1]],
+                   self.consumers[consumer_offsets[condition]:consumer_offsets[condition + 1]])
+
+    def folder_components(self) -> List[List[int]]:
+        """
+        Groups the folder ids into connected components: folders in different
+        components share no condition, so they can be transformed or deployed
+        independently. Components are ordered by their first folder.
+        """
+        parent = array('i', range(len(self.folders)))
+
+        def find(folder):
+            while parent[folder] != folder:
+                parent[folder] = parent[parent[folder]]
+                folder = parent[folder]
+            return folder
+
+        node_folder = self.node_folder
+        for _, producers, consumers in self.condition_edges():
+            # Every folder of the condition's jobs joins the first producer's
+            first = node_folder[producers[0]]
+            for node in consumers + producers[1:]:
+                a, b = find(first), find(node_folder[node])
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+        components: Dict[int, List[int]] = {}
+        for folder in range(len(self.folders)):
+            components.setdefault(find(folder), []).append(folder)
+        return list(components.values())
+
+    def folder_weights(self) -> array:
+        """Number of jobs in each folder (plus one, so empty folders still count)."""
+        weights = array('i', [1]) * len(self.folders)
+        for folder, job in zip(self.node_folder, self.node_jobs):
+            if job is not None:
+                weights[folder] += 1
+        return weights
+
+    def partition_folders(self, parts: int) -> List[List[int]]:
+        """
+        Splits the folder components into at most parts groups of similar job
+        counts, largest component first onto the lightest group. Each group
+        is a sorted list of folder ids; no component is split.
+        """
+        weights = self.folder_weights()
+        components = sorted(self.folder_components(), key=lambda c: -sum(weights[f] for f in c))
+        groups = [(0, i, []) for i in range(max(1, parts))]
+        for component in components:
+            load, i, folders = heapq.heappop(groups)
+            folders.extend(component)
+            heapq.heappush(groups, (load + sum(weights[f] for f in component), i, folders))
+        return [sorted(folders) for _, _, folders in sorted(groups, key=lambda g: g[1]) if folders]
+
+    def to_dict(self, partitions: Optional[int] = None) -> dict:
+        """JSON-ready form; with partitions, includes partition_folders(partitions)."""
+        components = self.folder_components()
+        component_of = {folder: i for i, component in enumerate(components) for folder in component}
+        graph = {
+            'folders': [{'id': i, 'name': name, 'source': source, 'component': component_of[i]}
+                        for i, (source, name) in enumerate(self.folders)],
+            'nodes': [{'id': i, 'folder': folder, 'job': job}
+                      for i, (folder, job) in enumerate(zip(self.node_folder, self.node_jobs))],
+            'conditions': [{'id': condition, 'name': self.conditions[condition],
+                            'producers': list(producers), 'consumers': list(consumers)}
+                           for condition, producers, consumers in self.condition_edges()],
+            'components': components,
+        }
+        if partitions:
+            graph['partitions'] = self.partition_folders(partitions)
+        return graph
+
+    def to_dot(self) -> str:
+        """Graphviz form: one cluster per folder of jobs, conditions as ellipses between them."""
+        lines = ['digraph dependencies {', '  node [shape=box];']
+        members: Dict[int, List[int]] = {}
+        for node, folder in enumerate(self.node_folder):
+            members.setdefault(folder, []).append(node)
+        for folder, (_, name) in enumerate(self.folders):
+            lines.append(f'  subgraph cluster_{folder} {{')
+            lines.append(f'    label={_dot_string(name or "")};')
+            for node in members.get(folder, ()):
+                job = self.node_jobs[node]
+                shape = '' if job is not None else ', shape=folder'
+                lines.append(f'    n{node} [label={_dot_string(job if job is not None else name or "")}{shape}];')
+            lines.append('  }')
+        for condition, producers, consumers in self.condition_edges():
+            lines.append(f'  c{condition} [label={_dot_string(self.conditions[condition])}, shape=ellipse];')
+            lines.extend(f'  n{node} -> c{condition};' for node in producers)
+            lines.extend(f'  c{condition} -> n{node};' for node in consumers)
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+
+def _dot_string(text: str) -> str:
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def build_dependency_graph(index: ConditionIndex) -> DependencyGraph:
+    """Builds the graph of the jobs and conditions in index, in time linear in its size."""
+    folder_ids = {}
+    for folder in index.folders:
+        folder_ids.setdefault(folder, len(folder_ids))
+    node_ids = {}
+    node_folder, node_jobs = array('i'), []
+
+    def node_id(source, folder, job):
+        key = (source, folder, job)
+        node = node_ids.get(key)
+        if node is None:
+            node = node_ids[key] = len(node_jobs)
+            node_folder.append(folder_ids.setdefault((source, folder), len(folder_ids)))
+            node_jobs.append(job)
+        return node
+
+    for jobname, locations in index.jobs.items():
+        for source, folder in locations:
+            node_id(source, folder, jobname)
+
+    conditions = []
+    producer_offsets, producers = array('i', [0]), array('i')
+    consumer_offsets, consumers = array('i', [0]), array('i')
+    for name, required in index.required.items():
+        produced = index.produced.get(name)
+        if not produced:
+            continue
+        conditions.append(name)
+        # A job adding or waiting for a condition under several ODATEs counts once
+        producers.extend(dict.fromkeys(node_id(*location)
+                                       for locations in produced.values() for location in locations))
+        consumers.extend(dict.fromkeys(node_id(*location)
+                                       for locations in required.values() for location in locations))
+        producer_offsets.append(len(producers))
+        consumer_offsets.append(len(consumers))
+    return DependencyGraph(list(folder_ids), node_folder, node_jobs, conditions, producer_offsets, producers,
+                           consumer_offsets, consumers)
+
+
+def graph_from_files(paths: List[str]) -> DependencyGraph:
+    """Parses each file and builds one graph over all of them (conditions may cross files)."""
+    from src.modify_controlm_xml import parse_xml
+    index = ConditionIndex()
+    for path in paths:
+        tree = parse_xml(path)
+        if tree is None:
+            raise ControlMXmlError(f"Could not read {path}")
+        index.source = path
+        index.visit_tree(tree.getroot())
+        del tree
+    return build_dependency_graph(index)
+
+
+def write_graph(graph: DependencyGraph, output_path: str, graph_format: Optional[str] = None,
+                partitions: Optional[int] = None) -> None:
+    """Writes graph as JSON or DOT; the format defaults to the output file's extension."""
+    if graph_format is None:
+        graph_format = 'dot' if output_path.endswith(('.dot', '.gv')) else 'json'
+    if graph_format not in GRAPH_FORMATS:
+        raise ControlMXmlError(f"Unknown graph format '{graph_format}', expected one of {', '.join(GRAPH_FORMATS)}")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        if graph_format == 'dot':
+            f.write(graph.to_dot())
+        else:
+            json.dump(graph.to_dict(partitions), f, indent=2)
+            f.write('\n')
@@ -3,3 +3,7 @@ class ControlMXmlError(Exception):
     def __init__(self, message, step=None):
         super().__init__(message)
         self.step = step
+
+    def __reduce__(self):
+        # Keeps .step when the error is raised in a worker process
+        return self.__class__, (str(self), self.step)
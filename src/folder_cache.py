@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import platform
+import tempfile
+from typing import List, Optional
+from src import xml_backend, xml_modifiers
+
+# Bump when the cached bytes would change for the same input and configuration
+CACHE_FORMAT_VERSION = 1
+
+DEFAULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+
+# The modules whose code decides the bytes cached for a folder: the rules,
+# the steps applying them and the journal they change the tree through, and
+# the parsing, serialization and keys of streamed folders
+FINGERPRINTED_MODULES = ('xml_modifiers', 'step_engine', 'rule_pack', 'change_journal', 'condition_check',
+                         'xml_backend', 'xml_writer', 'streaming', 'folder_cache')
+
+
+def _config_fingerprint() -> str:
+    """Hash of the active rules file and of the code that applies and serializes it."""
+    digest = hashlib.sha256()
+    digest.update(xml_modifiers.rules_config_hash().encode('utf-8'))
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in FINGERPRINTED_MODULES:
+        with open(os.path.join(src_dir, name + '.py'), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def run_context_digest(target_env: str, steps: List[str]) -> bytes:
+    """
+    Digest of everything besides the folder itself that determines the
+    transformed output: target env, step list (in order), configuration,
+    code, active XML backend, Python version (whose ElementTree serializes
+    the folders) and cache format.
+    """
+    context = {
+        'version': CACHE_FORMAT_VERSION,
+        'target_env': target_env,
+        'steps': list(steps),
+        'config': _config_fingerprint(),
+        'backend': xml_backend.get_backend(),
+        'python': platform.python_version(),
+    }
+    return hashlib.sha256(json.dumps(context, sort_keys=True).encode('utf-8')).digest()
+
+
+def canonical_form(element) -> bytes:
+    """
+    Encodes the parsed subtree under element (excluding its own tail):
+    every element's tag, attributes in document order, text, tail and
+    number of children, in document order. Two subtrees with the same
+    encoding serialize identically, however their source was quoted or
+    escaped. NUL and SOH cannot occur in XML 1.0, so they delimit fields.
+    """
+    parts = []
+    for node in element.iter():
+        parts.append(node.tag)
+        parts.append('\x01'.join(f"{name}\x01{value}" for name, value in node.items()))
+        parts.append(node.text or '')
+        parts.append(node.tail or '' if node is not element else '')
+        parts.append(str(len(node)))
+    return '\x00'.join(parts).encode('utf-8')
+
+
+class FolderCache:
+    """
+    On-disk cache of transformed top-level folders, keyed by a hash of the
+    folder's canonical form and the run context.
+
+    Entries are files whose modification time is refreshed on every hit;
+    evict() removes the least recently used ones until the cache fits in
+    max_bytes. Writes go through a temporary file and os.replace(), so a
+    reader never sees a partial entry.
+    """
+
+    def __init__(self, cache_dir: str, context_digest: bytes, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.context_digest = context_digest
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key_for(self, folder, frame: bytes = b'') -> str:
+        """
+        Cache key of a top-level element: a hash of the run context, of
+        frame (the start tag of the root it is written in, whose namespace
+        declarations its serialization depends on) and of the element's
+        canonical form (see canonical_form()).
+        """
+        digest = hashlib.sha256(self.context_digest)
+        digest.update(frame)
+        digest.update(canonical_form(folder))
+        return digest.hexdigest()
+
+    def _path_for(self, key: str) -> str:
+        # Fan out over subdirectories so no single directory grows too large
+        return os.path.join(self.cache_dir, key[:2], key + '.xml')
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the cached output for key, or None on a miss."""
+        path = self._path_for(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path_for(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # A cache that cannot be written only costs speed, never correctness
+            logging.warning(f"Could not write folder cache entry {path}. Details: {e}")
+
+    def evict(self) -> int:
+        """Removes least recently used entries until the cache fits in max_bytes. Returns the number removed."""
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        removed = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            logging.info(f"Evicted {removed} folder cache entries to stay under {self.max_bytes} bytes.")
+        return removed
@@ -0,0 +1,129 @@
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, or None where it is not available."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class StepMetrics:
+    """
+    Cost and effect of one step: wall and CPU time in seconds, the elements
+    the step looked at, the distinct elements it changed, the attributes it
+    set and the children it inserted or removed. changes is the step's own
+    count of the changes it made.
+    """
+    __slots__ = ('step', 'wall_time', 'cpu_time', 'elements_visited', 'elements_modified',
+                 'attributes_modified', 'children_inserted', 'children_removed', 'changes',
+                 '_last_modified')
+
+    def __init__(self, step: str):
+        self.step = step
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.elements_visited = 0
+        self.elements_modified = 0
+        self.attributes_modified = 0
+        self.children_inserted = 0
+        self.children_removed = 0
+        self.changes = 0
+        self._last_modified = None
+
+    def _touch(self, element) -> None:
+        # Steps change an element's attributes and children together, so
+        # counting runs of the same element counts each element once.
+        if element is not self._last_modified:
+            self._last_modified = element
+            self.elements_modified += 1
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__ if not name.startswith('_')}
+
+
+class MetricsRecorder:
+    """
+    Stands in for the active change journal while metrics are collected:
+    counts every change against the StepMetrics in `current` and forwards
+    it to the real journal, if there is one.
+    """
+
+    def __init__(self, journal=None):
+        self.journal = journal
+        self.current = None
+
+    def record_set(self, element, attribute, old_value, new_value) -> None:
+        if self.journal is not None:
+            self.journal.record_set(element, attribute, old_value, new_value)
+        if self.current is not None:
+            self.current.attributes_modified += 1
+            self.current._touch(element)
+
+    def record_insert(self, parent, child, index) -> None:
+        if self.journal is not None:
+            self.journal.record_insert(parent, child, index)
+        if self.current is not None:
+            self.current.children_inserted += 1
+            self.current._touch(parent)
+
+    def record_remove(self, parent, child, index) -> None:
+        if self.journal is not None:
+            self.journal.record_remove(parent, child, index)
+        if self.current is not None:
+            self.current.children_removed += 1
+            self.current._touch(parent)
+
+
+class RunMetrics:
+    """Per-step metrics and parse/write timings of one run, written out with write_json()."""
+
+    def __init__(self, **context):
+        self.context = context
+        self.timings = {}
+        self.steps: List[StepMetrics] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times the enclosed block as phase `name` (e.g. 'parse' or 'write')."""
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.timings[name] = {
+                'wall_time': time.perf_counter() - wall_start,
+                'cpu_time': time.process_time() - cpu_start,
+            }
+
+    def as_dict(self) -> Dict:
+        return {
+            **self.context,
+            'timings': self.timings,
+            'steps': [step.as_dict() for step in self.steps],
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+    def write_json(self, output_path: str) -> bool:
+        """Writes the metrics to output_path as JSON."""
+        try:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(self.as_dict(), f, indent=2)
+            logging.info(f"Wrote metrics for {len(self.steps)} steps to: {output_path}")
+            return True
+        except IOError as e:
+            logging.error(f"Could not write metrics file {output_path}. Details: {e}")
+            return False
+
+
+def timed_phase(metrics: Optional[RunMetrics], name: str):
+    """metrics.phase(name), or a no-op context when no metrics are collected."""
+    return metrics.phase(name) if metrics is not None else nullcontext()
@@ -1,36 +1,36 @@
 import xml.etree.ElementTree as ET
-import argparse
 import os
 import sys
-import copy
-from typing import Optional
+from collections import Counter
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
 import logging
-from errors import ControlMXmlError
 
+# Allow running as `python src/modify_controlm_xml.py` from the repository root
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from src.errors import ControlMXmlError
+from src.change_journal import ChangeJournal
+from src.step_engine import STEP_FUNCTION_MAP, apply_steps, split_known_steps
+from src.xml_writer import IncrementalXmlWriter, atomic_output
+from src import compression, xml_backend, xml_modifiers
 
-# Attempt to import modifier functions
-try:
-    from xml_modifiers import activate_folders
-    from xml_modifiers import apply_environment_promotion, standardize_resources, standardize_notifications
-except ImportError as e:
-    logging.warning(f"Could not import from xml_modifiers.py: {e}")
-    # Define placeholder functions if import fails
-    def activate_folders(root): print("  [Placeholder] activate_folders"); return 0
-    def apply_environment_promotion(root, env): print("  [Placeholder] apply_environment_promotion")
-    def standardize_resources(root, env): print("  [Placeholder] standardize_resources")
-    def standardize_notifications(root, env): print("  [Placeholder] standardize_notifications")
 
-
-def parse_xml(xml_path: str) -> Optional[ET.ElementTree]:
-    """Parses the input XML file."""
+def parse_xml(xml_path: str, compact: bool = False) -> Optional[ET.ElementTree]:
+    """
+    Parses the input XML file, decompressing it on the fly if it is
+    gzip, bz2 or xz compressed (see compression.input_source()); with
+    compact, sharing repeated strings (see xml_backend.parse_compact()).
+    """
     if not os.path.exists(xml_path):
         logging.error(f"Input XML file not found at {xml_path}")
         return None
     try:
-        tree = ET.parse(xml_path)
+        with compression.input_source(xml_path) as source:
+            tree = xml_backend.parse_compact(source) if compact else xml_backend.parse(source)
         return tree
-    except ET.ParseError as e:
+    except xml_backend.parse_errors() + compression.decompression_errors() as e:
         logging.error(f"Failed to parse XML file {xml_path}. Details: {e}")
         return None
     except Exception as e:
@@ -38,14 +38,10 @@ def parse_xml(xml_path: str) -> Optional[ET.ElementTree]:
         return None
 
 def write_xml(tree: ET.ElementTree, output_path: str) -> bool:
-    """Writes the XML tree to the output file."""
+    """Writes the XML tree to the output file, replacing it only once complete (see atomic_output())."""
     try:
-        output_dir = os.path.dirname(output_path)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            logging.info(f"Created output directory: {output_dir}")
-
-        tree.write(output_path, encoding='utf-8', xml_declaration=True)
+        with atomic_output(output_path) as f:
+            xml_backend.write_to(tree, f)
         logging.info(f"Successfully wrote modified XML to: {output_path}")
         return True
     except IOError as e:
@@ -55,69 +51,181 @@ def write_xml(tree: ET.ElementTree, output_path: str) -> bool:
         logging.error(f"An unexpected error occurred while writing {output_path}: {e}")
         return False
 
-def main(input_path, output_path, target_env, steps):
-    """
-    Main function to modify a Control-M XML file.
+def write_xml_bytes(data: bytes, output_path: str) -> bool:
+    """Writes an already serialized document (see xml_backend.serialize()) to the output file."""
+    try:
+        with atomic_output(output_path) as f:
+            f.write(data)
+        logging.info(f"Successfully wrote modified XML to: {output_path}")
+        return True
+    except OSError as e:
+        logging.error(f"Could not write output file {output_path}. Details: {e}")
+        return False
 
-    Args:
-        input_path (str): Path to the input XML file.
-        output_path (str): Path to the output XML file.
-        target_env (str): Target environment name.
-        steps (list): List of steps to apply in order.
+def _finish_run(steps_failed) -> bool:
+    """Logs the end of a run and returns False if any step failed."""
+    logging.info("--- XML Modification Process Finished ---")
+    if steps_failed:
+        logging.warning(f"--- WARNING: Steps Failed: {', '.join(steps_failed)} ---")
+        return False
+    return True
 
-    The steps are applied in the order provided.
-    """
-    logging.info(f"--- Starting Control-M XML Modification ---")
-    logging.info(f"Input file: {input_path}")
-    logging.info(f"Output file: {output_path}")
-    logging.info(f"Target Environment: {target_env}")
-    logging.info(f"Steps to apply: {', '.join(steps)}")
+def _transform_file_stream(input_path, output_path, target_env, steps, metrics=None, cache=None,
+                           change_set=None) -> bool:
+    """Runs the requested steps in streaming mode, one top-level FOLDER at a time."""
+    from src.streaming import stream_transform
+    steps_applied, steps_failed = split_known_steps(steps)
+    if not steps_applied:
+        logging.warning("No modification steps were successfully applied. Output file not written.")
+    elif steps_failed:
+        logging.warning(f"Some steps failed ({', '.join(steps_failed)}). Output file may be incomplete.")
+    else:
+        try:
+            if not stream_transform(input_path, output_path, target_env, steps_applied, metrics=metrics,
+                                    cache=cache, change_set=change_set):
+                return False
+        except ControlMXmlError as e:
+            logging.error(f"Error during [{e.step}] step: {e}")
+            return False
+        logging.info(f"Successfully wrote modified XML to: {output_path}")
+    return _finish_run(steps_failed)
 
-    xml_tree_original = parse_xml(input_path)
-    if xml_tree_original is None:
-        sys.exit(1)
+def _transform_file_parallel(input_path, output_path, target_env, steps, workers) -> bool:
+    """Runs the requested steps with the top-level folders spread over workers processes."""
+    from src.parallel_folders import parallel_transform
+    steps_applied, steps_failed = split_known_steps(steps)
+    if not steps_applied:
+        logging.warning("No modification steps were successfully applied. Output file not written.")
+    elif steps_failed:
+        logging.warning(f"Some steps failed ({', '.join(steps_failed)}). Output file may be incomplete.")
+    else:
+        try:
+            if not parallel_transform(input_path, output_path, target_env, steps_applied, workers):
+                return False
+        except ControlMXmlError as e:
+            logging.error(f"Error during [{e.step}] step: {e}")
+            return False
+        logging.info(f"Successfully wrote modified XML to: {output_path}")
+    return _finish_run(steps_failed)
 
-    # Work on a copy to allow sequential modifications safely
-    xml_tree_modified = copy.deepcopy(xml_tree_original)
-    root_modified = xml_tree_modified.getroot()
-
-    steps_applied_successfully = []
-    steps_failed = []
-
-    step_function_map = {
-        'promote': apply_environment_promotion,
-        'activate': activate_folders,
-        'resources': standardize_resources,
-        'notifications': standardize_notifications
-    }
-
-    # Apply steps in the user-specified order
-    for step in steps:
-        logging.info(f"Applying step: [{step}]...")
-        func = step_function_map.get(step)
-        if not func:
-            logging.error(f"Unknown step '{step}'")
-            steps_failed.append(step)
-            continue
+def _write_change_summary(change_set, input_path, output_path, target_env, steps) -> bool:
+    from src.change_set import summary_path_for
+    return change_set.write_summary(summary_path_for(output_path), input=input_path, output=output_path,
+                                    target_env=target_env, steps=list(steps))
 
-        try:
-            # Pass target_env only to functions that need it
-            if step in ['promote', 'resources', 'notifications']:
-                 func(root_modified, target_env)
+def transform_file(input_path, output_path, target_env, steps, sequential=False, stream=False,
+                   change_log_path=None, metrics_path=None, cache_dir=None, cache_max_mb=1024,
+                   changed_only=False, parallel_folders=None, compact=False) -> bool:
+    """
+    Applies the steps to a single Control-M XML file and writes the result.
+    If change_log_path is given, every change made is also written there as JSON.
+    If metrics_path is given, per-step metrics, parse and write timings and
+    the peak RSS of the run are written there as JSON.
+    If cache_dir is given, the file is processed incrementally: folders whose
+    input is unchanged since an earlier run are taken from the cache there
+    (kept under cache_max_mb by evicting the least recently used entries).
+    Incremental runs always use streaming mode.
+    If changed_only is set, only the top-level folders the steps modified
+    are written, and a summary listing them is written next to the output
+    (see summary_path_for()).
+    If parallel_folders is more than 1, the top-level folders are transformed
+    in that many processes (see parallel_transform()); the output is the same.
+    If compact is set, the file is parsed with repeated strings shared (see
+    xml_backend.parse_compact()), which always uses ElementTree.
+    A gzip, bz2 or xz compressed input is decompressed while it is parsed,
+    in every mode, and an output path ending in .gz, .bz2 or .xz is written
+    compressed (see atomic_output()).
+
+    Unlike main(), never exits the interpreter: errors are logged and
+    reported by returning False, so callers processing many files can
+    carry on with the rest.
+    """
+    if parallel_folders and parallel_folders > 1:
+        serial_only = {'--sequential': sequential, '--stream': stream, '--change-log': change_log_path,
+                       '--metrics-json': metrics_path, '--cache-dir': cache_dir, '--changed-only': changed_only,
+                       '--compact': compact}
+        used = [option for option, value in serial_only.items() if value]
+        if used:
+            logging.warning(f"--parallel-folders cannot be combined with {', '.join(used)}; running in one process.")
+        elif os.path.exists(input_path) and compression.input_format(input_path):
+            logging.warning("--parallel-folders splits the input file by byte offset, so a compressed input is "
+                            "transformed in one process.")
+        else:
+            from src.parallel_folders import matches_serial_namespaces
+            if xml_backend.get_backend() == 'etree' and not matches_serial_namespaces(input_path):
+                logging.warning("ElementTree would declare this file's namespaces differently split over "
+                                "processes, so it is transformed in one process.")
             else:
-                 func(root_modified)
-            steps_applied_successfully.append(step)
-            logging.info(f"Step [{step}] applied.")
-        except ControlMXmlError as e:
-            logging.error(f"Custom error during [{step}] step: {e}")
-            steps_failed.append(step)
-            logging.error("Exiting due to error in modification step.")
-            sys.exit(1)
-        except Exception as e:
-            logging.error(f"Error during [{step}] step: {e}")
-            steps_failed.append(step)
-            logging.error("Exiting due to error in modification step.")
-            sys.exit(1)
+                return _transform_file_parallel(input_path, output_path, target_env, steps, parallel_folders)
+
+    cache = None
+    if cache_dir and 'validate' in steps:
+        logging.warning("The validate step has to see every folder, so --cache-dir is ignored.")
+        cache_dir = None
+    if cache_dir:
+        from src.folder_cache import FolderCache, run_context_digest
+        if not stream:
+            logging.info("Incremental mode processes the file in streaming mode.")
+            stream = True
+        cache = FolderCache(cache_dir, run_context_digest(target_env, steps), max_bytes=cache_max_mb * 1024 * 1024)
+
+    change_set = None
+    if changed_only:
+        if cache is not None:
+            logging.warning("Cached folders are not transformed, so --changed-only is ignored with --cache-dir.")
+        else:
+            from src.change_set import ChangeSet
+            change_set = ChangeSet()
+
+    metrics = None
+    if metrics_path:
+        from src.metrics import RunMetrics
+        metrics = RunMetrics(
+            input=input_path, output=output_path, target_env=target_env,
+            backend='etree' if stream or compact else xml_backend.get_backend(),
+            mode='stream' if stream else ('sequential' if sequential else 'fused'),
+        )
+
+    if stream:
+        if change_log_path:
+            logging.warning("A change log is not available in streaming mode; --change-log ignored.")
+        if compact:
+            logging.info("Streaming mode only holds one folder at a time; --compact ignored.")
+        ok = _transform_file_stream(input_path, output_path, target_env, steps, metrics=metrics, cache=cache,
+                                    change_set=change_set)
+        if cache is not None:
+            cache.evict()
+        if not ok:
+            return False
+        if change_set is not None and not _write_change_summary(change_set, input_path, output_path, target_env, steps):
+            return False
+        return metrics is None or metrics.write_json(metrics_path)
+
+    with metrics.phase('parse') if metrics is not None else nullcontext():
+        xml_tree = parse_xml(input_path, compact=compact)
+    if xml_tree is None:
+        return False
+    root = xml_tree.getroot()
+    source_names = [top.get('FOLDER_NAME') for top in root] if change_set is not None else None
+
+    # Each top-level folder is written as soon as it is transformed, unless
+    # the output depends on the whole run or its write is timed on its own
+    writer = None
+    if change_set is None and metrics is None and all(step in STEP_FUNCTION_MAP for step in steps):
+        writer = IncrementalXmlWriter(xml_tree, output_path)
+
+    # Modify in place; the journal restores the tree if a step fails
+    journal = ChangeJournal()
+    try:
+        steps_applied_successfully, steps_failed = apply_steps(
+            root, steps, target_env, sequential=sequential, journal=journal, metrics=metrics,
+            top_level_done=writer.write_element if writer is not None else None
+        )
+    except ControlMXmlError as e:
+        if writer is not None:
+            writer.discard()
+        logging.error(f"Error during [{e.step}] step: {e}")
+        return False
 
     # Write the final result
     if not steps_applied_successfully:
@@ -126,15 +234,242 @@ def main(input_path, output_path, target_env, steps):
          logging.warning(f"Some steps failed ({', '.join(steps_failed)}). Output file may be incomplete.")
     else:
         logging.info(f"Writing final modified XML after steps: {', '.join(steps_applied_successfully)}")
-        if not write_xml(xml_tree_modified, output_path):
-            sys.exit(1)
+        if change_set is not None:
+            change_set.drop_unchanged(root, journal, source_names)
+        if writer is not None:
+            written = writer.finish()
+        else:
+            with metrics.phase('write') if metrics is not None else nullcontext():
+                written = write_xml(xml_tree, output_path)
+        if not written:
+            return False
+        if change_log_path and not journal.write_json(root, change_log_path):
+            return False
+        if change_set is not None and not _write_change_summary(change_set, input_path, output_path, target_env, steps):
+            return False
+        if metrics is not None and not metrics.write_json(metrics_path):
+            return False
 
-    logging.info("--- XML Modification Process Finished ---")
+    return _finish_run(steps_failed)
+
+def _fan_out_order(target_envs: List[str]) -> List[Tuple[str, Optional[str]]]:
+    """
+    Orders target_envs so each comes after the requested target it is
+    promoted from ('promotes_from' in the rules), pairing each with that
+    target, or with None when it starts from the input file instead.
+    """
+    source_of = {}
+    for target_env in target_envs:
+        source_env = xml_modifiers.ENV_CONFIG.get(target_env, {}).get('promotes_from')
+        source_of[target_env] = source_env if source_env in target_envs and source_env != target_env else None
+
+    ordered = []
+    pending = list(source_of)
+    while pending:
+        done = {target_env for target_env, _ in ordered}
+        ready = [target_env for target_env in pending if source_of[target_env] in done or source_of[target_env] is None]
+        if not ready:
+            raise ControlMXmlError(f"The promotion chain between {', '.join(pending)} has a cycle.")
+        ordered.extend((target_env, source_of[target_env]) for target_env in ready)
+        pending = [target_env for target_env in pending if target_env not in ready]
+    return ordered
+
+def transform_file_targets(input_path, output_paths: Dict[str, str], steps, sequential=False, compact=False) -> bool:
+    """
+    Applies the steps for several target environments to one input file,
+    parsing it only once. output_paths maps each target env to its output.
+
+    Targets follow the promotion chain: a target promoted from another
+    requested target (e.g. prod from preprod) starts from that target's
+    result rather than from the input, exactly as if the first output were
+    run through the tool again. A tree is only copied when more than one
+    target starts from it; otherwise the next target modifies it in place
+    once it has been serialized. The serialized outputs are written to
+    disk concurrently. compact is as for transform_file().
+
+    Like transform_file(), never exits the interpreter: returns False if
+    any target failed. The other targets are still written.
+    """
+    # Only fan-out runs need these; single-target runs do not pay for loading them
+    import copy
+    from concurrent.futures import ThreadPoolExecutor
+    steps_applied, steps_failed = split_known_steps(steps)
+    if not steps_applied:
+        logging.warning("No modification steps were successfully applied. Output files not written.")
+        return _finish_run(steps_failed)
     if steps_failed:
-        logging.warning(f"--- WARNING: Steps Failed: {', '.join(steps_failed)} ---")
+        logging.warning(f"Some steps failed ({', '.join(steps_failed)}). Output files not written.")
+        return _finish_run(steps_failed)
+    try:
+        order = _fan_out_order(list(output_paths))
+    except ControlMXmlError as e:
+        logging.error(str(e))
+        return False
+
+    xml_tree = parse_xml(input_path, compact=compact)
+    if xml_tree is None:
+        return False
+
+    # Number of targets still to start from each tree; None is the parsed input
+    remaining_uses = Counter(source_env for _, source_env in order)
+    trees = {None: xml_tree}
+    targets_failed = []
+    with ThreadPoolExecutor(max_workers=len(order)) as writer:
+        writes = []
+        for target_env, source_env in order:
+            if source_env not in trees:
+                logging.error(f"Skipping target '{target_env}': target '{source_env}' it is promoted from failed.")
+                targets_failed.append(target_env)
+                continue
+            logging.info(f"--- Target: {target_env} (from {source_env or input_path}) ---")
+            remaining_uses[source_env] -= 1
+            tree = copy.deepcopy(trees[source_env]) if remaining_uses[source_env] else trees.pop(source_env)
+            try:
+                apply_steps(tree.getroot(), steps_applied, target_env, sequential=sequential)
+            except ControlMXmlError as e:
+                logging.error(f"Error during [{e.step}] step for target '{target_env}': {e}")
+                targets_failed.append(target_env)
+                continue
+            writes.append((target_env, writer.submit(write_xml_bytes, xml_backend.serialize(tree),
+                                                     output_paths[target_env])))
+            if remaining_uses[target_env]:
+                trees[target_env] = tree
+        targets_failed.extend(target_env for target_env, write in writes if not write.result())
+
+    if targets_failed:
+        logging.warning(f"--- WARNING: Targets Failed: {', '.join(targets_failed)} ---")
+    return _finish_run([]) and not targets_failed
+
+# Exit status of --check, as for diff: 0 when nothing would change
+CHECK_EXIT_PENDING = 1
+CHECK_EXIT_ERROR = 2
+
+def run_check(input_path, target_env, steps, report_path=None) -> int:
+    """
+    Reports what applying steps to input_path for target_env would change,
+    per step and per top-level folder, without writing any output (see
+    check_file()). If report_path is given, the report is also written
+    there as JSON. Returns the exit status of --check: 0 if nothing would
+    change, CHECK_EXIT_PENDING if changes are pending or a validate step's
+    condition check failed, and CHECK_EXIT_ERROR if the check could not be
+    completed.
+    """
+    from src.check import check_file
+    steps_applied, steps_failed = split_known_steps(steps)
+    if steps_failed or not steps_applied:
+        return CHECK_EXIT_ERROR
+    checks = nullcontext([])
+    if 'validate' in steps_applied:
+        from src.condition_check import recording_failures
+        checks = recording_failures()
+    try:
+        with checks as failed_checks:
+            report = check_file(input_path, target_env, steps_applied)
+    except ControlMXmlError as e:
+        logging.error(f"Error during [{e.step}] step: {e}")
+        return CHECK_EXIT_ERROR
+    if report is None:
+        return CHECK_EXIT_ERROR
+    report.condition_check_failed = bool(failed_checks)
+    report.log()
+    if report_path and not report.write_json(report_path):
+        return CHECK_EXIT_ERROR
+    return CHECK_EXIT_PENDING if report.pending or report.condition_check_failed else 0
+
+def main(input_path, output_path, target_env, steps, sequential=False, stream=False, change_log=None,
+         metrics_json=None, cache_dir=None, cache_max_mb=1024, changed_only=False, parallel_folders=None,
+         compact=False, check=False, check_report=None):
+    """
+    Main function to modify a Control-M XML file.
+
+    Args:
+        input_path (str): Path to the input XML file.
+        output_path (str or list): Path to the output XML file, or one path
+            per target environment.
+        target_env (str or list): Target environment name. With several,
+            the input is parsed once and fanned out to every target (see
+            transform_file_targets()).
+        steps (list): List of steps to apply in order.
+        sequential (bool): Walk the tree once per step instead of applying
+            all steps in a single pass.
+        stream (bool): Read, modify and write one top-level FOLDER at a time
+            instead of loading the whole document. Always uses a single pass.
+        change_log (str): Optional path for a JSON log of every change made.
+        metrics_json (str): Optional path for JSON metrics: wall and CPU time,
+            elements visited and modified per step, parse and write timings
+            and peak RSS.
+        cache_dir (str): Optional folder cache directory for incremental runs:
+            unchanged folders are copied from the cache instead of transformed.
+        cache_max_mb (int): Size limit of the folder cache in MB.
+        changed_only (bool): Write only the folders the steps modified, plus
+            a JSON summary of them next to the output file.
+        parallel_folders (int): Transform the top-level folders in this many
+            processes. The output is the same as a serial run.
+        compact (bool): Share repeated attribute values, texts and tails
+            while parsing, for a much smaller tree. Always uses ElementTree.
+        check (bool): Only report the changes the steps would make, per step
+            and per folder, and exit with CHECK_EXIT_PENDING if there are
+            any or a validate step's check fails (see run_check()). Nothing
+            is written; output_path may be None.
+        check_report (str): Optional path for the --check report as JSON.
+
+    The steps are applied in the order provided.
+    """
+    logging.info(f"--- Starting Control-M XML Modification ---")
+    logging.info(f"Input file: {input_path}")
+    logging.info(f"Output file: {output_path}")
+    logging.info(f"Target Environment: {target_env}")
+    logging.info(f"Steps to apply: {', '.join(steps)}")
+
+    if check:
+        unused = {'--sequential': sequential, '--stream': stream, '--change-log': change_log,
+                  '--metrics-json': metrics_json, '--cache-dir': cache_dir, '--changed-only': changed_only,
+                  '--parallel-folders': parallel_folders, '--compact': compact}
+        used = [option for option, value in unused.items() if value]
+        if used:
+            logging.warning(f"--check makes one read-only pass and writes no output; {', '.join(used)} ignored.")
+        sys.exit(run_check(input_path, target_env if isinstance(target_env, str) else target_env[0], steps,
+                           report_path=check_report))
+
+    if not run_transform(input_path, output_path, target_env, steps, sequential=sequential, stream=stream,
+                         change_log=change_log, metrics_json=metrics_json, cache_dir=cache_dir,
+                         cache_max_mb=cache_max_mb, changed_only=changed_only, parallel_folders=parallel_folders,
+                         compact=compact):
         sys.exit(1)
 
+def run_transform(input_path, output_path, target_env, steps, sequential=False, stream=False, change_log=None,
+                  metrics_json=None, cache_dir=None, cache_max_mb=1024, changed_only=False,
+                  parallel_folders=None, compact=False) -> bool:
+    """
+    Does the work of main() (same arguments) and returns whether it
+    succeeded instead of exiting. Used by main() and by the daemon.
+    A validate step whose check finds dangling INCONDs or duplicate
+    JOBNAMEs fails the run, though the output is still written.
+    """
+    target_envs = [target_env] if isinstance(target_env, str) else list(target_env)
+    output_paths = [output_path] if isinstance(output_path, str) else list(output_path)
+    checks = nullcontext([])
+    if 'validate' in steps:
+        from src.condition_check import recording_failures
+        checks = recording_failures()
+    with checks as failed_checks:
+        if len(target_envs) > 1:
+            ok = transform_file_targets(input_path, dict(zip(target_envs, output_paths)), steps,
+                                        sequential=sequential, compact=compact)
+        else:
+            ok = transform_file(input_path, output_paths[0], target_envs[0], steps, sequential=sequential,
+                                stream=stream, change_log_path=change_log, metrics_path=metrics_json,
+                                cache_dir=cache_dir, cache_max_mb=cache_max_mb, changed_only=changed_only,
+                                parallel_folders=parallel_folders, compact=compact)
+    if failed_checks:
+        logging.warning("--- WARNING: Condition check failed (see above) ---")
+        return False
+    return ok
+
 if __name__ == "__main__":
+    # Only needed when run as a script; the same arguments as cli.py, always run in this process
+    from src.cli import build_parser, check_args, run_in_process
+
     # Setup logging
     logging.basicConfig(
         level=logging.INFO,
@@ -142,32 +477,7 @@ if __name__ == "__main__":
         handlers=[logging.StreamHandler(sys.stdout)]
     )
 
-    parser = argparse.ArgumentParser(
-        description="Modify Control-M XML definitions for environment promotion and standardization.",
-        formatter_class=argparse.RawTextHelpFormatter
-    )
-    parser.add_argument("-i", "--input", required=True, help="Path to the input Control-M XML file.")
-    parser.add_argument("-o", "--output", required=True, help="Path for the output modified XML file.")
-    parser.add_argument(
-        "-t", "--target-env",
-        required=True,
-        choices=['dev', 'preprod', 'prod'],
-        help="Target environment ('dev', 'preprod', or 'prod'). Needed for env-specific steps."
-    )
-    parser.add_argument(
-        "-s", "--steps",
-        required=True,
-        nargs='+',
-        choices=['promote', 'activate', 'resources', 'notifications'],
-        help=(
-            "Modification steps to apply (space-separated):\n"
-            "  promote       : Update env-specific attributes.\n"
-            "  activate      : Set FOLDER_ORDER_METHOD='SYSTEM'.\n"
-            "  resources     : Standardize QUANTITATIVE resources.\n"
-            "  notifications : Standardize ON blocks."
-        )
-    )
-
+    parser = build_parser(daemon=False)
     args = parser.parse_args()
-
-    main(args.input, args.output, args.target_env, args.steps)
+    check_args(parser, args)
+    run_in_process(parser, args)
@@ -0,0 +1,332 @@
+import xml.etree.ElementTree as ET
+import os
+import re
+import logging
+import mmap
+import pyexpat
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+from src.condition_check import ConditionIndex, collecting, start_validation, finish_validation
+from src.errors import ControlMXmlError
+from src.step_engine import compile_step_visitors, apply_visitors_to_children
+from src.xml_backend import XML_DECLARATION
+from src.xml_writer import RootFrame, atomic_output, _escape_text
+from src import xml_backend, xml_modifiers
+
+# Top-level elements are sent to the workers in chunks of about this many
+# input bytes: large enough that scheduling is noise, small enough that
+# thousands of folders spread evenly over the workers
+CHUNK_BYTES = 1024 * 1024
+# Chunks queued per worker before the parent waits for the oldest to be written
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+# Element the top-level elements are parsed inside when the root declares namespaces
+_CHUNK_TAG = 'CONTROLM_CHUNK'
+# A start or end tag, with '>' allowed inside quoted attribute values
+_TAG = re.compile(rb'<[^>"\']*(?:(?:"[^"]*"|\'[^\']*\')[^>"\']*)*>')
+
+
+class _Mismatch(Exception):
+    """Stops matches_serial_namespaces() at the first declaration it cannot keep."""
+
+
+def matches_serial_namespaces(input_path: str) -> bool:
+    """
+    Whether a parallel ElementTree run declares the namespaces of the XML
+    file at input_path as a serial one does. write() declares the
+    namespaces a document uses on its root, numbered as it meets them,
+    while the parallel run keeps the root's own declarations (see
+    RootFrame) and lets a top-level element declare one the root does not.
+    They agree when the root uses every namespace it declares in its own
+    start tag and no element below it declares any. Only the root's start
+    tag is seen from Python; the rest is left to expat. An unreadable or
+    malformed file counts as matching, for the run to report.
+    """
+    parser = pyexpat.ParserCreate(namespace_separator='}')
+    declared = []
+
+    def declare(prefix, uri):
+        if parser.StartElementHandler is None:
+            raise _Mismatch()
+        declared.append(uri)
+
+    def root_start(name, attributes):
+        used = {qname.split('}')[0] for qname in [name] + list(attributes) if '}' in qname}
+        if not used.issuperset(declared):
+            raise _Mismatch()
+        parser.StartElementHandler = None
+    parser.StartNamespaceDeclHandler = declare
+    parser.StartElementHandler = root_start
+    try:
+        with open(input_path, 'rb') as f:
+            parser.ParseFile(f)
+    except _Mismatch:
+        return False
+    except (pyexpat.ExpatError, OSError):
+        pass
+    return True
+
+
+def _init_worker(backend: str, environments: dict, config_hash: str) -> None:
+    """Runs once in each worker: quiet logging and the parent's backend and active rules."""
+    logging.getLogger().setLevel(logging.WARNING)
+    xml_backend.set_backend(backend)
+    xml_modifiers.use_rule_pack({'environments': environments, 'config_hash': config_hash})
+
+
+def _chunk_wrapper(encoding: Optional[str], namespaces: List[Tuple[str, str]]) -> Tuple[bytes, bytes]:
+    """
+    The bytes to parse a top-level element between: the input's XML
+    declaration, if it has one, and an element declaring the root's
+    namespaces, so their prefixes are bound as in the whole document.
+    """
+    declaration = f'<?xml version="1.0" encoding="{encoding}"?>'.encode('ascii') if encoding else b''
+    if not namespaces:
+        return declaration, b''
+    attributes = ''
+    for prefix, uri in namespaces:
+        name = f'xmlns:{prefix}' if prefix else 'xmlns'
+        attributes += f' {name}="' + _escape_text(uri).replace('"', '&quot;') + '"'
+    start_tag = f'<{_CHUNK_TAG}{attributes}>'.encode(encoding or 'utf-8', errors='xmlcharrefreplace')
+    return declaration + start_tag, f'</{_CHUNK_TAG}>'.encode('ascii')
+
+
+def _transform_chunk(input_path: str, encoding: Optional[str], root: Tuple[str, dict, List[Tuple[str, str]]],
+                     ranges: List[Tuple[int, int]], target_env: str, steps: List[str]):
+    """
+    Worker side: reads the top-level elements at the given byte ranges of
+    the input, parses each with the active backend below the root's
+    namespace declarations, applies the steps in one pass and serializes
+    them again as the backend's write() would inside the root, given as
+    (tag, attributes, namespaces declared on it). Returns (serialized
+    elements, changes per step, ConditionIndex when validating, else None).
+    """
+    first = ranges[0][0]
+    with open(input_path, 'rb') as f:
+        f.seek(first)
+        data = f.read(ranges[-1][1] - first)
+    tag, attrib, namespaces = root
+    head, end = _chunk_wrapper(encoding, namespaces)
+    elements = []
+    for start, stop in ranges:
+        try:
+            element = xml_backend.fromstring(head + data[start - first:stop - first] + end)
+        except xml_backend.parse_errors() as e:
+            # e.g. an entity only declared for the whole document
+            raise ControlMXmlError(f"The top-level element at byte {start} cannot be parsed on its own ({e}); "
+                                   f"run without --parallel-folders.")
+        elements.append(element[0] if end else element)
+    index = ConditionIndex(source=input_path) if 'validate' in steps else None
+    with collecting(index):
+        visitors = compile_step_visitors(steps, target_env)
+        apply_visitors_to_children(elements, visitors)
+    frame = RootFrame(tag, attrib, namespaces=namespaces)
+    return [frame.serialize(element, with_tail=False) for element in elements], \
+        {visitor.step: visitor.changes for visitor in visitors}, index
+
+
+def _element_name(name: str) -> str:
+    # expat reports 'uri}local' with namespace_separator='}'; ElementTree uses '{uri}local'
+    return '{' + name if '}' in name else name
+
+
+class _TopLevelSplitter:
+    """
+    expat handlers that find the byte range of each top-level element of a
+    document without building it, plus the root's tag, attributes, text and
+    namespace declarations and the tail of each top-level element, decoded as a parser would.
+    Ranges are sent to the pool in chunks as they are found, and finished
+    chunks are written in order.
+    """
+
+    def __init__(self, input_path, data, out, executor, workers, target_env, steps, on_result):
+        self.input_path = input_path
+        self.data = data
+        self.out = out
+        self.executor = executor
+        self.workers = workers
+        self.target_env = target_env
+        self.steps = steps
+        self.on_result = on_result
+        self.parser = None
+        self.encoding = None
+        self.depth = 0
+        self.root = None
+        # Namespaces declared on the root, as (prefix, uri); '' is the default namespace
+        self.namespaces = []
+        self.frame = None
+        self.element_start = None
+        self.text = []
+        # Tails of the chunk holding the last top-level element read; its tail is the last entry
+        self.last_tails = None
+        self.ranges, self.tails, self.chunk_size = [], [], 0
+        # Each entry: (future, tails of its elements)
+        self.pending = deque()
+        self.elements = 0
+        self.chunks = 0
+
+    def parse(self, f) -> None:
+        # The same expat settings as ElementTree's parser, so names and attributes match
+        self.parser = pyexpat.ParserCreate(namespace_separator='}')
+        self.parser.buffer_text = True
+        self.parser.ordered_attributes = True
+        self.parser.specified_attributes = True
+        self.parser.XmlDeclHandler = self.xml_declaration
+        self.parser.StartNamespaceDeclHandler = self.start_namespace
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.characters
+        self.parser.ParseFile(f)
+
+    def xml_declaration(self, version, encoding, standalone):
+        self.encoding = encoding
+
+    def start_namespace(self, prefix, uri):
+        if self.depth == 0:
+            self.namespaces.append((prefix or '', uri))
+
+    def characters(self, text):
+        if self.depth == 1:
+            self.text.append(text)
+
+    def take_text(self) -> Optional[str]:
+        text, self.text = ''.join(self.text) or None, []
+        return text
+
+    def start(self, name, attributes):
+        self.depth += 1
+        if self.depth == 1:
+            attrib = {_element_name(attributes[i]): attributes[i + 1] for i in range(0, len(attributes), 2)}
+            self.root = ET.Element(_element_name(name), attrib)
+        elif self.depth == 2:
+            # The root's text, or the previous top-level element's tail, is complete now
+            if self.frame is None:
+                self.frame = RootFrame(self.root.tag, self.root.attrib, self.take_text(), self.namespaces)
+                self.out.write(XML_DECLARATION + self.frame.start_tag)
+            else:
+                self.last_tails[-1] = self.take_text()
+            self.element_start = self.parser.CurrentByteIndex
+
+    def end(self, name):
+        if self.depth == 2:
+            start_tag = _TAG.match(self.data, self.element_start)
+            if start_tag.group().endswith(b'/>'):
+                end = start_tag.end()
+            else:
+                # expat is at the start of the end tag
+                end = _TAG.match(self.data, self.parser.CurrentByteIndex).end()
+            self.ranges.append((self.element_start, end))
+            self.tails.append(None)
+            self.last_tails = self.tails
+            self.chunk_size += end - self.element_start
+            self.elements += 1
+            if self.chunk_size >= CHUNK_BYTES:
+                self.submit()
+                # The newest chunk may still miss its last tail, so it is never written here
+                while len(self.pending) > self.workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                    self.write_oldest()
+        elif self.depth == 1:
+            if self.frame is None:
+                frame = RootFrame(self.root.tag, self.root.attrib, self.take_text(), self.namespaces)
+                self.out.write(XML_DECLARATION + frame.childless)
+            else:
+                self.last_tails[-1] = self.take_text()
+                self.submit()
+                while self.pending:
+                    self.write_oldest()
+                self.out.write(self.frame.end_tag)
+        self.depth -= 1
+
+    def submit(self):
+        if not self.ranges:
+            return
+        root = (self.root.tag, self.root.attrib, self.namespaces)
+        future = self.executor.submit(_transform_chunk, self.input_path, self.encoding, root, self.ranges,
+                                      self.target_env, self.steps)
+        self.pending.append((future, self.tails))
+        self.chunks += 1
+        self.ranges, self.tails, self.chunk_size = [], [], 0
+
+    def write_oldest(self):
+        future, tails = self.pending.popleft()
+        serialized_elements, changes, index = future.result()
+        for serialized, tail in zip(serialized_elements, tails):
+            self.out.write(serialized)
+            if tail:
+                self.out.write(_escape_text(tail).encode('utf-8'))
+        self.on_result(changes, index)
+
+
+def parallel_transform(input_path: str, output_path: str, target_env: str, steps: List[str], workers: int) -> bool:
+    """
+    Applies steps to a Control-M XML file with its top-level FOLDERs spread
+    over workers processes.
+
+    The parent only scans the input with expat for the byte range of each
+    top-level element and sends the ranges to a process pool in chunks of
+    about CHUNK_BYTES; each worker reads and parses its ranges itself, so
+    the parent never builds or serializes the folders. The workers parse
+    and serialize with the active backend, and the transformed chunks are
+    written in input order between the backend's serialization of the root
+    tags, with the tails decoded from the input. Each range is parsed below
+    the namespace declarations of the root, so a folder may use a prefix
+    declared on DEFTABLE; the root keeps them, as in streaming mode (see
+    RootFrame). The output is byte for byte that of a serial run; with
+    ElementTree, transform_file() only gets here for files whose namespace
+    declarations allow that (see matches_serial_namespaces()). At most CHUNKS_IN_FLIGHT_PER_WORKER chunks per
+    worker are pending at a time, so memory stays bounded as in streaming
+    mode. As there, output_path is only replaced once the output is complete.
+
+    Every step is folder-local except validate; its workers index their
+    chunks and the parent checks the merged index.
+
+    Raises ControlMXmlError if a step fails. Returns False on I/O or parse errors.
+    """
+    if not os.path.exists(input_path):
+        logging.error(f"Input XML file not found at {input_path}")
+        return False
+    # Fail on configuration errors here rather than once per chunk
+    step_changes = {visitor.step: 0 for visitor in compile_step_visitors(steps, target_env)}
+    conditions = start_validation() if 'validate' in step_changes else None
+
+    def add_result(changes, index):
+        for step, count in changes.items():
+            step_changes[step] += count
+        if index is not None:
+            conditions.merge(index)
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(xml_backend.get_backend(), xml_modifiers.ENV_CONFIG,
+                                             xml_modifiers.rules_config_hash()))
+    splitter = None
+    try:
+        with open(input_path, 'rb') as f, atomic_output(output_path) as out:
+            # Random access for finding the end of each top-level element
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(input_path) else b''
+            try:
+                splitter = _TopLevelSplitter(input_path, data, out, executor, workers, target_env, steps, add_result)
+                splitter.parse(f)
+            finally:
+                if data:
+                    data.close()
+    except pyexpat.ExpatError as e:
+        logging.error(f"Failed to parse XML file {input_path}. Details: {e}")
+        return False
+    except IOError as e:
+        logging.error(f"Could not write output file {output_path}. Details: {e}")
+        return False
+    finally:
+        # Chunks not yet started after an error are dropped (shutdown()'s cancel_futures needs Python 3.9)
+        if splitter is not None:
+            for future, _ in splitter.pending:
+                future.cancel()
+        executor.shutdown(wait=True)
+
+    if conditions is not None:
+        finish_validation(conditions)
+    for step, count in step_changes.items():
+        logging.info(f"Step [{step}] applied ({count} changes).")
+    logging.info(f"Transformed {splitter.elements} top-level elements in {splitter.chunks} chunks "
+                 f"on {workers} processes to: {output_path}")
+    return True
@@ -0,0 +1,141 @@
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+from typing import Optional
+from src.errors import ControlMXmlError
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'default_rules.json')
+
+# Environment settings holding regular expressions; they are matched case-insensitively
+PATTERN_KEYS = ('env_tag_pattern', 'datacenter_pattern')
+
+
+def parse_config(data: bytes, config_path: str) -> dict:
+    """Parses the rules file contents: TOML for a .toml path, JSON otherwise."""
+    try:
+        if config_path.lower().endswith('.toml'):
+            try:
+                import tomllib  # only TOML rules files pay for importing it
+            except ImportError:
+                raise ControlMXmlError(f"Reading TOML rules ({config_path}) needs Python 3.11 or later.")
+            return tomllib.loads(data.decode('utf-8'))
+        return json.loads(data.decode('utf-8'))
+    except ControlMXmlError:
+        raise
+    except Exception as e:
+        raise ControlMXmlError(f"Could not parse rules file {config_path}. Details: {e}")
+
+
+def compile_pattern(name: str, env_cfg: dict, key: str):
+    """Compiles one of the PATTERN_KEYS settings of an environment, or returns None if it is unset."""
+    if not env_cfg.get(key):
+        return None
+    try:
+        return re.compile(env_cfg[key], re.IGNORECASE)
+    except re.error as e:
+        raise ControlMXmlError(f"Invalid {key} for environment '{name}'. Details: {e}")
+
+
+def parse_notification_template(name: str, env_cfg: dict) -> list:
+    """
+    Formats an environment's notification template ({dest} and {urgency}
+    placeholders) and parses it into its ON elements. The template is a
+    string or a list of lines.
+    """
+    template = env_cfg['notification_template']
+    if isinstance(template, list):
+        template = '\n'.join(template)
+    formatted_template = template.format(
+        dest=env_cfg.get('notification_dest', 'default_dest@example.com'),
+        urgency=env_cfg.get('remedy_urgency', 'M')
+    )
+    try:
+        root_wrapper = ET.fromstring(f"<root>{formatted_template.strip()}</root>")
+    except ET.ParseError as e:
+        raise ControlMXmlError(f"Invalid notification template for environment '{name}'. Details: {e}")
+    return list(root_wrapper)
+
+
+def compile_promotion_patterns(source_name: str, source_cfg: dict, target_cfg: dict) -> dict:
+    """Extract and compile patterns and replacements for environment promotion."""
+    source_user_suffix = source_cfg.get('user_suffix')
+    source_user_pattern = re.compile(re.escape(source_user_suffix) + r'$', re.IGNORECASE) if source_user_suffix is not None else None
+    source_node_env_id = source_cfg.get('node_env_id')
+    source_node_pattern = re.compile(rf"(.*?)({re.escape(source_node_env_id)})(.*)", re.IGNORECASE) if source_node_env_id else None
+
+    return {
+        'source_tag_pattern': compile_pattern(source_name, source_cfg, 'env_tag_pattern'),
+        'source_user_pattern': source_user_pattern,
+        'source_node_pattern': source_node_pattern,
+        'source_dc_pattern': compile_pattern(source_name, source_cfg, 'datacenter_pattern'),
+        'target_tag_replace': target_cfg.get('env_tag_replacement', ''),
+        'target_user_suffix': target_cfg.get('user_suffix', ''),
+        'target_node_env_id': target_cfg.get('node_env_id', ''),
+        'target_dc_replace': target_cfg.get('datacenter_replacement', ''),
+        'job_suffix_remove': target_cfg.get('job_suffix_to_remove', ''),
+        'job_suffix_add': target_cfg.get('job_suffix_to_add', '')
+    }
+
+
+def validate_rules_config(config: dict) -> dict:
+    """
+    Checks a parsed rules config by compiling every environment's patterns,
+    notification template and promotion patterns once, and returns its
+    rule pack: 'environments' holds the settings per environment as
+    written, not what was compiled from them, which is discarded. Runs
+    compile what they use on first use, per environment (see
+    xml_modifiers), so they never pay for environments they do not touch.
+    Raises ControlMXmlError if the config is invalid.
+    """
+    environments = config.get('environments') if isinstance(config, dict) else None
+    if not isinstance(environments, dict) or not environments:
+        raise ControlMXmlError("Rules config needs a non-empty 'environments' table.")
+
+    for name, env_cfg in environments.items():
+        if not isinstance(env_cfg, dict):
+            raise ControlMXmlError(f"Environment '{name}' must be a table of settings.")
+    for name, env_cfg in environments.items():
+        for key in PATTERN_KEYS:
+            compile_pattern(name, env_cfg, key)
+        if env_cfg.get('notification_template'):
+            parse_notification_template(name, env_cfg)
+        source_env = env_cfg.get('promotes_from')
+        if source_env:
+            if source_env not in environments:
+                raise ControlMXmlError(f"Environment '{name}' promotes from unknown environment '{source_env}'.")
+            compile_promotion_patterns(source_env, environments[source_env], env_cfg)
+
+    return {'environments': environments}
+
+
+def config_hash_for(data: bytes) -> str:
+    """Identifies a rules file by its contents, for keys of caches built with its rules (see folder_cache)."""
+    import hashlib  # only runs that need the hash pay for loading it
+    return hashlib.sha256(data).hexdigest()
+
+
+def config_hash_of(pack: dict) -> str:
+    """The config hash of a rule pack, computed from its 'source' the first time it is asked for."""
+    if 'config_hash' not in pack:
+        pack['config_hash'] = config_hash_for(pack['source'])
+    return pack['config_hash']
+
+
+def load_rule_pack(config_path: Optional[str] = None) -> dict:
+    """
+    Reads, parses and validates the rules file at config_path (default:
+    src/default_rules.json) and returns its rule pack, with the file's
+    contents as 'source' (see config_hash_of()). Nothing is cached between
+    runs: the compiled rules are built per environment, on first use, by
+    the run that needs them (see xml_modifiers).
+    """
+    config_path = config_path or DEFAULT_CONFIG_PATH
+    try:
+        with open(config_path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        raise ControlMXmlError(f"Could not read rules file {config_path}. Details: {e}")
+    pack = validate_rules_config(parse_config(data, config_path))
+    pack['source'] = data
+    return pack
@@ -0,0 +1,412 @@
+import xml.etree.ElementTree as ET
+import logging
+import time
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+from src.errors import ControlMXmlError
+from src.change_journal import ChangeJournal, recording
+from src.xml_modifiers import (
+    activate_folders,
+    apply_environment_promotion,
+    standardize_resources,
+    standardize_notifications,
+    _update_folder_order_method,
+    _promote_element,
+    _compile_promotion_dispatch,
+    _get_promotion_patterns_for_target,
+    _get_promotion_memo,
+    promotion_memo_counts,
+    _standardize_job_resources,
+    _get_target_resource_names,
+    _standardize_job_notifications,
+    _get_notification_template,
+    _compile_notification_factory,
+)
+
+# Runs that collect no metrics or do not validate never import these
+if TYPE_CHECKING:
+    from src.metrics import MetricsRecorder, RunMetrics, StepMetrics
+
+# --- Step Registry ---
+
+def _validate_conditions(root: ET.Element) -> int:
+    from src.condition_check import validate_conditions
+    return validate_conditions(root)
+
+STEP_FUNCTION_MAP = {
+    'promote': apply_environment_promotion,
+    'activate': activate_folders,
+    'resources': standardize_resources,
+    'notifications': standardize_notifications,
+    'validate': _validate_conditions
+}
+
+# Steps whose functions take the target environment as second argument
+ENV_STEPS = ['promote', 'resources', 'notifications']
+
+# Elements each step looks at: the tags it handles (None = every element)
+# and whether only direct children of the root are considered
+STEP_SCOPES = {
+    'promote': {},
+    'activate': {'tags': ('FOLDER',), 'top_level_only': True},
+    'resources': {'tags': ('JOB',)},
+    'notifications': {'tags': ('JOB',)},
+    # condition_check's CONDITION_OWNER_TAGS | CONDITION_TAGS
+    'validate': {'tags': ('FOLDER', 'SMART_FOLDER', 'SUB_FOLDER', 'JOB', 'INCOND', 'OUTCOND')},
+}
+
+
+class StepVisitor:
+    """
+    Per-element work of one step, compiled for a single pass over the tree.
+
+    handler is called with each matching element and returns the number of
+    changes it made. tags limits the element tags the handler applies to
+    (None means every element). top_level_only restricts it to direct
+    children of the root. structural marks handlers that add or remove
+    children of the element they are given. finish, if given, is called
+    once the pass is over (see finish_visitors()).
+    """
+    __slots__ = ('step', 'handler', 'tags', 'top_level_only', 'structural', 'finish', 'changes')
+
+    def __init__(self, step: str, handler: Callable[[ET.Element], int], tags=None,
+                 top_level_only: bool = False, structural: bool = False,
+                 finish: Optional[Callable[[], None]] = None):
+        self.step = step
+        self.handler = handler
+        self.tags = frozenset(tags) if tags is not None else None
+        self.top_level_only = top_level_only
+        self.structural = structural
+        self.finish = finish
+        self.changes = 0
+
+    def applies_to(self, tag: str, top_level: bool) -> bool:
+        if self.top_level_only and not top_level:
+            return False
+        return self.tags is None or tag in self.tags
+
+
+def _compile_activate(target_env: str) -> Optional[StepVisitor]:
+    logging.info("Ensuring all folders are active (FOLDER_ORDER_METHOD='SYSTEM')...")
+    return StepVisitor('activate', _update_folder_order_method, **STEP_SCOPES['activate'])
+
+def _compile_promote(target_env: str) -> Optional[StepVisitor]:
+    patterns = _get_promotion_patterns_for_target(target_env)
+    if patterns is None:
+        return None
+    promotion_dispatch = _compile_promotion_dispatch(patterns, _get_promotion_memo(target_env, patterns))
+    return StepVisitor('promote', lambda element: _promote_element(element, promotion_dispatch),
+                       **STEP_SCOPES['promote'])
+
+def _compile_resources(target_env: str) -> Optional[StepVisitor]:
+    resource_names = _get_target_resource_names(target_env)
+    if resource_names is None:
+        return None
+    return StepVisitor('resources', lambda job: _standardize_job_resources(job, *resource_names),
+                       structural=True, **STEP_SCOPES['resources'])
+
+def _compile_notifications(target_env: str) -> Optional[StepVisitor]:
+    template = _get_notification_template(target_env)
+    if template is None:
+        return None
+    build_notification_blocks = _compile_notification_factory(template)
+    return StepVisitor('notifications',
+                       lambda job: _standardize_job_notifications(job, build_notification_blocks, template),
+                       structural=True, **STEP_SCOPES['notifications'])
+
+def _compile_validate(target_env: str) -> Optional[StepVisitor]:
+    from src.condition_check import start_validation, finish_validation
+    logging.info("Checking INCOND/OUTCOND consistency and JOBNAME uniqueness...")
+    index = start_validation()
+    return StepVisitor('validate', index.visit, finish=lambda: finish_validation(index),
+                       **STEP_SCOPES['validate'])
+
+STEP_VISITOR_FACTORIES = {
+    'promote': _compile_promote,
+    'activate': _compile_activate,
+    'resources': _compile_resources,
+    'notifications': _compile_notifications,
+    'validate': _compile_validate
+}
+
+
+def compile_step_visitors(steps: List[str], target_env: str) -> List[StepVisitor]:
+    """
+    Compiles the requested steps into visitors, in the order given.
+    Steps that would be skipped for target_env are left out.
+    Raises ControlMXmlError if a step cannot be compiled.
+    """
+    visitors = []
+    for step in steps:
+        try:
+            visitor = STEP_VISITOR_FACTORIES[step](target_env)
+        except ControlMXmlError as e:
+            raise ControlMXmlError(str(e), step=step) from e
+        if visitor is not None:
+            visitors.append(visitor)
+    return visitors
+
+
+def apply_visitors(root: ET.Element, visitors: List[StepVisitor]) -> None:
+    """
+    Applies all visitors in a single depth-first pass over the descendants of root.
+
+    Each element runs the visitors in step order, before its children are
+    visited, so a step always sees the effects of the earlier steps on the
+    same element. Children inserted by a structural visitor only receive the
+    visitors that come after it, exactly as if the steps ran one after another.
+    """
+    apply_visitors_to_children(list(root), visitors)
+
+
+def apply_visitors_to_children(children: List[ET.Element], visitors: List[StepVisitor]) -> None:
+    """
+    Applies all visitors to the given top-level elements and their descendants,
+    treating each of them as a direct child of the root.
+    """
+    if not visitors:
+        return
+    visitor_count = len(visitors)
+    # Each stack entry: (element, index of first visitor to apply, is direct child of root)
+    stack = [(child, 0, True) for child in reversed(children)]
+    while stack:
+        element, start, top_level = stack.pop()
+        tag = element.tag
+        inserted_at = None
+        for i in range(start, visitor_count):
+            visitor = visitors[i]
+            if not visitor.applies_to(tag, top_level):
+                continue
+            try:
+                if visitor.structural:
+                    # Keyed by the elements themselves (not ids) so they stay
+                    # alive; lxml proxies are only stable while referenced.
+                    previous_children = set(element)
+                    visitor.changes += visitor.handler(element)
+                    for child in element:
+                        if child not in previous_children:
+                            if inserted_at is None:
+                                inserted_at = {}
+                            inserted_at.setdefault(child, i + 1)
+                else:
+                    visitor.changes += visitor.handler(element)
+            except ControlMXmlError:
+                raise
+            except Exception as e:
+                raise ControlMXmlError(f"Error while processing <{tag}>: {e}", step=visitor.step) from e
+
+        children = list(element)
+        if not children:
+            continue
+        for child in reversed(children):
+            child_start = start
+            if inserted_at is not None:
+                child_start = max(start, inserted_at.get(child, start))
+            if child_start < visitor_count:
+                stack.append((child, child_start, False))
+
+
+def record_promotion_memo(metrics: 'RunMetrics', counts_before: dict) -> None:
+    """Adds the promotion memo hits and misses since counts_before (see promotion_memo_counts()) to metrics."""
+    counts = promotion_memo_counts()
+    metrics.context['promotion_memo'] = {name: counts[name] - counts_before[name] for name in counts}
+
+
+def finish_visitors(visitors: List[StepVisitor]) -> None:
+    """Calls the finish hook of each visitor that has one, once every element has been visited."""
+    for visitor in visitors:
+        if visitor.finish is not None:
+            visitor.finish()
+
+
+def _instrument_visitor(visitor: StepVisitor, step_metrics: 'StepMetrics', recorder: 'MetricsRecorder') -> None:
+    """Wraps the visitor's handler so every call is timed and counted in step_metrics."""
+    handler = visitor.handler
+
+    def instrumented(element):
+        recorder.current = step_metrics
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            changes = handler(element)
+        finally:
+            step_metrics.wall_time += time.perf_counter() - wall_start
+            step_metrics.cpu_time += time.process_time() - cpu_start
+            recorder.current = None
+        step_metrics.elements_visited += 1
+        step_metrics.changes += changes
+        return changes
+
+    visitor.handler = instrumented
+
+
+def instrument_visitors(visitors: List[StepVisitor], steps: List[str],
+                        recorder: Optional['MetricsRecorder']) -> List['StepMetrics']:
+    """
+    If a recorder is given, instruments the visitors compiled from steps and
+    returns one StepMetrics per step, in order, which they fill in; steps
+    without a visitor (skipped for the target) stay at zero. Without a
+    recorder, returns an empty list and leaves the visitors as they are.
+
+    In a fused pass, the time spent walking the tree is shared by all steps
+    and not included in any of them.
+    """
+    if recorder is None:
+        return []
+    from src.metrics import StepMetrics
+    results = []
+    remaining = iter(visitors)
+    next_visitor = next(remaining, None)
+    for step in steps:
+        step_metrics = StepMetrics(step)
+        if next_visitor is not None and next_visitor.step == step:
+            _instrument_visitor(next_visitor, step_metrics, recorder)
+            next_visitor = next(remaining, None)
+        results.append(step_metrics)
+    return results
+
+
+def _count_in_scope(root: ET.Element, step: str) -> int:
+    """Counts the elements under root that step looks at (see STEP_SCOPES)."""
+    probe = StepVisitor(step, None, **STEP_SCOPES.get(step, {}))
+    count = 0
+    for child in root:
+        for element in child.iter():
+            if probe.applies_to(element.tag, element is child):
+                count += 1
+    return count
+
+
+def _apply_steps_sequential(root: ET.Element, steps: List[str], target_env: str,
+                            recorder: Optional['MetricsRecorder'] = None) -> List['StepMetrics']:
+    """
+    Runs each step function over the whole tree, one after another.
+    Returns one StepMetrics per step if a recorder is given, else an empty
+    list.
+    """
+    results = []
+    if recorder is not None:
+        from src.metrics import StepMetrics
+    for step in steps:
+        logging.info(f"Applying step: [{step}]...")
+        func = STEP_FUNCTION_MAP[step]
+        if recorder is not None:
+            step_metrics = StepMetrics(step)
+            recorder.current = step_metrics
+            visited = _count_in_scope(root, step)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            # Pass target_env only to functions that need it
+            if step in ENV_STEPS:
+                changes = func(root, target_env)
+            else:
+                changes = func(root)
+        except Exception as e:
+            raise ControlMXmlError(str(e), step=step) from e
+        finally:
+            if recorder is not None:
+                recorder.current = None
+        if recorder is not None:
+            step_metrics.wall_time = time.perf_counter() - wall_start
+            step_metrics.cpu_time = time.process_time() - cpu_start
+            # Step functions return None when they skip the target environment
+            if isinstance(changes, int):
+                step_metrics.changes = changes
+                step_metrics.elements_visited = visited
+            results.append(step_metrics)
+        logging.info(f"Step [{step}] applied.")
+    return results
+
+
+def _apply_steps_fused(root: ET.Element, steps: List[str], target_env: str,
+                       recorder: Optional['MetricsRecorder'] = None,
+                       top_level_done: Optional[Callable] = None) -> List['StepMetrics']:
+    """
+    Compiles the steps into visitors and applies them in one pass.
+    Returns one StepMetrics per step if a recorder is given, else an empty
+    list.
+    """
+    logging.info(f"Compiling steps into a single pass: {', '.join(steps)}")
+    visitors = compile_step_visitors(steps, target_env)
+    results = instrument_visitors(visitors, steps, recorder)
+    if top_level_done is None:
+        apply_visitors(root, visitors)
+    else:
+        for child in list(root):
+            apply_visitors_to_children([child], visitors)
+            top_level_done(child)
+    finish_visitors(visitors)
+    for visitor in visitors:
+        logging.info(f"Step [{visitor.step}] applied ({visitor.changes} changes).")
+    return results
+
+
+def _run_steps(root, steps, target_env, sequential, recorder, top_level_done=None) -> List['StepMetrics']:
+    if sequential:
+        results = _apply_steps_sequential(root, steps, target_env, recorder)
+        if top_level_done is not None:
+            for child in list(root):
+                top_level_done(child)
+        return results
+    return _apply_steps_fused(root, steps, target_env, recorder, top_level_done)
+
+
+def split_known_steps(steps: List[str]) -> Tuple[List[str], List[str]]:
+    """Splits steps into (known_steps, unknown_steps), logging each unknown one."""
+    known_steps = []
+    unknown_steps = []
+    for step in steps:
+        if step in STEP_FUNCTION_MAP:
+            known_steps.append(step)
+        else:
+            logging.error(f"Unknown step '{step}'")
+            unknown_steps.append(step)
+    return known_steps, unknown_steps
+
+
+def apply_steps(root: ET.Element, steps: List[str], target_env: str,
+                sequential: bool = False,
+                journal: Optional[ChangeJournal] = None,
+                metrics: Optional['RunMetrics'] = None,
+                top_level_done: Optional[Callable] = None) -> Tuple[List[str], List[str]]:
+    """
+    Applies the requested steps to root in the given order. Modifies the tree in place.
+
+    By default every step is folded into a single depth-first pass; with
+    sequential=True each step walks the tree on its own. Both produce the
+    same result.
+
+    If a journal is given, every change is recorded in it and, should a
+    step fail, rolled back so the tree is left as it was.
+
+    If metrics is given, the whole transformation is timed as its
+    'transform' phase and one StepMetrics per step is added to it, plus the
+    promotion memo hits and misses of the run as 'promotion_memo'.
+
+    If top_level_done is given, it is called with each direct child of root
+    as soon as every step is done with it, in document order, so the result
+    can be written while the rest of the tree is still being transformed.
+
+    Returns (steps_applied, unknown_steps). Raises ControlMXmlError, with
+    .step set, if a step fails.
+    """
+    known_steps, unknown_steps = split_known_steps(steps)
+    recorder = None
+    if metrics is not None:
+        from src.metrics import MetricsRecorder
+        recorder = MetricsRecorder(journal)
+    with recording(recorder if recorder is not None else journal):
+        try:
+            if metrics is None:
+                _run_steps(root, known_steps, target_env, sequential, None, top_level_done)
+            else:
+                memo_counts = promotion_memo_counts()
+                with metrics.phase('transform'):
+                    step_results = _run_steps(root, known_steps, target_env, sequential, recorder,
+                                              top_level_done)
+                metrics.steps.extend(step_results)
+                if 'promote' in known_steps:
+                    record_promotion_memo(metrics, memo_counts)
+        except ControlMXmlError:
+            if journal is not None:
+                journal.rollback()
+            raise
+    return known_steps, unknown_steps
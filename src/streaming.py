@@ -0,0 +1,172 @@
+import xml.etree.ElementTree as ET
+import os
+import logging
+from typing import List, Optional
+from src.change_journal import recording
+from src.compression import decompression_errors, input_source
+from src.change_set import ChangeCounter, ChangeSet
+from src.metrics import MetricsRecorder, RunMetrics, timed_phase
+from src.step_engine import (compile_step_visitors, apply_visitors_to_children, instrument_visitors, finish_visitors,
+                             promotion_memo_counts, record_promotion_memo)
+from src.xml_backend import XML_DECLARATION
+from src.xml_writer import RootFrame, atomic_output, _escape_text
+
+def _write_chunk(out, root: ET.Element, frame: RootFrame, chunk: ET.Element,
+                 serialized: Optional[bytes] = None) -> None:
+    """
+    Writes a processed top-level element (including its tail) and frees it.
+    serialized, if given, is the element already serialized without its tail.
+    """
+    if serialized is None:
+        out.write(frame.serialize(chunk))
+    else:
+        out.write(serialized)
+        if chunk.tail:
+            out.write(_escape_text(chunk.tail).encode('utf-8'))
+    root.remove(chunk)
+    chunk.clear()
+
+
+def _transform_cached(element: ET.Element, frame: RootFrame, visitors, cache) -> bytes:
+    """
+    Returns the transformed serialization of a top-level element, from the
+    cache when its serialized input has been transformed before inside a
+    root declaring the same namespaces.
+    """
+    key = cache.key_for(element, frame.head)
+    serialized = cache.get(key)
+    if serialized is None:
+        apply_visitors_to_children([element], visitors)
+        serialized = frame.serialize(element, with_tail=False)
+        cache.put(key, serialized)
+    return serialized
+
+
+def _transform_tracked(element: ET.Element, index: int, visitors, counter: ChangeCounter,
+                       change_set: ChangeSet) -> bool:
+    """Transforms a top-level element, recording it in change_set if it changed. Returns whether it did."""
+    source_name = element.get('FOLDER_NAME')
+    changes_before = counter.count
+    apply_visitors_to_children([element], visitors)
+    changes = counter.count - changes_before
+    change_set.total += 1
+    if changes:
+        change_set.add(index, element, source_name, changes)
+    return bool(changes)
+
+
+def stream_transform(input_path: str, output_path: str, target_env: str, steps: List[str],
+                     metrics: Optional[RunMetrics] = None, cache=None,
+                     change_set: Optional[ChangeSet] = None) -> bool:
+    """
+    Applies steps to a Control-M XML file one top-level FOLDER at a time.
+
+    The input is read with iterparse. As soon as a top-level element is
+    complete, the compiled steps are applied to it, it is written to the
+    output and then released, so memory is bounded by the largest folder
+    rather than the whole document. The output is identical to parsing the
+    whole file, applying the steps and calling write_xml() with the 'etree'
+    backend; streaming always uses xml.etree.ElementTree, since lxml would
+    repeat the root's namespace declarations on every serialized folder.
+    The output only replaces output_path once it is complete (see
+    atomic_output()).
+
+    If metrics is given, reading, transforming and writing are timed
+    together as its 'stream' phase and one StepMetrics per step is added,
+    with the promotion memo counts as in apply_steps().
+
+    If cache (a FolderCache) is given, each top-level element whose
+    serialized input is already in the cache is written straight from it
+    instead of being transformed; the rest are transformed and cached.
+
+    If change_set is given, only the top-level elements the steps modified
+    are written, and they are recorded in change_set. It cannot be combined
+    with cache, since cached folders are not transformed.
+
+    Raises ControlMXmlError if a step fails. Returns False on I/O or parse errors.
+    """
+    if not os.path.exists(input_path):
+        logging.error(f"Input XML file not found at {input_path}")
+        return False
+
+    visitors = compile_step_visitors(steps, target_env)
+    counter = ChangeCounter() if change_set is not None else None
+    recorder = MetricsRecorder(counter) if metrics is not None else counter
+    step_results = instrument_visitors(visitors, steps, recorder if metrics is not None else None)
+    memo_counts = promotion_memo_counts()
+
+    folders_processed = 0
+    try:
+        with recording(recorder), timed_phase(metrics, 'stream'), input_source(input_path) as source, \
+                atomic_output(output_path) as out:
+            out.write(XML_DECLARATION)
+            root = None
+            frame = None
+            # Namespaces declared on the root, reported before it starts
+            root_namespaces = []
+            pending = None
+            pending_serialized = None
+            depth = 0
+            for event, element in ET.iterparse(source, events=('start-ns', 'start', 'end')):
+                if event == 'start-ns':
+                    if depth == 0:
+                        root_namespaces.append(element)
+                    continue
+                if event == 'start':
+                    depth += 1
+                    if depth == 1:
+                        root = element
+                    elif depth == 2:
+                        # The previous top-level element's tail is only known now
+                        if pending is not None:
+                            _write_chunk(out, root, frame, pending, pending_serialized)
+                            pending = None
+                        if frame is None:
+                            frame = RootFrame(root.tag, root.attrib, root.text, root_namespaces, 'etree')
+                            out.write(frame.start_tag)
+                    continue
+
+                if depth == 2:
+                    keep = True
+                    if cache is not None:
+                        pending_serialized = _transform_cached(element, frame, visitors, cache)
+                    elif change_set is not None:
+                        keep = _transform_tracked(element, folders_processed, visitors, counter, change_set)
+                    else:
+                        apply_visitors_to_children([element], visitors)
+                    if keep:
+                        pending = element
+                    else:
+                        root.remove(element)
+                        element.clear()
+                    folders_processed += 1
+                elif depth == 1:
+                    if pending is not None:
+                        _write_chunk(out, root, frame, pending, pending_serialized)
+                        pending = None
+                    if frame is None:
+                        out.write(ET.tostring(root, encoding='utf-8'))
+                    else:
+                        out.write(frame.end_tag)
+                depth -= 1
+    except (ET.ParseError,) + decompression_errors() as e:
+        logging.error(f"Failed to parse XML file {input_path}. Details: {e}")
+        return False
+    except IOError as e:
+        logging.error(f"Could not write output file {output_path}. Details: {e}")
+        return False
+
+    finish_visitors(visitors)
+    if metrics is not None:
+        metrics.steps.extend(step_results)
+        if 'promote' in steps:
+            record_promotion_memo(metrics, memo_counts)
+    if cache is not None:
+        logging.info(f"Folder cache: {cache.hits} hits, {cache.misses} misses.")
+        if metrics is not None:
+            metrics.context['folder_cache'] = {'hits': cache.hits, 'misses': cache.misses}
+    for visitor in visitors:
+        logging.info(f"Step [{visitor.step}] applied ({visitor.changes} changes).")
+    logging.info(f"Streamed {folders_processed} top-level elements to: {output_path}")
+    return True
+
@@ -0,0 +1,250 @@
+import xml.etree.ElementTree as ET
+import copy
+import io
+import logging
+import os
+import re
+
+# lxml is optional: it parses and serializes faster, supports huge_tree and
+# compiles XPath expressions. Without it everything runs on ElementTree. It is
+# imported on first use (see lxml_module()), so runs on ElementTree and CLI
+# calls answered by the daemon do not pay for loading it.
+lxml_etree = None
+_lxml_import_attempted = False
+
+BACKEND_ENV_VAR = 'CONTROLM_XML_BACKEND'
+BACKEND_CHOICES = ['auto', 'lxml', 'etree']
+
+_backend = None
+_lxml_parser = None
+_lxml_jobs_xpath = None
+# Stdlib elements converted for use in lxml trees, keyed by id; the source
+# element is kept alongside so its id cannot be reused.
+_lxml_copies = {}
+
+
+def lxml_module():
+    """Returns the lxml.etree module, importing it on first call, or None when lxml is not installed."""
+    global lxml_etree, _lxml_import_attempted
+    if not _lxml_import_attempted:
+        _lxml_import_attempted = True
+        try:
+            from lxml import etree as lxml_etree
+        except ImportError:
+            lxml_etree = None
+    return lxml_etree
+
+
+def _resolve_backend(name: str) -> str:
+    if name not in BACKEND_CHOICES:
+        raise ValueError(f"Unknown XML backend '{name}'. Choose from: {', '.join(BACKEND_CHOICES)}")
+    if name == 'auto':
+        return 'lxml' if lxml_module() is not None else 'etree'
+    if name == 'lxml' and lxml_module() is None:
+        logging.warning("lxml is not installed; falling back to xml.etree.ElementTree.")
+        return 'etree'
+    return name
+
+
+def set_backend(name: str) -> str:
+    """
+    Selects the backend used by parse(), write() and find_jobs():
+    'lxml', 'etree' or 'auto' (lxml when installed). Returns the backend
+    actually selected.
+    """
+    global _backend, _lxml_parser, _lxml_jobs_xpath
+    _backend = _resolve_backend(name)
+    if _backend == 'lxml' and _lxml_parser is None:
+        # Comments and processing instructions are dropped, as ElementTree does
+        _lxml_parser = lxml_etree.XMLParser(huge_tree=True, remove_comments=True, remove_pis=True,
+                                            resolve_entities=False)
+        _lxml_jobs_xpath = lxml_etree.XPath('.//JOB')
+    return _backend
+
+
+def get_backend() -> str:
+    """Returns the name of the active backend ('lxml' or 'etree')."""
+    if _backend is None:
+        set_backend(os.environ.get(BACKEND_ENV_VAR, 'auto'))
+    return _backend
+
+
+def parse_errors() -> tuple:
+    """Exception types raised by parse() for malformed XML."""
+    if get_backend() == 'lxml':
+        return (ET.ParseError, lxml_etree.XMLSyntaxError)
+    return (ET.ParseError,)
+
+
+def parse(xml_path: str):
+    """Parses xml_path with the active backend and returns the tree."""
+    if get_backend() == 'lxml':
+        return lxml_etree.parse(xml_path, _lxml_parser)
+    return ET.parse(xml_path)
+
+
+def parse_compact(xml_path: str) -> ET.ElementTree:
+    """
+    Parses xml_path with ElementTree, whatever the active backend, sharing
+    one string object between all equal attribute values, texts and tails.
+
+    Exports repeat the same DATACENTER, RUN_AS, NODEID, resource names,
+    notification attributes and indentation thousands of times; the parser
+    already shares tag names and attribute keys, but would otherwise make a
+    new string for every value. Each element is interned as soon as it is
+    parsed, so the duplicates are freed before the rest of the file is read
+    and the peak resident size falls with the final one. lxml keeps values
+    inside libxml2, where they cannot be shared, so the result is always an
+    ElementTree tree.
+    """
+    strings = {}
+    intern = strings.setdefault
+    events = ET.iterparse(xml_path)
+    for _, element in events:
+        attrib = element.attrib
+        for key, value in attrib.items():
+            attrib[key] = intern(value, value)
+        text = element.text
+        if text is not None:
+            element.text = intern(text, text)
+        # A child's tail is only complete once its parent has ended
+        for child in element:
+            tail = child.tail
+            if tail is not None:
+                child.tail = intern(tail, tail)
+    return ET.ElementTree(events.root)
+
+
+def fromstring(text):
+    """Parses an XML string with the active backend and returns the root element."""
+    if get_backend() == 'lxml':
+        return lxml_etree.fromstring(text, _lxml_parser)
+    return ET.fromstring(text)
+
+
+# The declaration ElementTree.write() writes for encoding='utf-8'
+XML_DECLARATION = b"<?xml version='1.0' encoding='utf-8'?>\n"
+# ElementTree.write() and lxml differ in a few spellings; lxml's output is
+# rewritten to ElementTree's, so the bytes written do not depend on the
+# backend: an empty element ends in ' />' rather than '/>', and a tab in an
+# attribute value is '&#09;' rather than '&#9;'. Only start tags are
+# rewritten; text, comments, processing instructions and CDATA sections are
+# left as they are, whatever lxml escapes in them.
+_LXML_MARKUP = re.compile(rb'<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>'
+                          rb'|(<[^\s<>!?/](?:[^<>"/]|/(?!>)|"[^"]*")*)(/?)>', re.DOTALL)
+
+
+def _etree_start_tag(match) -> bytes:
+    start_tag = match.group(1)
+    if start_tag is None:
+        return match.group(0)
+    return start_tag.replace(b'&#9;', b'&#09;') + (b' />' if match.group(2) else b'>')
+
+
+def _etree_format(serialized: bytes) -> bytes:
+    """Rewrites the start tags in lxml output as ElementTree.write() spells them (see _LXML_MARKUP)."""
+    if b'&#9;' in serialized or b'<!' in serialized or b'<?' in serialized:
+        return _LXML_MARKUP.sub(_etree_start_tag, serialized)
+    # Without tabs, comments, processing instructions or CDATA, only the
+    # '/>' of empty elements change. Text holds no '<', so the markup a '/>'
+    # is in starts at the '<' before it: it ends an empty element unless a
+    # '>' in between closed that tag or an open quote puts it in a value.
+    pieces = []
+    done = 0
+    end = serialized.find(b'/>')
+    while end != -1:
+        start = serialized.rfind(b'<', 0, end)
+        if serialized.find(b'>', start, end) == -1 and not serialized.count(b'"', start, end) % 2:
+            pieces.append(serialized[done:end])
+            pieces.append(b' />')
+            done = end + 2
+        end = serialized.find(b'/>', end + 2)
+    if not pieces:
+        return serialized
+    pieces.append(serialized[done:])
+    return b''.join(pieces)
+
+
+def _lxml_document(root) -> bytes:
+    # The root alone, like ElementTree.write(): any DOCTYPE of the input is left out
+    serialized = lxml_etree.tostring(root, encoding='utf-8', xml_declaration=True)
+    return XML_DECLARATION + _etree_format(serialized.partition(b'?>\n')[2])
+
+
+def write(tree, output_path: str) -> None:
+    """Writes tree as UTF-8 with an XML declaration, in ElementTree's format whatever the backend."""
+    if is_lxml_element(tree.getroot()):
+        with open(output_path, 'wb') as f:
+            f.write(_lxml_document(tree.getroot()))
+        return
+    tree.write(output_path, encoding='utf-8', xml_declaration=True)
+
+
+def write_to(tree, f) -> None:
+    """Writes what write() would write for tree to the binary file f."""
+    if is_lxml_element(tree.getroot()):
+        f.write(_lxml_document(tree.getroot()))
+        return
+    tree.write(f, encoding='utf-8', xml_declaration=True)
+
+
+def serialize(tree) -> bytes:
+    """Returns the bytes write() would write for tree."""
+    if is_lxml_element(tree.getroot()):
+        return _lxml_document(tree.getroot())
+    buffer = io.BytesIO()
+    write_to(tree, buffer)
+    return buffer.getvalue()
+
+
+def serialize_element(element) -> bytes:
+    """Returns element and its subtree, without its tail, as write() writes them inside a document."""
+    if is_lxml_element(element):
+        return _etree_format(lxml_etree.tostring(element, encoding='utf-8', with_tail=False))
+    tail, element.tail = element.tail, None
+    try:
+        return ET.tostring(element, encoding='utf-8')
+    finally:
+        element.tail = tail
+
+
+def is_lxml_element(element) -> bool:
+    # Stdlib elements are told apart without importing lxml
+    return (not isinstance(element, ET.Element) and lxml_module() is not None
+            and isinstance(element, lxml_etree._Element))
+
+
+def find_jobs(root):
+    """Returns all JOB elements below root, using a compiled XPath on lxml trees."""
+    if is_lxml_element(root):
+        if _lxml_jobs_xpath is None:
+            return root.findall('.//JOB')
+        return _lxml_jobs_xpath(root)
+    return root.findall('.//JOB')
+
+
+def _rebuild(element, parent):
+    """Recreates element (and its subtree) with parent's element factory."""
+    new_element = parent.makeelement(element.tag, dict(element.attrib))
+    new_element.text = element.text
+    new_element.tail = element.tail
+    for child in element:
+        new_element.append(_rebuild(child, new_element))
+    return new_element
+
+
+def copy_for(element, parent):
+    """
+    Returns a deep copy of element that can be added under parent, even if
+    element comes from the other backend (e.g. a stdlib template copied into
+    an lxml tree).
+    """
+    if is_lxml_element(parent) and not is_lxml_element(element):
+        cached = _lxml_copies.get(id(element))
+        if cached is None or cached[0] is not element:
+            cached = (element, _rebuild(element, parent))
+            _lxml_copies[id(element)] = cached
+        element = cached[1]
+    elif is_lxml_element(element) and not is_lxml_element(parent):
+        return _rebuild(element, parent)
+    return copy.deepcopy(element)
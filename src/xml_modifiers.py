@@ -1,83 +1,71 @@
 import xml.etree.ElementTree as ET
-import re
 import copy
 import sys
 import logging
+from functools import lru_cache
+from typing import Optional
 from src.errors import ControlMXmlError
-
-# --- Constants ---
-
-# Environment specific values & patterns for promotion
-ENV_CONFIG = {
-    'dev': {
-        'notification_dest': 'dev-alerts@example.com', 'remedy_urgency': 'L',
-        'adf_resource': 'ADFDEV', 'dw_resource': 'DWDEV', 'adb_resource': 'ADBDEV',
-        'env_tag_pattern': re.compile(r'-DEV-', re.IGNORECASE),
-        'user_suffix': '_dev',
-        'node_env_id': 'dev',
-        'datacenter_pattern': re.compile(r'dev_dc_\d+', re.IGNORECASE),
-        'job_suffix_to_add': '',
-        'job_suffix_to_remove': '-preprod'
-    },
-    'preprod': {
-        'notification_dest': 'preprod-alerts@example.com', 'remedy_urgency': 'M',
-        'adf_resource': 'APP-AZ-ADF-PP', 'dw_resource': 'DWPREPROD', 'adb_resource': 'APP-AZ-ADB-PP',
-        'env_tag_pattern': re.compile(r'-PREPROD-', re.IGNORECASE),
-        'env_tag_replacement': '-PREPROD-',
-        'user_suffix': '_pp',
-        'node_env_id': 'pp',
-        'datacenter_pattern': re.compile(r'preprod_dc_\d+', re.IGNORECASE),
-        'datacenter_replacement': 'preprod_dc_1',
-        'job_suffix_to_add': '-preprod',
-        'job_suffix_to_remove': ''
-    },
-    'prod': {
-        'notification_dest': 'prod-support@example.com', 'remedy_urgency': 'H',
-        'adf_resource': 'APP-AZ-ADF', 'dw_resource': 'DWPROD', 'adb_resource': 'APP-AZ-ADB',
-        'env_tag_replacement': '-PROD-',
-        'user_suffix': '',
-        'node_env_id': 'prod',
-        'datacenter_replacement': 'prod_dc_1',
-        'job_suffix_to_add': '',
-        'job_suffix_to_remove': '-preprod'
-    }
-}
-
-# Notification templates
-NOTIFICATION_TEMPLATE_PREPROD = """
-<ON STMT="*" CODE="NOTOK">
-    <DOACTION ACTION="NOTOK" />
-    <DOMAIL URGENCY="R" DEST="{dest}" SUBJECT="PREPROD FAILED Job: %%JOBNAME" MESSAGE="Job %%JOBNAME failed on %%NODEID. Check logs." ATTACH_SYSOUT="Y"/>
-    <DOSHOUT URGENCY="R" MESSAGE="PREPROD Job %%JOBNAME Failed" DEST="PreprodSupportTeam"/>
-</ON>
-<ON STMT="*" CODE="ENDEDOK">
-    <DOMAIL URGENCY="S" DEST="{dest}" SUBJECT="PREPROD OK Job: %%JOBNAME" MESSAGE="Job %%JOBNAME OK." ATTACH_SYSOUT="N"/>
-</ON>
-"""
-NOTIFICATION_TEMPLATE_PROD = """
-<ON STMT="*" CODE="NOTOK">
-    <DOACTION ACTION="NOTOK" />
-    <DOREMEDY URGENCY="{urgency}" DESCRIPTION="PROD FAILURE: Control-M job %%JOBNAME run %%RUNCOUNT failed on node %%NODEID RC=%%COMPSTAT App=%%APPLIC Group=%%APPLGROUP" SUMMARY="PROD FAILURE: %%JOBNAME on %%NODEID RC=%%COMPSTAT"/>
-    <DOMAIL URGENCY="C" DEST="{dest}" SUBJECT="CRITICAL PROD FAILED Job: %%JOBNAME" MESSAGE="PROD Job %%JOBNAME failed on %%NODEID. Remedy Ticket Created. Check logs." ATTACH_SYSOUT="Y"/>
-    <DOSHOUT URGENCY="C" MESSAGE="CRITICAL PROD Job %%JOBNAME Failed - PagerDuty" DEST="ProdOnCallPager"/>
-</ON>
-"""
-
-# --- Pre-parsed Notification Templates ---
+from src.change_journal import set_attribute, insert_children, append_child, remove_children, in_dry_run
+from src.xml_backend import copy_for, find_jobs, is_lxml_element
+from src.rule_pack import load_rule_pack, config_hash_of, parse_notification_template, compile_promotion_patterns
+
+# --- Rules ---
+
+# Environment settings as written in src/default_rules.json or the file given
+# with --config (see src/rule_pack.py). The parsed notification templates and
+# compiled promotion patterns of an environment are built on first use and
+# kept in PARSED_NOTIFICATIONS and PROMOTION_PATTERNS, and the promoted values
+# of each (source, target) pair in PROMOTION_MEMOS. use_rule_pack() sets
+# ENV_CONFIG and the pack rules_config_hash() identifies, and empties all
+# three. Until rules are activated, the first use of ENV_CONFIG loads the
+# default rules (see __getattr__()), so importing this module reads no file.
 PARSED_NOTIFICATIONS = {}
-try:
-    for env, template in [('preprod', NOTIFICATION_TEMPLATE_PREPROD), ('prod', NOTIFICATION_TEMPLATE_PROD)]:
-        if env not in ENV_CONFIG: continue
-        cfg = ENV_CONFIG[env]
-        formatted_template = template.format(
-            dest=cfg.get('notification_dest', 'default_dest@example.com'),
-            urgency=cfg.get('remedy_urgency', 'M')
-        )
-        root_wrapper = ET.fromstring(f"<root>{formatted_template.strip()}</root>")
-        PARSED_NOTIFICATIONS[env] = list(root_wrapper)
-except Exception as e:
-    print(f"FATAL ERROR during template parsing: {e}", file=sys.stderr)
+PROMOTION_PATTERNS = {}
+PROMOTION_MEMOS = {}
+
+def use_rule_pack(pack: dict) -> None:
+    """Makes the environments of a rule pack the active rules."""
+    global ENV_CONFIG, PARSED_NOTIFICATIONS, PROMOTION_PATTERNS, PROMOTION_MEMOS, _RULE_PACK
+    ENV_CONFIG = pack['environments']
     PARSED_NOTIFICATIONS = {}
+    PROMOTION_PATTERNS = {}
+    PROMOTION_MEMOS = {}
+    _RULE_PACK = pack
+
+def rules_config_hash() -> str:
+    """
+    The config hash of the active rules (see rule_pack.config_hash_of()),
+    loading the default rules if none were activated.
+    """
+    _env_config()
+    return config_hash_of(_RULE_PACK)
+
+def load_rules_config(config_path: Optional[str] = None, target_env=None) -> dict:
+    """
+    Loads, validates and activates the rules file at config_path. Raises
+    ControlMXmlError if it is invalid or, when target_env (a name or a
+    list of names) is given, does not configure that environment.
+    """
+    pack = load_rule_pack(config_path)
+    for name in ([target_env] if isinstance(target_env, str) else target_env or []):
+        if name not in pack['environments']:
+            configured = ', '.join(pack['environments'])
+            raise ControlMXmlError(f"Unknown target environment '{name}' (configured: {configured}).")
+    use_rule_pack(pack)
+    return pack
+
+def __getattr__(name: str):
+    # Only called for names the module does not define yet
+    if name == 'ENV_CONFIG':
+        load_rules_config()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _env_config() -> dict:
+    """The active environment settings, loading the default rules if none were activated."""
+    if 'ENV_CONFIG' not in globals():
+        load_rules_config()
+    return ENV_CONFIG
 
 
 # --- Modification Functions ---
@@ -86,7 +74,7 @@ def _update_folder_order_method(folder: ET.Element) -> bool:
     """Set FOLDER_ORDER_METHOD to 'SYSTEM' if not already set."""
     current_method = folder.get('FOLDER_ORDER_METHOD')
     if current_method != 'SYSTEM':
-        folder.set('FOLDER_ORDER_METHOD', 'SYSTEM')
+        set_attribute(folder, 'FOLDER_ORDER_METHOD', 'SYSTEM')
         return True
     return False
 
@@ -108,87 +96,224 @@ def activate_folders(root: ET.Element) -> int:
 
 def _remove_existing_on_blocks(job: ET.Element):
     """Remove all ON blocks from a JOB element."""
-    for on_elem in job.findall('ON'):
-        job.remove(on_elem)
+    remove_children(job, 'ON')
 
-def _add_notification_blocks(job: ET.Element, notification_elements_template):
-    """Add notification ON blocks to a JOB element."""
-    for on_template in notification_elements_template:
-        job.append(copy.deepcopy(on_template))
+def _compile_notification_factory(notification_elements_template):
+    """
+    Returns build(job), which returns fresh copies of the template's ON
+    blocks ready to be added to job.
 
-def standardize_notifications(root: ET.Element, target_env: str) -> None:
+    A prototype of each block is prepared once per backend, and copies are
+    made with the element's own C-level __deepcopy__, skipping the dispatch
+    and memo bookkeeping of copy.deepcopy() on every job.
     """
-    Replaces existing ON blocks within each JOB with standardized templates
-    for the target environment ('preprod' or 'prod'). Skips if target_env is 'dev'.
-    Modifies the tree in place.
+    prototypes = {}
+
+    def build(job):
+        lxml_job = is_lxml_element(job)
+        clones = prototypes.get(lxml_job)
+        if clones is None:
+            clones = []
+            for on_template in notification_elements_template:
+                prototype = copy_for(on_template, job)
+                # The pure-Python ElementTree has no __deepcopy__
+                clone = getattr(prototype, '__deepcopy__', None)
+                clones.append((lambda p=prototype: copy.deepcopy(p)) if clone is None else (lambda c=clone: c({})))
+            prototypes[lxml_job] = clones
+        return [clone() for clone in clones]
+
+    return build
+
+def _add_notification_blocks(job: ET.Element, build_notification_blocks):
+    """Add notification ON blocks to a JOB element. In a dry run, nothing is copied for append_child() to drop."""
+    if in_dry_run():
+        return
+    for on_block in build_notification_blocks(job):
+        append_child(job, on_block)
+
+def _same_subtree(element: ET.Element, other: ET.Element) -> bool:
+    """True if both elements serialize the same: tag, attributes in order, text, tail and children."""
+    if (element.tag != other.tag or element.text != other.text or element.tail != other.tail
+            or len(element) != len(other) or list(element.attrib.items()) != list(other.attrib.items())):
+        return False
+    return all(_same_subtree(child, other_child) for child, other_child in zip(element, other))
+
+def _has_notification_template(job: ET.Element, notification_elements_template) -> bool:
+    """True if the ON blocks of job are already the template's, as its last children."""
+    kept = len(job) - len(notification_elements_template)
+    if kept < 0 or any(child.tag == 'ON' for child in job[:kept]):
+        return False
+    return all(_same_subtree(child, on_template)
+               for child, on_template in zip(job[kept:], notification_elements_template))
+
+def _standardize_job_notifications(job: ET.Element, build_notification_blocks,
+                                   notification_elements_template) -> int:
+    """
+    Replace the ON blocks of a single JOB with the notification template.
+    build_notification_blocks comes from _compile_notification_factory().
+    Returns 0, changing nothing, if the job already ends with the template.
     """
+    if _has_notification_template(job, notification_elements_template):
+        return 0
+    _remove_existing_on_blocks(job)
+    _add_notification_blocks(job, build_notification_blocks)
+    return 1
+
+def _is_promotion_source_only(target_env: str) -> bool:
+    """True for a configured environment nothing is promoted into (e.g. dev): it keeps its resources and notifications."""
+    env_config = _env_config()
+    return target_env in env_config and not env_config[target_env].get('promotes_from')
+
+def _get_notification_template(target_env: str):
+    """Return the parsed notification template for target_env, or None if the step should be skipped."""
     logging.info(f"Standardizing notifications for target: {target_env}")
-    if target_env == 'dev':
-        logging.info("Skipping notification standardization for 'dev' environment.")
-        return
+    if _is_promotion_source_only(target_env):
+        logging.info(f"Skipping notification standardization for '{target_env}' environment.")
+        return None
     if target_env not in PARSED_NOTIFICATIONS:
-        logging.error(f"Notification templates not available or invalid for target env '{target_env}'. Skipping step.")
-        return
+        env_cfg = _env_config().get(target_env, {})
+        if not env_cfg.get('notification_template'):
+            logging.error(f"Notification templates not available or invalid for target env '{target_env}'. Skipping step.")
+            return None
+        PARSED_NOTIFICATIONS[target_env] = parse_notification_template(target_env, env_cfg)
+    return PARSED_NOTIFICATIONS[target_env]
+
+def standardize_notifications(root: ET.Element, target_env: str) -> Optional[int]:
+    """
+    Replaces existing ON blocks within each JOB with standardized templates
+    for the target environment ('preprod' or 'prod'). Skips if target_env is 'dev'.
+    Modifies the tree in place. Returns the number of jobs changed, or None if skipped.
+    """
+    notification_elements_template = _get_notification_template(target_env)
+    if notification_elements_template is None:
+        return None
+    build_notification_blocks = _compile_notification_factory(notification_elements_template)
 
-    notification_elements_template = PARSED_NOTIFICATIONS[target_env]
     jobs_processed = 0
     try:
-        for job in root.findall('.//JOB'):
-            _remove_existing_on_blocks(job)
-            _add_notification_blocks(job, notification_elements_template)
-            jobs_processed += 1
+        for job in find_jobs(root):
+            jobs_processed += _standardize_job_notifications(job, build_notification_blocks,
+                                                             notification_elements_template)
     except Exception as e:
         logging.error(f"Error during notification standardization: {e}")
         raise
+    return jobs_processed
+
+# New QUANTITATIVE elements go before the first child with one of these tags
+RESOURCE_INSERT_BEFORE_TAGS = frozenset(('OUTCOND', 'ON', 'SHOUT', 'VARIABLE'))
 
 def _get_insert_index_for_resources(job: ET.Element) -> int:
     """Determine the index to insert new QUANTITATIVE elements."""
     for i, child in enumerate(job):
-        if child.tag in ['OUTCOND', 'ON', 'SHOUT', 'VARIABLE']:
+        if child.tag in RESOURCE_INSERT_BEFORE_TAGS:
             return i
     return len(job)
 
-def _get_current_quant_resources(job: ET.Element):
-    """Return set of current QUANTITATIVE resource names and the elements."""
+def _index_quant_resources(job: ET.Element):
+    """
+    Indexes the QUANTITATIVE children of a JOB in one scan (findall() on a
+    plain tag runs in C on both backends). Returns the elements in document
+    order and the set of their NAMEs.
+    """
     quants = job.findall('QUANTITATIVE')
-    return {q.get('NAME') for q in quants}, quants
+    return quants, {q.get('NAME') for q in quants}
 
 def _update_resource_names(quants, res_adf, res_dw, res_adb):
-    """Update resource names in QUANTITATIVE elements to match target env."""
+    """
+    Update resource names in QUANTITATIVE elements to match target env.
+    Returns the number of names changed and the name of each element after
+    the change, so callers need not read them back from the tree.
+    """
     resources_updated = 0
+    names = []
     for quant in quants:
         name = quant.get('NAME', '')
         if 'ADF' in name and name != res_adf:
-            quant.set('NAME', res_adf)
-            resources_updated += 1
+            new_name = res_adf
         elif 'DW' in name and name != res_dw:
-            quant.set('NAME', res_dw)
-            resources_updated += 1
+            new_name = res_dw
         elif 'ADB' in name and name != res_adb:
-            quant.set('NAME', res_adb)
-            resources_updated += 1
-    return resources_updated
-
-def _ensure_quant_resource(job, res_name, insert_index):
-    """Ensure a QUANTITATIVE resource exists, insert if missing."""
+            new_name = res_adb
+        else:
+            names.append(quant.get('NAME'))
+            continue
+        set_attribute(quant, 'NAME', new_name)
+        resources_updated += 1
+        names.append(new_name)
+    return resources_updated, names
+
+def _new_quant_resource(job, res_name):
+    """A new QUANTITATIVE resource element for job."""
     attribs = {'NAME': res_name, 'QUANT': '1', 'ONFAIL': 'R', 'ONOK': 'R'}
-    job.insert(insert_index, ET.Element('QUANTITATIVE', attribs))
+    return job.makeelement('QUANTITATIVE', attribs)
 
-def standardize_resources(root: ET.Element, target_env: str) -> None:
+def _standardize_job_resources(job: ET.Element, res_controlm, res_adf, res_dw, res_adb) -> int:
     """
-    Adds/Modifies QUANTITATIVE resources based on job name patterns
-    (-ADB-, -ADF-, -DW-) and target environment. Modifies tree in place.
-    Also updates any existing ADF/DW/ADB resource names to match the target environment.
+    Standardize the QUANTITATIVE resources of a single JOB. Returns the number of changes.
+
+    Every rename and insert is decided from one scan of the job's
+    QUANTITATIVE children. Missing resources are then inserted together, and
+    the insert position is only looked up when there is something to insert.
+    """
+    job_name_str = str(job.get('JOBNAME', ''))
+    current_quants, current_resources = _index_quant_resources(job)
+    resources_updated, current_names = _update_resource_names(current_quants, res_adf, res_dw, res_adb)
+    missing_resources = []
+    resource_to_update = None
+
+    # Ensure CONTROLM-RESOURCE exists
+    if res_controlm not in current_resources:
+        missing_resources.append(res_controlm)
+        current_resources.add(res_controlm)
+
+    # Handle ADB jobs
+    if '-ADB-' in job_name_str:
+        # A tuple rather than a set so the insertion order is the same on every run
+        adb_resources_expected = (res_controlm, res_dw, res_adb)
+        for res_name in adb_resources_expected:
+            if res_name not in current_resources:
+                missing_resources.append(res_name)
+
+    # Handle ADF/DW jobs
+    elif '-ADF-' in job_name_str or '-DW-' in job_name_str:
+        target_res = res_adf if '-ADF-' in job_name_str else res_dw
+        found_target_res = False
+        # Names as renamed above; a CONTROLM-RESOURCE about to be inserted is never picked
+        for quant, q_name in zip(current_quants, current_names):
+            if q_name == target_res:
+                found_target_res = True
+                break
+            elif q_name != res_controlm:
+                resource_to_update = quant
+
+        if found_target_res:
+            resource_to_update = None
+        elif resource_to_update is None:
+            missing_resources.append(target_res)
+
+    if missing_resources:
+        insert_children(job, _get_insert_index_for_resources(job),
+                        [_new_quant_resource(job, res_name) for res_name in missing_resources])
+        resources_updated += len(missing_resources)
+    if resource_to_update is not None:
+        set_attribute(resource_to_update, 'NAME', target_res)
+        resources_updated += 1
+    return resources_updated
+
+def _get_target_resource_names(target_env: str):
+    """
+    Return (res_controlm, res_adf, res_dw, res_adb) for target_env,
+    or None if the resources step should be skipped.
     """
     logging.info(f"Standardizing QUANTITATIVE resources for target: {target_env}")
-    if target_env == 'dev':
-        logging.info("Skipping resource standardization for 'dev' environment.")
-        return
-    if target_env not in ENV_CONFIG:
+    if _is_promotion_source_only(target_env):
+        logging.info(f"Skipping resource standardization for '{target_env}' environment.")
+        return None
+    if target_env not in _env_config():
         logging.error(f"Environment config not found for '{target_env}'. Skipping step.")
-        return
+        return None
 
-    target_cfg = ENV_CONFIG[target_env]
+    target_cfg = _env_config()[target_env]
     res_controlm = "CONTROLM-RESOURCE"
     res_adf = target_cfg.get('adf_resource')
     res_dw = target_cfg.get('dw_resource')
@@ -196,181 +321,306 @@ def standardize_resources(root: ET.Element, target_env: str) -> None:
 
     if not all([res_adf, res_dw, res_adb]):
         print(f"  Error: Missing target resource names in config for '{target_env}'. Skipping step.", file=sys.stderr)
-        return
+        return None
+    return res_controlm, res_adf, res_dw, res_adb
 
-    adb_resources_expected = {res_controlm, res_dw, res_adb}
+def standardize_resources(root: ET.Element, target_env: str) -> Optional[int]:
+    """
+    Adds/Modifies QUANTITATIVE resources based on job name patterns
+    (-ADB-, -ADF-, -DW-) and target environment. Modifies tree in place.
+    Also updates any existing ADF/DW/ADB resource names to match the target environment.
+    Returns the number of resources added or renamed, or None if skipped.
+    """
+    resource_names = _get_target_resource_names(target_env)
+    if resource_names is None:
+        return None
 
+    resources_updated = 0
     try:
-        for job in root.findall('.//JOB'):
-            job_name_str = str(job.get('JOBNAME', ''))
-            insert_index = _get_insert_index_for_resources(job)
-            current_resources, current_quants = _get_current_quant_resources(job)
-            resources_updated = _update_resource_names(current_quants, res_adf, res_dw, res_adb)
-
-            # Ensure CONTROLM-RESOURCE exists
-            if res_controlm not in current_resources:
-                _ensure_quant_resource(job, res_controlm, insert_index)
-                insert_index += 1
-                current_resources.add(res_controlm)
-
-            # Handle ADB jobs
-            if '-ADB-' in job_name_str:
-                for res_name in adb_resources_expected:
-                    if res_name not in current_resources:
-                        _ensure_quant_resource(job, res_name, insert_index)
-                        insert_index += 1
-
-            # Handle ADF/DW jobs
-            elif '-ADF-' in job_name_str or '-DW-' in job_name_str:
-                target_res = res_adf if '-ADF-' in job_name_str else res_dw
-                resource_to_update = None
-                found_target_res = False
-                for quant in job.findall('QUANTITATIVE'):
-                    q_name = quant.get('NAME')
-                    if q_name == target_res:
-                        found_target_res = True
-                        break
-                    elif q_name != res_controlm:
-                        resource_to_update = quant
-
-                if not found_target_res:
-                    if resource_to_update is not None:
-                        current_q_name = resource_to_update.get('NAME')
-                        if current_q_name != target_res:
-                            resource_to_update.set('NAME', target_res)
-                    else:
-                        _ensure_quant_resource(job, target_res, insert_index)
+        for job in find_jobs(root):
+            resources_updated += _standardize_job_resources(job, *resource_names)
     except Exception as e:
         logging.error(f"Error during resource standardization: {e}")
         raise
+    return resources_updated
 
-def _get_env_promotion_patterns(source_cfg, target_cfg):
-    """Extract and compile patterns and replacements for environment promotion."""
-    source_tag_pattern = source_cfg.get('env_tag_pattern')
-    source_user_suffix = source_cfg.get('user_suffix')
-    source_user_pattern = re.compile(re.escape(source_user_suffix) + r'$', re.IGNORECASE) if source_user_suffix is not None else None
-    source_node_env_id = source_cfg.get('node_env_id')
-    source_node_pattern = re.compile(rf"(.*?)({re.escape(source_node_env_id)})(.*)", re.IGNORECASE) if source_node_env_id else None
-    source_dc_pattern = source_cfg.get('datacenter_pattern')
-
-    target_tag_replace = target_cfg.get('env_tag_replacement', '')
-    target_user_suffix = target_cfg.get('user_suffix', '')
-    target_node_env_id = target_cfg.get('node_env_id', '')
-    target_dc_replace = target_cfg.get('datacenter_replacement', '')
-    job_suffix_remove = target_cfg.get('job_suffix_to_remove', '')
-    job_suffix_add = target_cfg.get('job_suffix_to_add', '')
-
-    return {
-        'source_tag_pattern': source_tag_pattern,
-        'source_user_pattern': source_user_pattern,
-        'source_node_pattern': source_node_pattern,
-        'source_dc_pattern': source_dc_pattern,
-        'target_tag_replace': target_tag_replace,
-        'target_user_suffix': target_user_suffix,
-        'target_node_env_id': target_node_env_id,
-        'target_dc_replace': target_dc_replace,
-        'job_suffix_remove': job_suffix_remove,
-        'job_suffix_add': job_suffix_add
-    }
-
-def _promote_element_attributes(element, patterns, name_attributes):
-    """Promote environment-specific attributes for a single element."""
-    modified_count = 0
-    for attr_name in name_attributes:
+PROMOTION_NAME_ATTRIBUTES = ['FOLDER_NAME', 'APPLICATION', 'SUB_APPLICATION', 'PARENT_FOLDER', 'JOBNAME']
+
+# Control-M tags that, per the DEFTABLE schema, never carry an attribute the
+# promotion rewrites. Elements with these tags are skipped entirely.
+NON_PROMOTABLE_TAGS = (
+    'ON', 'DOACTION', 'DOMAIL', 'DOSHOUT', 'DOREMEDY', 'DOCOND', 'DOFORCEJOB', 'DOAUTOEDIT',
+    'DOOUTPUT', 'DOSYSOUT', 'QUANTITATIVE', 'CONTROL', 'SHOUT', 'STEP_RANGE'
+)
+
+# Distinct input values remembered per promotion rewrite. Exports share a
+# few hundred APPLICATION, DATACENTER, RUN_AS, ... values across thousands of
+# jobs, so the memos rarely evict.
+PROMOTION_MEMO_SIZE = 4096
+
+class PromotionMemo:
+    """
+    Bounded LRU memos of the value rewrites of one (source, target) rule
+    set: each rewrite (e.g. 'env_tag' or 'datacenter') is an lru_cache of
+    PROMOTION_MEMO_SIZE input values. Equal inputs also come back as the
+    same string object, so the promoted tree shares them.
+    """
+
+    def __init__(self, patterns: Optional[dict] = None, maxsize: int = PROMOTION_MEMO_SIZE):
+        # The compiled patterns the rewrites apply
+        self.patterns = patterns
+        self.maxsize = maxsize
+        self.rewrites = {}
+
+    def rewrite(self, name: str, func):
+        """Returns func(value) memoized as rewrite name; the first func given for a name is kept."""
+        memoized = self.rewrites.get(name)
+        if memoized is None:
+            memoized = self.rewrites[name] = lru_cache(maxsize=self.maxsize)(func)
+        return memoized
+
+    def counts(self) -> dict:
+        """Hits and misses of all rewrites so far."""
+        hits = misses = 0
+        for memoized in self.rewrites.values():
+            info = memoized.cache_info()
+            hits += info.hits
+            misses += info.misses
+        return {'hits': hits, 'misses': misses}
+
+def promotion_memo_counts() -> dict:
+    """Hits and misses of every promotion memo of the active rules."""
+    totals = {'hits': 0, 'misses': 0}
+    for memo in PROMOTION_MEMOS.values():
+        for name, count in memo.counts().items():
+            totals[name] += count
+    return totals
+
+def _get_promotion_memo(target_env: str, patterns: dict) -> PromotionMemo:
+    """
+    The memo of the (source, target) pair promoting to target_env, whose
+    compiled patterns (see _get_promotion_patterns_for_target()) are given.
+    """
+    key = (_env_config().get(target_env, {}).get('promotes_from'), target_env)
+    memo = PROMOTION_MEMOS.get(key)
+    if memo is None or memo.patterns is not patterns:
+        memo = PROMOTION_MEMOS[key] = PromotionMemo(patterns)
+    return memo
+
+# Each _promote_*_rule factory binds the patterns it needs and returns a
+# function(element) -> number of attributes changed, or None when the rule
+# can never change anything for this (source, target) pair. Values that
+# repeat across jobs are rewritten through the pair's PromotionMemo; JOBNAMEs
+# and condition names are nearly all distinct, so they are not memoized.
+
+def _promote_name_rule(attr_name, patterns, memo):
+    """Promote the env tag in a name attribute (FOLDER_NAME, APPLICATION, ...)."""
+    tag_pattern = patterns['source_tag_pattern']
+    if not tag_pattern:
+        return None
+    tag_replace = patterns['target_tag_replace']
+    promote = memo.rewrite('env_tag', lambda value: tag_pattern.sub(tag_replace, value))
+
+    def rule(element):
         current_val = element.get(attr_name)
-        if current_val is None: continue
+        if current_val is None:
+            return 0
+        new_val = promote(current_val)
+        if new_val != current_val:
+            set_attribute(element, attr_name, new_val)
+            return 1
+        return 0
+    return rule
+
+def _promote_jobname_rule(patterns):
+    """Promote a JOB's JOBNAME: env tag plus the environment job suffix."""
+    tag_pattern = patterns['source_tag_pattern']
+    tag_replace = patterns['target_tag_replace']
+    suffix_remove = patterns['job_suffix_remove']
+    suffix_add = patterns['job_suffix_add']
+
+    def rule(element):
+        current_val = element.get('JOBNAME')
+        if current_val is None:
+            return 0
         new_val = current_val
-        if patterns['source_tag_pattern']:
-            new_val = patterns['source_tag_pattern'].sub(patterns['target_tag_replace'], new_val)
-        if element.tag == 'JOB' and attr_name == 'JOBNAME':
-            if patterns['job_suffix_remove'] and new_val.endswith(patterns['job_suffix_remove']):
-                new_val = new_val[:-len(patterns['job_suffix_remove'])]
-            if patterns['job_suffix_add'] and not new_val.endswith(patterns['job_suffix_add']):
-                new_val += patterns['job_suffix_add']
+        if tag_pattern:
+            new_val = tag_pattern.sub(tag_replace, new_val)
+        if suffix_remove and new_val.endswith(suffix_remove):
+            new_val = new_val[:-len(suffix_remove)]
+        if suffix_add and not new_val.endswith(suffix_add):
+            new_val += suffix_add
         if new_val != current_val:
-            element.set(attr_name, new_val)
-            modified_count += 1
-    return modified_count
+            set_attribute(element, 'JOBNAME', new_val)
+            return 1
+        return 0
+    return rule
 
-def _promote_datacenter(element, patterns):
+def _promote_datacenter_rule(patterns, memo):
     """Promote DATACENTER attribute."""
-    current_dc = element.get('DATACENTER')
-    if current_dc is not None and patterns['source_dc_pattern']:
-        new_dc = patterns['source_dc_pattern'].sub(patterns['target_dc_replace'], current_dc)
-        if new_dc != current_dc:
-            element.set('DATACENTER', new_dc)
-            return 1
-    return 0
+    dc_pattern = patterns['source_dc_pattern']
+    if not dc_pattern:
+        return None
+    dc_replace = patterns['target_dc_replace']
+    promote = memo.rewrite('datacenter', lambda value: dc_pattern.sub(dc_replace, value))
+
+    def rule(element):
+        current_dc = element.get('DATACENTER')
+        if current_dc is not None:
+            new_dc = promote(current_dc)
+            if new_dc != current_dc:
+                set_attribute(element, 'DATACENTER', new_dc)
+                return 1
+        return 0
+    return rule
+
+def _promote_user(patterns, memo):
+    # RUN_AS and the %%user variable share one rewrite
+    user_pattern = patterns['source_user_pattern']
+    user_suffix = patterns['target_user_suffix']
+    return memo.rewrite('user_suffix', lambda value: user_pattern.sub(user_suffix, value))
 
-def _promote_run_as(element, patterns):
+def _promote_run_as_rule(patterns, memo):
     """Promote RUN_AS attribute."""
-    current_run_as = element.get('RUN_AS')
-    if current_run_as is not None and patterns['source_user_pattern']:
-        new_run_as = patterns['source_user_pattern'].sub(patterns['target_user_suffix'], current_run_as)
-        if new_run_as != current_run_as:
-            element.set('RUN_AS', new_run_as)
-            return 1
-    return 0
+    if not patterns['source_user_pattern']:
+        return None
+    promote = _promote_user(patterns, memo)
+
+    def rule(element):
+        current_run_as = element.get('RUN_AS')
+        if current_run_as is not None:
+            new_run_as = promote(current_run_as)
+            if new_run_as != current_run_as:
+                set_attribute(element, 'RUN_AS', new_run_as)
+                return 1
+        return 0
+    return rule
 
-def _promote_nodeid(element, patterns):
+def _promote_nodeid_rule(patterns, memo):
     """Promote NODEID attribute."""
-    current_node = element.get('NODEID')
-    if current_node is not None and patterns['source_node_pattern']:
-        new_node = patterns['source_node_pattern'].sub(lambda m: f"{m.group(1)}{patterns['target_node_env_id']}{m.group(3)}", current_node)
-        if new_node != current_node:
-            element.set('NODEID', new_node)
-            return 1
-    return 0
-
-def _promote_user_variable(element, patterns):
-    """Promote %%user VARIABLE VALUE attribute."""
-    if element.tag == 'VARIABLE' and element.get('NAME') == '%%user':
-        current_user_val = element.get('VALUE')
-        if current_user_val is not None and patterns['source_user_pattern']:
-            new_user_val = patterns['source_user_pattern'].sub(patterns['target_user_suffix'], current_user_val)
-            if new_user_val != current_user_val:
-                element.set('VALUE', new_user_val)
+    node_pattern = patterns['source_node_pattern']
+    if not node_pattern:
+        return None
+    node_env_id = patterns['target_node_env_id']
+    replace_node = lambda m: f"{m.group(1)}{node_env_id}{m.group(3)}"
+    promote = memo.rewrite('nodeid', lambda value: node_pattern.sub(replace_node, value))
+
+    def rule(element):
+        current_node = element.get('NODEID')
+        if current_node is not None:
+            new_node = promote(current_node)
+            if new_node != current_node:
+                set_attribute(element, 'NODEID', new_node)
                 return 1
-    return 0
+        return 0
+    return rule
 
-def _promote_cond_names(element, patterns):
+def _promote_user_variable_rule(patterns, memo):
+    """Promote %%user VARIABLE VALUE attribute."""
+    if not patterns['source_user_pattern']:
+        return None
+    promote = _promote_user(patterns, memo)
+
+    def rule(element):
+        if element.get('NAME') == '%%user':
+            current_user_val = element.get('VALUE')
+            if current_user_val is not None:
+                new_user_val = promote(current_user_val)
+                if new_user_val != current_user_val:
+                    set_attribute(element, 'VALUE', new_user_val)
+                    return 1
+        return 0
+    return rule
+
+def _promote_cond_names_rule(patterns):
     """Promote OUTCOND and INCOND NAME attributes."""
-    if element.tag in ('OUTCOND', 'INCOND'):
+    tag_pattern = patterns['source_tag_pattern']
+    if not tag_pattern:
+        return None
+    tag_replace = patterns['target_tag_replace']
+
+    def rule(element):
         cond_name = element.get('NAME')
-        if cond_name and patterns['source_tag_pattern']:
-            new_cond_name = patterns['source_tag_pattern'].sub(patterns['target_tag_replace'], cond_name)
+        if cond_name:
+            new_cond_name = tag_pattern.sub(tag_replace, cond_name)
             if new_cond_name != cond_name:
-                element.set('NAME', new_cond_name)
+                set_attribute(element, 'NAME', new_cond_name)
                 return 1
-    return 0
+        return 0
+    return rule
 
-def apply_environment_promotion(root: ET.Element, target_env: str) -> None:
+def _compile_promotion_dispatch(patterns, memo: Optional[PromotionMemo] = None):
     """
-    Modifies XML attributes, names, and variables for environment promotion.
-    Assumes promotion path is dev -> preprod -> prod. Modifies the tree in place.
-    Also updates OUTCOND and INCOND NAME attributes to match promoted environment.
+    Compiles the promotion rules for one (source, target) pair into a table
+    keyed by tag. Returns (rules_by_tag, default_rules): each entry is a
+    tuple of rules, in the order the attributes are promoted. Tags missing
+    from the table get default_rules, which check every generic attribute.
+    memo is the pair's PromotionMemo; by default the rules get a new one.
+    """
+    def present(*rules):
+        return tuple(rule for rule in rules if rule is not None)
+
+    if memo is None:
+        memo = PromotionMemo(patterns)
+    name_rules = [_promote_name_rule(attr_name, patterns, memo)
+                  for attr_name in PROMOTION_NAME_ATTRIBUTES if attr_name != 'JOBNAME']
+    datacenter_rule = _promote_datacenter_rule(patterns, memo)
+    run_as_rule = _promote_run_as_rule(patterns, memo)
+    nodeid_rule = _promote_nodeid_rule(patterns, memo)
+    cond_names_rule = _promote_cond_names_rule(patterns)
+
+    default_rules = present(*name_rules, _promote_name_rule('JOBNAME', patterns, memo),
+                            datacenter_rule, run_as_rule, nodeid_rule)
+    rules_by_tag = {tag: () for tag in NON_PROMOTABLE_TAGS}
+    rules_by_tag['JOB'] = present(*name_rules, _promote_jobname_rule(patterns),
+                                  datacenter_rule, run_as_rule, nodeid_rule)
+    rules_by_tag['VARIABLE'] = present(_promote_user_variable_rule(patterns, memo))
+    rules_by_tag['INCOND'] = present(cond_names_rule)
+    rules_by_tag['OUTCOND'] = present(cond_names_rule)
+    return rules_by_tag, default_rules
+
+def _promote_element(element, promotion_dispatch) -> int:
+    """Apply the compiled promotion rules for element's tag. Returns the number of attributes changed."""
+    rules_by_tag, default_rules = promotion_dispatch
+    modified_count = 0
+    for rule in rules_by_tag.get(element.tag, default_rules):
+        modified_count += rule(element)
+    return modified_count
+
+def _get_promotion_patterns_for_target(target_env: str):
+    """
+    Return the compiled promotion patterns for target_env, or None if the
+    promote step should be skipped. Raises ControlMXmlError on missing config.
     """
     logging.info(f"Applying environment promotion modifications for target: {target_env}")
-    if target_env not in ['preprod', 'prod']:
+    target_cfg = _env_config().get(target_env, {})
+    source_env_type = target_cfg.get('promotes_from')
+    if target_cfg and not source_env_type:
         logging.error(f"Invalid target env '{target_env}' for promotion.")
-        return
+        return None
 
-    source_env_type = 'dev' if target_env == 'preprod' else 'preprod'
-    source_cfg = ENV_CONFIG.get(source_env_type, {})
-    target_cfg = ENV_CONFIG.get(target_env, {})
+    source_cfg = _env_config().get(source_env_type, {})
     if not source_cfg or not target_cfg:
         raise ControlMXmlError(f"Missing config for '{source_env_type}' or '{target_env}'.", step="apply_environment_promotion")
 
-    patterns = _get_env_promotion_patterns(source_cfg, target_cfg)
-    name_attributes = ['FOLDER_NAME', 'APPLICATION', 'SUB_APPLICATION', 'PARENT_FOLDER', 'JOBNAME']
+    if target_env not in PROMOTION_PATTERNS:
+        PROMOTION_PATTERNS[target_env] = compile_promotion_patterns(source_env_type, source_cfg, target_cfg)
+    return PROMOTION_PATTERNS[target_env]
+
+def apply_environment_promotion(root: ET.Element, target_env: str) -> Optional[int]:
+    """
+    Modifies XML attributes, names, and variables for environment promotion.
+    Assumes promotion path is dev -> preprod -> prod. Modifies the tree in place.
+    Also updates OUTCOND and INCOND NAME attributes to match promoted environment.
+    Returns the number of attributes changed, or None if skipped.
+    """
+    patterns = _get_promotion_patterns_for_target(target_env)
+    if patterns is None:
+        return None
+    promotion_dispatch = _compile_promotion_dispatch(patterns, _get_promotion_memo(target_env, patterns))
 
     modified_count = 0
     for element in root.findall('.//*'):
-        modified_count += _promote_element_attributes(element, patterns, name_attributes)
-        modified_count += _promote_datacenter(element, patterns)
-        modified_count += _promote_run_as(element, patterns)
-        modified_count += _promote_nodeid(element, patterns)
-        modified_count += _promote_user_variable(element, patterns)
-        modified_count += _promote_cond_names(element, patterns)
-    # print(f"  Environment promotion logic applied. Checked/modified approx {modified_count} instances.")
+        modified_count += _promote_element(element, promotion_dispatch)
+    return modified_count
 
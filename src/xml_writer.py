@@ -0,0 +1,261 @@
+import xml.etree.ElementTree as ET
+import io
+import os
+import re
+import logging
+from contextlib import contextmanager
+from typing import Optional
+from src import compression, xml_backend
+
+# Output files are written through a buffer of this size, so a document of
+# many small folders still reaches the disk in large writes
+WRITE_BUFFER_BYTES = 1024 * 1024
+
+
+def _escape_text(text: str) -> str:
+    # What xml.sax.saxutils.escape() does; importing that module loads urllib and http.client
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+@contextmanager
+def atomic_output(output_path: str):
+    """
+    Yields a binary file, buffered by WRITE_BUFFER_BYTES, that replaces
+    output_path once the block completes. It is written as a temporary file
+    next to output_path and renamed over it in one step, so readers never
+    see a partial document and a failed or killed run leaves any earlier
+    output as it was. If the block raises, the temporary file is removed.
+    Creates the output directory if needed.
+
+    If output_path ends in .gz, .bz2 or .xz, what is written is compressed
+    on the way to the file (see compression.compressing()).
+    """
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        # exist_ok: batch workers may create the same directory concurrently
+        os.makedirs(output_dir, exist_ok=True)
+        logging.info(f"Created output directory: {output_dir}")
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    compressed = compression.output_format(output_path)
+    try:
+        with open(tmp_path, 'wb', buffering=WRITE_BUFFER_BYTES) as f:
+            if compressed is None:
+                yield f
+            else:
+                # The buffer keeps the many small writes of a serializer from each reaching the compressor
+                with io.BufferedWriter(compression.compressing(f, compressed), WRITE_BUFFER_BYTES) as out:
+                    yield out
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _declarations(namespaces) -> list:
+    """The bytes declaring each (prefix, uri) of namespaces in a start tag; prefix None or '' is the default namespace."""
+    declarations = []
+    for prefix, uri in namespaces:
+        name = b' xmlns:' + prefix.encode('utf-8') if prefix else b' xmlns'
+        declarations.append(name + b'="' + _escape_text(uri).replace('"', '&quot;').encode('utf-8') + b'"')
+    return declarations
+
+
+# Placeholder child marking where a RootFrame splits the root into its start and end tags
+_SPLIT_TAG = 'CONTROLM_FRAME_SPLIT'
+# Placeholder attribute making an ElementTree root declare a namespace it does not use itself
+_NS_PLACEHOLDER = 'CONTROLM_FRAME_NS'
+_NS_PLACEHOLDER_ATTRIBUTE = re.compile(rb' [^\s=]+:' + _NS_PLACEHOLDER.encode('ascii') + rb'=""')
+# An ElementTree element serialized on its own declaring a namespace in its
+# start tag; values cannot match, as ElementTree escapes '"' and '>' in them
+_DECLARES_NAMESPACES = re.compile(rb'<[^>]* xmlns(?::[^\s=]+)?="')
+
+
+class RootFrame:
+    """
+    The root of a document written one top-level element at a time, from
+    its tag, attributes, text and the namespaces the input declares on it
+    ((prefix, uri) pairs): start_tag and end_tag are what to write around
+    the top-level elements, serialize() what to write for each of them and
+    childless what to write instead when there are none, serialized by
+    backend (default: the active one).
+
+    The root's namespaces are declared on the root and the top-level
+    elements do not repeat them. lxml elements, parsed below an element
+    declaring them, repeat them when serialized on their own, so they are
+    removed. ElementTree only declares namespaces on the element it
+    serializes, with prefixes of its own choosing, so each top-level element
+    is serialized inside a copy of the root declaring them and cut out of
+    it. An element using a namespace the root does not declare declares it
+    itself.
+    """
+
+    def __init__(self, tag: str, attrib: dict, text: Optional[str] = None, namespaces=(), backend=None):
+        self.lxml = (backend or xml_backend.get_backend()) == 'lxml'
+        self.tag = tag
+        self.namespaces = list(namespaces)
+        self.declarations = _declarations(self.namespaces) if self.lxml else []
+        self.attrib = dict(attrib)
+        if not self.lxml:
+            for _, uri in self.namespaces:
+                self.attrib[f'{{{uri}}}{_NS_PLACEHOLDER}'] = ''
+        # The start tag of the copy of the root serialize() cuts ElementTree elements out of
+        self.head, _ = self._split(None)
+        start_tag, self.end_tag = self._split(text)
+        self.start_tag = _NS_PLACEHOLDER_ATTRIBUTE.sub(b'', start_tag)
+        if self.lxml:
+            root = self._shell(text)
+        else:
+            # Without the placeholders, like write(): only the namespaces the root uses are declared
+            root = ET.Element(tag, attrib)
+            root.text = text
+        self.childless = xml_backend.serialize_element(root)
+
+    def _shell(self, text: Optional[str]):
+        if self.lxml:
+            shell = xml_backend.lxml_module().Element(
+                self.tag, self.attrib, nsmap={prefix or None: uri for prefix, uri in self.namespaces})
+        else:
+            shell = ET.Element(self.tag, self.attrib)
+        shell.text = text
+        return shell
+
+    def _split(self, text: Optional[str]):
+        shell = self._shell(text)
+        shell.append(shell.makeelement(_SPLIT_TAG, {}))
+        serialized = xml_backend.serialize_element(shell)
+        # Split around the placeholder's tag, whatever namespace declarations lxml gives it
+        start = serialized.index(b'<' + _SPLIT_TAG.encode('ascii'))
+        end = serialized.index(b'>', start) + 1
+        return serialized[:start], serialized[end:]
+
+    def serialize(self, element, with_tail: bool = True) -> bytes:
+        """Returns element, and its tail if with_tail, as write() writes it inside the root."""
+        if self.lxml:
+            serialized = xml_backend.serialize_element(element)
+            if self.declarations:
+                start_tag_end = serialized.index(b'>')
+                start_tag = serialized[:start_tag_end]
+                for declaration in self.declarations:
+                    start_tag = start_tag.replace(declaration, b'', 1)
+                serialized = start_tag + serialized[start_tag_end:]
+        elif self.namespaces:
+            shell = self._shell(None)
+            shell.append(element)
+            tail, element.tail = element.tail, None
+            try:
+                wrapped = xml_backend.serialize_element(shell)
+            finally:
+                element.tail = tail
+            if wrapped.startswith(self.head) and wrapped.endswith(self.end_tag):
+                serialized = wrapped[len(self.head):len(wrapped) - len(self.end_tag)]
+            else:
+                # A namespace of its own made the copy of the root declare more
+                serialized = xml_backend.serialize_element(element)
+        else:
+            serialized = xml_backend.serialize_element(element)
+        if with_tail and element.tail:
+            serialized += _escape_text(element.tail).encode('utf-8')
+        return serialized
+
+
+class IncrementalXmlWriter:
+    """
+    Writes a document while it is being transformed: the XML declaration
+    and the root's start tag first, then each top-level element as soon as
+    write_element() is called with it, then the end tag in finish(). The
+    bytes are those write() would write for the finished tree, and the
+    output only replaces output_path once finish() succeeds.
+
+    ElementTree declares every namespace on the root, so if a top-level
+    element turns out to use one, nothing more is written incrementally and
+    finish() writes the whole tree instead. lxml keeps each declaration
+    where the input had it; only the root's are left out of the top-level
+    elements (see RootFrame).
+    """
+
+    def __init__(self, tree, output_path: str):
+        self.tree = tree
+        self.root = tree.getroot()
+        self.output_path = output_path
+        self.lxml = xml_backend.is_lxml_element(self.root)
+        self.elements = 0
+        self.error = None
+        self.write_whole_tree = False
+        self._output = None
+        self._out = None
+        self._frame = None
+
+    def _open_output(self) -> None:
+        self._output = atomic_output(self.output_path)
+        self._out = self._output.__enter__()
+
+    def _root_frame(self) -> RootFrame:
+        # The tree's own library, which may not be the active backend (see parse_compact())
+        if self.lxml:
+            return RootFrame(self.root.tag, self.root.attrib, self.root.text, self.root.nsmap.items(), 'lxml')
+        return RootFrame(self.root.tag, self.root.attrib, self.root.text, backend='etree')
+
+    def _open(self) -> None:
+        self._open_output()
+        self._frame = self._root_frame()
+        self._out.write(xml_backend.XML_DECLARATION + self._frame.start_tag)
+
+    def write_element(self, element) -> None:
+        """Writes a finished top-level element of the tree and its tail."""
+        if self.write_whole_tree or self.error is not None:
+            return
+        try:
+            if self._out is None:
+                self._open()
+            serialized = self._frame.serialize(element)
+            if not self.lxml and _DECLARES_NAMESPACES.match(serialized):
+                # write() would have declared it on the root instead
+                self.write_whole_tree = True
+                return
+            self._out.write(serialized)
+            self.elements += 1
+        except OSError as e:
+            self.error = e
+
+    def finish(self) -> bool:
+        """
+        Completes the document and moves it into place. Returns False, after
+        logging the error, if it could not be written.
+        """
+        try:
+            if self.error is not None:
+                raise self.error
+            if self.elements and not self.write_whole_tree:
+                self._out.write(self._frame.end_tag)
+            else:
+                # Start over rather than seek back, which a compressed output cannot do
+                self._close(OSError("restarted"))
+                self._open_output()
+                if self.write_whole_tree:
+                    xml_backend.write_to(self.tree, self._out)
+                else:
+                    self._out.write(xml_backend.XML_DECLARATION + self._root_frame().childless)
+            self._close(None)
+        except OSError as e:
+            self.discard()
+            logging.error(f"Could not write output file {self.output_path}. Details: {e}")
+            return False
+        logging.info(f"Successfully wrote modified XML to: {self.output_path}")
+        return True
+
+    def discard(self) -> None:
+        """Removes the partly written document, leaving any earlier output in place."""
+        try:
+            self._close(OSError("discarded"))
+        except OSError:
+            pass
+
+    def _close(self, error) -> None:
+        if self._output is None:
+            return
+        output, self._output, self._out = self._output, None, None
+        if error is None:
+            output.__exit__(None, None, None)
+        else:
+            output.__exit__(type(error), error, None)
@@ -0,0 +1,100 @@
+import os
+import shutil
+import subprocess
+import sys
+import pytest
+from src.batch import collect_input_files, run_batch, main_batch
+from src.batch_pipeline import run_pipeline
+from src.modify_controlm_xml import transform_file
+
+CLI = os.path.join(os.path.dirname(__file__), "..", "src", "cli.py")
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+# --- Fixtures ---
+
+@pytest.fixture
+def batch_input_dir(tmp_path):
+    """Provides a directory with three valid exports (one nested) and one broken file."""
+    input_dir = tmp_path / "in"
+    (input_dir / "nested").mkdir(parents=True)
+    shutil.copy(SAMPLE_DEV_XML, input_dir / "a.xml")
+    shutil.copy(SAMPLE_DEV_XML, input_dir / "b.xml")
+    shutil.copy(SAMPLE_DEV_XML, input_dir / "nested" / "c.xml")
+    (input_dir / "broken.xml").write_text("<DEFTABLE><FOLDER>")
+    (input_dir / "notes.txt").write_text("not xml")
+    return input_dir
+
+
+def test_collect_input_files_uses_pattern(batch_input_dir):
+    names = [os.path.relpath(p, batch_input_dir) for p in collect_input_files(str(batch_input_dir))]
+    assert names == ["a.xml", "b.xml", "broken.xml"]
+    recursive = collect_input_files(str(batch_input_dir), '**/*.xml')
+    assert os.path.join(str(batch_input_dir), "nested", "c.xml") in recursive
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_run_batch_isolates_bad_files(batch_input_dir, tmp_path, jobs):
+    output_dir = tmp_path / "out"
+    files = collect_input_files(str(batch_input_dir), '**/*.xml')
+    summary = run_batch(files, str(batch_input_dir), str(output_dir), 'preprod', ALL_STEPS, jobs=jobs)
+    assert len(summary['succeeded']) == 3
+    assert [os.path.basename(r['input']) for r in summary['failed']] == ["broken.xml"]
+    assert (output_dir / "nested" / "c.xml").exists()
+    assert not (output_dir / "broken.xml").exists()
+
+def test_run_batch_output_matches_single_file(batch_input_dir, tmp_path):
+    output_dir = tmp_path / "out"
+    files = collect_input_files(str(batch_input_dir))
+    run_batch(files, str(batch_input_dir), str(output_dir), 'prod', ALL_STEPS, jobs=2)
+    single_output = tmp_path / "single.xml"
+    assert transform_file(SAMPLE_DEV_XML, str(single_output), 'prod', ALL_STEPS)
+    assert (output_dir / "a.xml").read_bytes() == single_output.read_bytes()
+
+def test_main_batch_exits_nonzero_on_failure(batch_input_dir, tmp_path):
+    with pytest.raises(SystemExit) as exc_info:
+        main_batch(str(batch_input_dir), str(tmp_path / "out"), 'preprod', ALL_STEPS, jobs=1)
+    assert exc_info.value.code == 1
+
+@pytest.mark.parametrize("jobs", ['0', '-2'])
+def test_cli_rejects_jobs_below_one(batch_input_dir, tmp_path, jobs):
+    result = subprocess.run([sys.executable, CLI, '--no-daemon', '--input-dir', str(batch_input_dir),
+                             '--output-dir', str(tmp_path / "out"), '--target-env', 'preprod', '--steps', 'activate',
+                             '--jobs', jobs], capture_output=True, text=True)
+    assert result.returncode == 2
+    assert "--jobs must be at least 1" in result.stderr
+    assert "Traceback" not in result.stderr
+    assert not (tmp_path / "out").exists()
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_pipeline_matches_process_pool(batch_input_dir, tmp_path, jobs):
+    files = collect_input_files(str(batch_input_dir), '**/*.xml')
+    pooled = run_batch(files, str(batch_input_dir), str(tmp_path / "pool"), 'prod', ALL_STEPS + ['validate'], jobs=2)
+    piped = run_batch(files, str(batch_input_dir), str(tmp_path / "pipe"), 'prod', ALL_STEPS + ['validate'], jobs=jobs,
+                      pipeline=True, queue_depth=1)
+    assert [r['input'] for r in piped['succeeded']] == [r['input'] for r in pooled['succeeded']]
+    assert [os.path.basename(r['input']) for r in piped['failed']] == ["broken.xml"]
+    assert piped['validation'] == pooled['validation']
+    for result in piped['succeeded']:
+        relative = os.path.relpath(result['output'], tmp_path / "pipe")
+        assert (tmp_path / "pipe" / relative).read_bytes() == (tmp_path / "pool" / relative).read_bytes()
+
+@pytest.mark.parametrize("pipeline", [False, True])
+def test_run_batch_rejects_jobs_below_one(batch_input_dir, tmp_path, pipeline):
+    files = collect_input_files(str(batch_input_dir))
+    for jobs in [0, -2]:
+        with pytest.raises(ValueError, match="jobs must be at least 1"):
+            run_batch(files, str(batch_input_dir), str(tmp_path / "out"), 'preprod', ALL_STEPS, jobs=jobs,
+                      pipeline=pipeline)
+    with pytest.raises(ValueError, match="jobs must be at least 1"):
+        run_pipeline([(files[0], str(tmp_path / "out" / "a.xml"))], 'preprod', ALL_STEPS, jobs=0)
+    assert not (tmp_path / "out").exists()
+
+def test_pipeline_reports_stage_utilization(batch_input_dir, tmp_path):
+    files = collect_input_files(str(batch_input_dir))
+    summary = run_batch(files, str(batch_input_dir), str(tmp_path / "out"), 'preprod', ALL_STEPS, jobs=1,
+                        pipeline=True)
+    stats = summary['pipeline']
+    assert stats['queue_depth'] == 4 and stats['wall_time'] > 0
+    assert list(stats['stages']) == ['read', 'transform', 'write']
+    assert [stats['stages'][stage]['files'] for stage in stats['stages']] == [3, 3, 2]
+    assert all(0 <= stage['utilization'] <= 1 for stage in stats['stages'].values())
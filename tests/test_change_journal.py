@@ -0,0 +1,99 @@
+import os
+import json
+import pytest
+import xml.etree.ElementTree as ET
+from src.change_journal import ChangeJournal, dry_run, recording, set_attribute, insert_child, remove_child, remove_children, insert_children, append_child
+from src.step_engine import apply_steps, STEP_FUNCTION_MAP, STEP_VISITOR_FACTORIES, StepVisitor
+from src.modify_controlm_xml import transform_file
+from src.errors import ControlMXmlError
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+
+def test_rollback_restores_attributes_and_structure():
+    root = ET.fromstring('<DEFTABLE><FOLDER A="1"><JOB/><ON/></FOLDER></DEFTABLE>')
+    original = ET.tostring(root)
+    folder = root.find('FOLDER')
+    journal = ChangeJournal()
+    with recording(journal):
+        set_attribute(folder, 'A', '2')
+        set_attribute(folder, 'B', 'new')
+        insert_child(folder, 0, ET.Element('QUANTITATIVE'))
+        remove_child(folder, folder.find('ON'))
+    assert len(journal) == 4
+    journal.rollback()
+    assert ET.tostring(root) == original
+    assert len(journal) == 0
+
+def test_remove_children_records_sequential_removals():
+    root = ET.fromstring('<JOB><ON A="1"/>t1<VARIABLE/>t2<ON A="2"/>t3<ON A="3"/></JOB>')
+    original = ET.tostring(root)
+    journal = ChangeJournal()
+    with recording(journal):
+        assert remove_children(root, 'ON') == 3
+    assert ET.tostring(root) == b'<JOB><VARIABLE />t2</JOB>'
+    assert [entry[3] for entry in journal.entries] == [0, 1, 1]
+    journal.rollback()
+    assert ET.tostring(root) == original
+
+def test_dry_run_changes_and_records_nothing():
+    root = ET.fromstring('<JOB A="1"><ON/><VARIABLE/><ON/></JOB>')
+    original = ET.tostring(root)
+    journal = ChangeJournal()
+    with recording(journal), dry_run():
+        set_attribute(root, 'A', '2')
+        insert_child(root, 0, ET.Element('QUANTITATIVE'))
+        insert_children(root, 1, [ET.Element('QUANTITATIVE')])
+        append_child(root, ET.Element('ON'))
+        remove_child(root, root.find('VARIABLE'))
+        assert remove_children(root, 'ON') == 2
+    assert ET.tostring(root) == original
+    assert len(journal) == 0
+
+def test_insert_children_records_each_position():
+    root = ET.fromstring('<JOB><VARIABLE/><ON/></JOB>')
+    original = ET.tostring(root)
+    journal = ChangeJournal()
+    with recording(journal):
+        insert_children(root, 1, [ET.Element('A'), ET.Element('B')])
+    assert [child.tag for child in root] == ['VARIABLE', 'A', 'B', 'ON']
+    assert [entry[3] for entry in journal.entries] == [1, 2]
+    journal.rollback()
+    assert ET.tostring(root) == original
+
+def test_helpers_do_not_record_without_active_journal():
+    journal = ChangeJournal()
+    element = ET.Element('JOB')
+    set_attribute(element, 'JOBNAME', 'X')
+    assert element.get('JOBNAME') == 'X'
+    assert len(journal) == 0
+
+@pytest.mark.parametrize("sequential", [False, True])
+def test_failed_step_rolls_back_whole_tree(monkeypatch, sequential):
+    root = ET.parse(SAMPLE_DEV_XML).getroot()
+    original = ET.tostring(root)
+
+    def fail(*args):
+        raise ValueError("boom")
+    monkeypatch.setitem(STEP_VISITOR_FACTORIES, 'notifications',
+                        lambda target_env: StepVisitor('notifications', fail, tags=('JOB',)))
+    monkeypatch.setitem(STEP_FUNCTION_MAP, 'notifications', fail)
+
+    journal = ChangeJournal()
+    with pytest.raises(ControlMXmlError):
+        apply_steps(root, ALL_STEPS, 'preprod', sequential=sequential, journal=journal)
+    assert ET.tostring(root) == original
+
+def test_change_log_records_paths(tmp_path):
+    output_path = tmp_path / "out.xml"
+    change_log_path = tmp_path / "changes.json"
+    assert transform_file(SAMPLE_DEV_XML, str(output_path), 'preprod', ALL_STEPS,
+                          change_log_path=str(change_log_path))
+    records = json.loads(change_log_path.read_text())
+    folder_rename = next(r for r in records if r.get('attribute') == 'FOLDER_NAME')
+    assert folder_rename == {
+        'action': 'set', 'path': '/DEFTABLE/FOLDER[1]', 'tag': 'FOLDER', 'attribute': 'FOLDER_NAME',
+        'old': 'FIN-DEV-GL-ETL-PROJCODE-001', 'new': 'FIN-PREPROD-GL-ETL-PROJCODE-001'
+    }
+    assert {r['action'] for r in records} == {'set', 'insert', 'remove'}
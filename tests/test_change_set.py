@@ -0,0 +1,76 @@
+import os
+import json
+import pytest
+import xml.etree.ElementTree as ET
+from src import xml_backend
+from src.change_set import ChangeSet, summary_path_for
+from src.change_journal import ChangeJournal
+from src.step_engine import apply_steps
+from src.modify_controlm_xml import transform_file
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+# --- Fixtures ---
+
+@pytest.fixture
+def etree_backend():
+    """Tree-mode output is compared byte for byte with streaming, which always uses ElementTree."""
+    previous = xml_backend.get_backend()
+    xml_backend.set_backend('etree')
+    yield
+    xml_backend.set_backend(previous)
+
+def _inactive_folder_names():
+    root = ET.parse(SAMPLE_DEV_XML).getroot()
+    return [f.get('FOLDER_NAME') for f in root.findall('FOLDER') if f.get('FOLDER_ORDER_METHOD') != 'SYSTEM']
+
+
+def test_summary_path_for():
+    assert summary_path_for('out/preprod.xml') == 'out/preprod.summary.json'
+    assert summary_path_for('out/preprod') == 'out/preprod.summary.json'
+
+def test_drop_unchanged_keeps_only_modified_folders():
+    root = ET.parse(SAMPLE_DEV_XML).getroot()
+    source_names = [top.get('FOLDER_NAME') for top in root]
+    journal = ChangeJournal()
+    apply_steps(root, ['activate'], 'preprod', journal=journal)
+
+    change_set = ChangeSet()
+    change_set.drop_unchanged(root, journal, source_names)
+    assert change_set.total == len(source_names)
+    assert [f.get('FOLDER_NAME') for f in root] == _inactive_folder_names()
+    assert [entry['changes'] for entry in change_set.changed] == [1] * len(root)
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_changed_only_output_and_summary(tmp_path, etree_backend, stream):
+    output_path = tmp_path / "activated.xml"
+    assert transform_file(SAMPLE_DEV_XML, str(output_path), 'preprod', ['activate'], stream=stream,
+                          changed_only=True)
+    root = ET.parse(output_path).getroot()
+    assert [f.get('FOLDER_NAME') for f in root] == _inactive_folder_names()
+
+    summary = json.loads((tmp_path / "activated.summary.json").read_text())
+    assert summary['changed_count'] == len(root)
+    assert summary['total_folders'] == len(ET.parse(SAMPLE_DEV_XML).getroot())
+    assert [entry['name'] for entry in summary['changed_folders']] == _inactive_folder_names()
+
+def test_stream_and_tree_write_the_same_change_set(tmp_path, etree_backend):
+    for stream in (False, True):
+        assert transform_file(SAMPLE_DEV_XML, str(tmp_path / f"{stream}.xml"), 'preprod', ALL_STEPS,
+                              stream=stream, changed_only=True)
+    assert (tmp_path / "False.xml").read_bytes() == (tmp_path / "True.xml").read_bytes()
+    summary = json.loads((tmp_path / "True.summary.json").read_text())
+    assert summary['changed_count'] == summary['total_folders']
+    renamed = summary['changed_folders'][0]
+    assert renamed['source_name'] != renamed['name']
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_no_changes_writes_empty_deftable(tmp_path, stream):
+    activated = tmp_path / "activated.xml"
+    assert transform_file(SAMPLE_DEV_XML, str(activated), 'preprod', ['activate'])
+    output_path = tmp_path / "again.xml"
+    assert transform_file(str(activated), str(output_path), 'preprod', ['activate'], stream=stream,
+                          changed_only=True)
+    assert len(ET.parse(output_path).getroot()) == 0
+    assert json.loads((tmp_path / "again.summary.json").read_text())['changed_count'] == 0
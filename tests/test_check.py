@@ -0,0 +1,76 @@
+import os
+import json
+import pytest
+import xml.etree.ElementTree as ET
+from src import xml_modifiers
+from src.check import check_file
+from src.modify_controlm_xml import transform_file, run_check, CHECK_EXIT_PENDING, CHECK_EXIT_ERROR
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+
+@pytest.mark.parametrize("target_env", ['preprod', 'prod'])
+def test_check_counts_match_a_real_run_on_the_sample(tmp_path, target_env):
+    metrics_path = tmp_path / "metrics.json"
+    assert transform_file(SAMPLE_DEV_XML, str(tmp_path / "out.xml"), target_env, ALL_STEPS,
+                          metrics_path=str(metrics_path))
+    real = {step['step']: step['changes'] for step in json.loads(metrics_path.read_text())['steps']}
+    report = check_file(SAMPLE_DEV_XML, target_env, ALL_STEPS)
+    assert report.steps == real
+    assert report.pending == sum(real.values()) > 0
+    assert sum(sum(entry['changes'].values()) for entry in report.folders) == report.pending
+
+def test_check_copies_no_notification_templates(tmp_path, monkeypatch):
+    def fail(*args):
+        raise AssertionError("copied a notification template")
+    monkeypatch.setattr(xml_modifiers, 'copy_for', fail)
+    report = check_file(SAMPLE_DEV_XML, 'preprod', ['notifications'])
+    assert report.steps['notifications'] > 0
+
+def test_transformed_output_has_nothing_pending(tmp_path):
+    output_path = tmp_path / "out.xml"
+    assert transform_file(SAMPLE_DEV_XML, str(output_path), 'preprod', ALL_STEPS)
+    report = check_file(str(output_path), 'preprod', ALL_STEPS + ['validate'])
+    assert report.pending == 0 and report.folders == []
+    assert report.total_folders == len(ET.parse(SAMPLE_DEV_XML).getroot())
+
+def test_check_reports_only_changed_folders(tmp_path):
+    input_path = tmp_path / "input.xml"
+    input_path.write_text('<DEFTABLE><FOLDER FOLDER_NAME="A" FOLDER_ORDER_METHOD="SYSTEM"/>'
+                          '<FOLDER FOLDER_NAME="B"/></DEFTABLE>')
+    report = check_file(str(input_path), 'preprod', ['activate'])
+    assert report.folders == [{'index': 1, 'tag': 'FOLDER', 'name': 'B', 'changes': {'activate': 1}}]
+
+def test_run_check_exit_status_and_report(tmp_path):
+    report_path = tmp_path / "check.json"
+    assert run_check(SAMPLE_DEV_XML, 'preprod', ALL_STEPS, report_path=str(report_path)) == CHECK_EXIT_PENDING
+    report = json.loads(report_path.read_text())
+    assert report['pending_changes'] == sum(report['steps'].values())
+    assert report['changed_count'] == len(report['changed_folders'])
+
+    output_path = tmp_path / "out.xml"
+    assert transform_file(SAMPLE_DEV_XML, str(output_path), 'preprod', ALL_STEPS)
+    assert run_check(str(output_path), 'preprod', ALL_STEPS) == 0
+
+    broken_path = tmp_path / "broken.xml"
+    broken_path.write_text("<DEFTABLE><FOLDER></DEFTABLE>")
+    assert run_check(str(broken_path), 'preprod', ALL_STEPS) == CHECK_EXIT_ERROR
+    assert run_check(SAMPLE_DEV_XML, 'preprod', ['bogus']) == CHECK_EXIT_ERROR
+
+def test_run_check_fails_on_a_failed_condition_check(tmp_path):
+    output_path = tmp_path / "out.xml"
+    assert transform_file(SAMPLE_DEV_XML, str(output_path), 'preprod', ALL_STEPS)
+    assert run_check(str(output_path), 'preprod', ALL_STEPS + ['validate']) == 0
+
+    broken_path = tmp_path / "dangling.xml"
+    tree = ET.parse(str(output_path))
+    job = tree.getroot().find('.//JOB')
+    job.insert(0, ET.Element('INCOND', {'NAME': 'NEVER-SET', 'ODATE': 'ODAT', 'AND_OR': 'A'}))
+    tree.write(str(broken_path))
+    report_path = tmp_path / "check.json"
+    assert run_check(str(broken_path), 'preprod', ALL_STEPS, report_path=str(report_path)) == 0
+    assert run_check(str(broken_path), 'preprod', ALL_STEPS + ['validate'],
+                     report_path=str(report_path)) == CHECK_EXIT_PENDING
+    report = json.loads(report_path.read_text())
+    assert report['pending_changes'] == 0 and report['condition_check_failed']
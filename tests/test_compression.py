@@ -0,0 +1,107 @@
+import os
+import subprocess
+import sys
+import bz2
+import gzip
+import lzma
+import pytest
+from src import batch, compression
+from src.batch import run_batch
+from src.errors import ControlMXmlError
+from src.modify_controlm_xml import transform_file, run_check, CHECK_EXIT_PENDING, CHECK_EXIT_ERROR
+
+CLI = os.path.join(os.path.dirname(__file__), "..", "src", "cli.py")
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+CODECS = [('gz', gzip), ('bz2', bz2), ('xz', lzma)]
+
+
+def _read(path) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture(autouse=True)
+def _default_level():
+    yield
+    compression.set_level(None)
+
+
+@pytest.mark.parametrize("ext,codec", CODECS)
+@pytest.mark.parametrize("mode", [{}, {'stream': True}, {'compact': True}, {'parallel_folders': 2}])
+def test_compressed_round_trip_matches_plain(tmp_path, ext, codec, mode):
+    plain_path = tmp_path / "plain.xml"
+    assert transform_file(SAMPLE_DEV_XML, str(plain_path), 'preprod', ALL_STEPS, **mode)
+    # Detected from the content, not the name
+    input_path = tmp_path / "input.xml"
+    input_path.write_bytes(codec.compress(_read(SAMPLE_DEV_XML)))
+    output_path = tmp_path / f"out.xml.{ext}"
+    assert transform_file(str(input_path), str(output_path), 'preprod', ALL_STEPS, **mode)
+    assert codec.decompress(output_path.read_bytes()) == plain_path.read_bytes()
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_formats_detected_by_magic_number(tmp_path):
+    plain = _read(SAMPLE_DEV_XML)
+    for ext, codec in CODECS:
+        path = tmp_path / "input.xml"
+        path.write_bytes(codec.compress(plain))
+        assert compression.input_format(str(path)) == compression.EXTENSIONS[f".{ext}"]
+        with compression.open_input(str(path)) as f:
+            assert f.read() == plain
+    assert compression.input_format(SAMPLE_DEV_XML) is None
+    assert compression.output_format("out.XML.GZ") == 'gzip' and compression.output_format("out.xml") is None
+
+def test_gzip_output_is_reproducible_and_level_applies(tmp_path):
+    outputs = {}
+    for level in [1, 9, 9]:
+        compression.set_level(level)
+        path = tmp_path / f"out_{level}.xml.gz"
+        assert transform_file(SAMPLE_DEV_XML, str(path), 'preprod', ALL_STEPS)
+        if level in outputs:
+            assert path.read_bytes() == outputs[level]
+        outputs[level] = path.read_bytes()
+    assert len(outputs[9]) < len(outputs[1])
+    with pytest.raises(ControlMXmlError):
+        compression.set_level(10)
+
+def test_check_and_pipeline_read_compressed_input(tmp_path):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    input_path = input_dir / "a.xml.xz"
+    input_path.write_bytes(lzma.compress(_read(SAMPLE_DEV_XML)))
+    assert run_check(str(input_path), 'preprod', ALL_STEPS) == CHECK_EXIT_PENDING
+
+    plain_path = tmp_path / "plain.xml"
+    assert transform_file(SAMPLE_DEV_XML, str(plain_path), 'preprod', ALL_STEPS)
+    summary = run_batch([str(input_path)], str(input_dir), str(tmp_path / "out"), 'preprod', ALL_STEPS,
+                        jobs=1, pipeline=True)
+    assert len(summary['succeeded']) == 1
+    assert lzma.decompress((tmp_path / "out" / "a.xml.xz").read_bytes()) == plain_path.read_bytes()
+
+def test_pipeline_applies_compress_level(tmp_path):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    # Plain inputs, recognized by content; the outputs keep their names and are compressed
+    inputs = [str(input_dir / name) for name in ["a.xml.gz", "b.xml.gz"]]
+    for path in inputs:
+        with open(path, 'wb') as f:
+            f.write(_read(SAMPLE_DEV_XML))
+    result = subprocess.run([sys.executable, CLI, '--no-daemon', '--input-dir', str(input_dir), '--pattern', '*.gz',
+                             '--output-dir', str(tmp_path / "out"), '--target-env', 'preprod', '--steps'] + ALL_STEPS
+                            + ['--pipeline', '--jobs', '2', '--compress-level', '1'], capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+    compression.set_level(1)
+    assert batch.worker_initargs('preprod', ALL_STEPS)[-1] == 1
+    assert transform_file(SAMPLE_DEV_XML, str(tmp_path / "single.xml.gz"), 'preprod', ALL_STEPS)
+    for name in ["a.xml.gz", "b.xml.gz"]:
+        assert (tmp_path / "out" / name).read_bytes() == (tmp_path / "single.xml.gz").read_bytes()
+
+@pytest.mark.parametrize("ext,codec", CODECS)
+def test_truncated_input_fails_cleanly(tmp_path, ext, codec):
+    input_path = tmp_path / f"input.xml.{ext}"
+    input_path.write_bytes(codec.compress(_read(SAMPLE_DEV_XML))[:200])
+    output_path = tmp_path / "out.xml"
+    assert not transform_file(str(input_path), str(output_path), 'preprod', ALL_STEPS)
+    assert not transform_file(str(input_path), str(output_path), 'preprod', ALL_STEPS, stream=True)
+    assert run_check(str(input_path), 'preprod', ALL_STEPS) == CHECK_EXIT_ERROR
+    assert not output_path.exists()
@@ -0,0 +1,161 @@
+import logging
+import os
+import pytest
+import xml.etree.ElementTree as ET
+from src.batch import main_batch, run_batch
+from src.condition_check import ConditionIndex, collecting, find_condition_problems, log_condition_problems
+from src.modify_controlm_xml import run_transform
+from src.step_engine import apply_steps
+from src.streaming import stream_transform
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+CHAIN_XML = """<DEFTABLE>
+  <FOLDER FOLDER_NAME="APP-DEV-A">
+    <INCOND NAME="FOLDER-START" ODATE="ODAT" AND_OR="A"/>
+    <JOB JOBNAME="APP-DEV-A-ADF-J1">
+      <OUTCOND NAME="J1-OK" ODATE="ODAT" SIGN="+"/>
+    </JOB>
+    <JOB JOBNAME="APP-DEV-A-ADF-J2">
+      <INCOND NAME="J1-OK" ODATE="ODAT" AND_OR="A"/>
+      <INCOND NAME="MISSING-OK" ODATE="ODAT" AND_OR="A"/>
+      <OUTCOND NAME="J1-OK" ODATE="ODAT" SIGN="-"/>
+      <OUTCOND NAME="J2-OK" ODATE="ODAT" SIGN="+"/>
+    </JOB>
+    <JOB JOBNAME="APP-DEV-A-ADF-J1"/>
+  </FOLDER>
+</DEFTABLE>"""
+
+# --- Fixtures ---
+
+def _problems(root, steps=('validate',), target_env='preprod', sequential=False):
+    index = ConditionIndex()
+    with collecting(index):
+        apply_steps(root, list(steps), target_env, sequential=sequential)
+    return find_condition_problems(index)
+
+def _names(findings, key='name'):
+    return sorted(finding[key] for finding in findings)
+
+
+def test_finds_dangling_orphan_and_duplicate():
+    problems = _problems(ET.fromstring(CHAIN_XML))
+    assert _names(problems['dangling_inputs']) == ['FOLDER-START', 'MISSING-OK']
+    assert _names(problems['orphan_outputs']) == ['J2-OK']
+    assert _names(problems['duplicate_jobnames'], 'jobname') == ['APP-DEV-A-ADF-J1']
+
+def test_jobnames_only_need_to_be_unique_per_folder(tmp_path):
+    root = ET.fromstring("""<DEFTABLE>
+      <FOLDER FOLDER_NAME="A"><JOB JOBNAME="J"/><SUB_FOLDER JOBNAME="S"><JOB JOBNAME="J"/></SUB_FOLDER></FOLDER>
+      <FOLDER FOLDER_NAME="B"><JOB JOBNAME="J"/><JOB JOBNAME="K"/></FOLDER>
+    </DEFTABLE>""")
+    assert _problems(root)['duplicate_jobnames'] == [{'jobname': 'J', 'locations': [(None, 'A')], 'count': 2}]
+
+    del root[0][1]
+    input_path = tmp_path / "folders.xml"
+    input_path.write_text(ET.tostring(root, encoding='unicode'))
+    assert run_transform(str(input_path), str(tmp_path / "out.xml"), 'preprod', ['validate'])
+
+def test_locations_name_the_owner():
+    problems = _problems(ET.fromstring(CHAIN_XML))
+    locations = {finding['name']: finding['locations'] for finding in problems['dangling_inputs']}
+    # Folder-level conditions have no job, even after the folder's jobs were visited
+    assert locations['FOLDER-START'] == [(None, 'APP-DEV-A', None)]
+    assert locations['MISSING-OK'] == [(None, 'APP-DEV-A', 'APP-DEV-A-ADF-J2')]
+
+@pytest.mark.parametrize("required, produced, dangling", [
+    ('ODAT', 'ODAT', False),
+    ('PREV', 'ODAT', False),
+    ('ODAT', 'PREV', False),
+    ('****', '0101', False),
+    ('PREV', 'NEXT', True),
+])
+def test_odate_matching(required, produced, dangling):
+    root = ET.fromstring(f"""<DEFTABLE><FOLDER FOLDER_NAME="F">
+        <JOB JOBNAME="P"><OUTCOND NAME="C" ODATE="{produced}" SIGN="+"/></JOB>
+        <JOB JOBNAME="R"><INCOND NAME="C" ODATE="{required}" AND_OR="A"/></JOB>
+    </FOLDER></DEFTABLE>""")
+    assert bool(_problems(root)['dangling_inputs']) == dangling
+
+def test_sample_chains_are_consistent():
+    root = ET.parse(SAMPLE_DEV_XML).getroot()
+    problems = _problems(root, ALL_STEPS + ['validate'])
+    assert problems['dangling_inputs'] == [] and problems['duplicate_jobnames'] == []
+
+def test_validate_sees_promoted_names():
+    index = ConditionIndex()
+    with collecting(index):
+        apply_steps(ET.parse(SAMPLE_DEV_XML).getroot(), ['promote', 'validate'], 'preprod')
+    names = set(index.produced) | set(index.required) | set(index.jobs)
+    assert names and not any('-DEV-' in name for name in names)
+
+def test_validate_changes_nothing():
+    root = ET.parse(SAMPLE_DEV_XML).getroot()
+    before = ET.tostring(root)
+    apply_steps(root, ['validate'], 'preprod')
+    assert ET.tostring(root) == before
+
+def test_fused_sequential_and_stream_agree(tmp_path):
+    fused = _problems(ET.fromstring(CHAIN_XML), ALL_STEPS + ['validate'])
+    sequential = _problems(ET.fromstring(CHAIN_XML), ALL_STEPS + ['validate'], sequential=True)
+    input_path = tmp_path / "chain.xml"
+    input_path.write_text(CHAIN_XML)
+    index = ConditionIndex()
+    with collecting(index):
+        assert stream_transform(str(input_path), str(tmp_path / "out.xml"), 'preprod', ALL_STEPS + ['validate'])
+    assert fused == sequential == find_condition_problems(index)
+
+def test_logging_levels(caplog):
+    caplog.set_level(logging.INFO)
+    problems = _problems(ET.fromstring(CHAIN_XML))
+    assert not log_condition_problems(problems)
+    assert any(r.levelno == logging.WARNING and 'MISSING-OK' in r.getMessage() for r in caplog.records)
+    assert any(r.levelno == logging.INFO and 'J2-OK' in r.getMessage() for r in caplog.records)
+
+    caplog.clear()
+    problems['dangling_inputs'] = problems['duplicate_jobnames'] = []
+    assert log_condition_problems(problems)
+    assert not any(r.levelno >= logging.WARNING for r in caplog.records)
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_batch_checks_conditions_across_files(tmp_path, jobs):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    (input_dir / "producer.xml").write_text("""<DEFTABLE><FOLDER FOLDER_NAME="APP-DEV-P">
+        <JOB JOBNAME="APP-DEV-P-ADF-J"><OUTCOND NAME="APP-DEV-P-OK" ODATE="ODAT" SIGN="+"/></JOB>
+    </FOLDER></DEFTABLE>""")
+    (input_dir / "consumer.xml").write_text("""<DEFTABLE><FOLDER FOLDER_NAME="APP-DEV-C">
+        <JOB JOBNAME="APP-DEV-C-ADF-J">
+          <INCOND NAME="APP-DEV-P-OK" ODATE="ODAT" AND_OR="A"/>
+          <INCOND NAME="APP-DEV-X-OK" ODATE="ODAT" AND_OR="A"/>
+        </JOB>
+    </FOLDER></DEFTABLE>""")
+    input_files = sorted(str(path) for path in input_dir.iterdir())
+    summary = run_batch(input_files, str(input_dir), str(tmp_path / "out"), 'preprod', ['promote', 'validate'],
+                        jobs=jobs)
+    assert len(summary['succeeded']) == 2
+    dangling = summary['validation']['dangling_inputs']
+    assert [finding['name'] for finding in dangling] == ['APP-PREPROD-X-OK']
+    assert dangling[0]['locations'][0][0] == str(input_dir / "consumer.xml")
+    assert summary['validation']['orphan_outputs'] == []
+
+@pytest.mark.parametrize("mode", [{}, {'stream': True}, {'parallel_folders': 2}])
+def test_failed_check_fails_the_run(tmp_path, mode):
+    input_path = tmp_path / "chain.xml"
+    input_path.write_text(CHAIN_XML)
+    output_path = tmp_path / "out.xml"
+    assert not run_transform(str(input_path), str(output_path), 'preprod', ['promote', 'validate'], **mode)
+    # The check only reports: the output is still written
+    assert output_path.exists()
+    assert run_transform(SAMPLE_DEV_XML, str(tmp_path / "sample.xml"), 'preprod', ALL_STEPS + ['validate'], **mode)
+
+def test_failed_check_fails_fan_out_and_batch(tmp_path):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    (input_dir / "chain.xml").write_text(CHAIN_XML)
+    assert not run_transform(str(input_dir / "chain.xml"), [str(tmp_path / "pp.xml"), str(tmp_path / "p.xml")],
+                             ['preprod', 'prod'], ['promote', 'validate'])
+    with pytest.raises(SystemExit) as exit_info:
+        main_batch(str(input_dir), str(tmp_path / "out"), 'preprod', ['promote', 'validate'], jobs=1)
+    assert exit_info.value.code == 1
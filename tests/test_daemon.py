@@ -0,0 +1,162 @@
+import os
+import json
+import socket
+import threading
+import pytest
+from src.daemon import make_server, close_server
+from src.daemon_client import daemon_address, read_token, send_request
+from src.errors import ControlMXmlError
+from src.modify_controlm_xml import transform_file
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+# --- Fixtures ---
+
+def _start(server):
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    return thread
+
+def _stop(server, thread):
+    server.shutdown()
+    close_server(server)
+    thread.join()
+
+def _raw_request(socket_path, head: str, body: bytes = b''):
+    """Sends a hand-written request to the daemon's socket; returns (status, JSON body)."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(head.encode('ascii') + f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body)
+        response = b''.join(iter(lambda: sock.recv(65536), b''))
+    status_line, _, rest = response.partition(b'\r\n')
+    return int(status_line.split()[1]), json.loads(rest.partition(b'\r\n\r\n')[2])
+
+@pytest.fixture
+def runtime_dir(tmp_path, monkeypatch):
+    """A private $XDG_RUNTIME_DIR for the daemon's socket and token files."""
+    path = tmp_path / "runtime"
+    path.mkdir(mode=0o700)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(path))
+    return path
+
+@pytest.fixture
+def daemon(tmp_path):
+    """A daemon on a Unix socket in tmp_path, serving files there and the sample data; yields its address."""
+    socket_path = str(tmp_path / "daemon.sock")
+    server = make_server(socket_path=socket_path,
+                         allowed_roots=[str(tmp_path), os.path.dirname(os.path.abspath(SAMPLE_DEV_XML))])
+    thread = _start(server)
+    yield socket_path
+    _stop(server, thread)
+
+
+def test_path_request_matches_in_process_run(daemon, tmp_path):
+    output_path = str(tmp_path / "daemon.xml")
+    response = send_request(daemon, '/transform', {
+        'input_path': os.path.abspath(SAMPLE_DEV_XML), 'output_path': output_path,
+        'target_env': 'preprod', 'steps': ALL_STEPS,
+    })
+    assert response == {'ok': True, 'log': []}
+
+    assert transform_file(SAMPLE_DEV_XML, str(tmp_path / "local.xml"), 'preprod', ALL_STEPS)
+    assert (tmp_path / "daemon.xml").read_bytes() == (tmp_path / "local.xml").read_bytes()
+
+def test_xml_request_returns_each_target(daemon, tmp_path):
+    with open(SAMPLE_DEV_XML, encoding='utf-8') as f:
+        xml = f.read()
+    response = send_request(daemon, '/transform', {'xml': xml, 'target_env': ['preprod', 'prod'], 'steps': ALL_STEPS})
+    assert response['ok'] and set(response['outputs']) == {'preprod', 'prod'}
+
+    assert transform_file(SAMPLE_DEV_XML, str(tmp_path / "preprod.xml"), 'preprod', ALL_STEPS)
+    assert response['outputs']['preprod'] == (tmp_path / "preprod.xml").read_text(encoding='utf-8')
+
+@pytest.mark.parametrize("request_fields, message", [
+    ({'target_env': 'qa'}, "Unknown target environment 'qa'"),
+    ({'target_env': ['preprod', 'prod'], 'stream': True}, "--stream can only"),
+    ({'steps': []}, "needs 'target_env' and 'steps'"),
+])
+def test_invalid_requests_are_reported(daemon, request_fields, message):
+    request = {'xml': '<DEFTABLE/>', 'target_env': 'preprod', 'steps': ALL_STEPS}
+    request.update(request_fields)
+    response = send_request(daemon, '/transform', request)
+    assert not response['ok'] and message in response['error']
+
+def test_failed_run_returns_its_log(daemon, tmp_path):
+    response = send_request(daemon, '/transform', {
+        'input_path': str(tmp_path / "missing.xml"), 'output_path': str(tmp_path / "out.xml"),
+        'target_env': 'preprod', 'steps': ALL_STEPS,
+    })
+    assert not response['ok'] and 'error' not in response
+    assert any('Input XML file not found' in line for line in response['log'])
+
+def test_no_daemon_means_no_response(tmp_path):
+    assert send_request(str(tmp_path / "missing.sock"), '/health') is None
+
+def test_localhost_port_needs_the_token(runtime_dir):
+    server = make_server(port=0)
+    thread = _start(server)
+    address = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        assert oct(os.stat(server.token_path).st_mode & 0o777) == oct(0o600)
+        assert read_token(address) == server.token
+        port = server.server_address[1]
+        assert read_token(f"http://localhost:{port}/") == read_token(f"http://[::1]:{port}") == server.token
+        # The same port on another machine never gets this machine's token
+        assert read_token(f"http://otherhost:{port}") is None
+        assert read_token(f"http://10.1.2.3:{port}") is None
+        health = send_request(address, '/health')
+        assert health['ok'] and health['pid'] == os.getpid()
+        os.remove(server.token_path)
+        assert send_request(address, '/health') == {'ok': False, 'error': "Missing or wrong daemon token."}
+    finally:
+        _stop(server, thread)
+
+@pytest.mark.parametrize("headers, status", [
+    ("Host: evil.example\r\nContent-Type: application/json\r\n", 403),
+    ("Host: localhost\r\nContent-Type: text/plain\r\n", 415),
+])
+def test_foreign_host_and_non_json_requests_are_refused(daemon, headers, status):
+    body = json.dumps({'xml': '<DEFTABLE/>', 'target_env': 'preprod', 'steps': ALL_STEPS}).encode('utf-8')
+    code, response = _raw_request(daemon, f"POST /transform HTTP/1.0\r\n{headers}", body)
+    assert code == status and not response['ok']
+
+def test_paths_outside_the_allowed_roots_are_refused(daemon, tmp_path):
+    outside = os.path.join(os.path.dirname(str(tmp_path)), "elsewhere.xml")
+    link = tmp_path / "link"
+    link.symlink_to(os.path.dirname(str(tmp_path)))
+    for fields in [{'output_path': outside}, {'output_path': str(link / "out.xml")},
+                   {'output_path': str(tmp_path / "out.xml"), 'change_log': outside}]:
+        request = {'input_path': os.path.abspath(SAMPLE_DEV_XML), 'target_env': 'preprod', 'steps': ALL_STEPS}
+        request.update(fields)
+        response = send_request(daemon, '/transform', request)
+        assert not response['ok'] and "outside the directories" in response['error']
+    assert not os.path.exists(outside)
+
+def test_default_socket_only_used_in_a_private_directory(runtime_dir, monkeypatch):
+    monkeypatch.delenv('CONTROLM_DAEMON', raising=False)
+    server = make_server()
+    thread = _start(server)
+    try:
+        assert daemon_address() == server.server_address
+        runtime_dir.chmod(0o777)
+        assert daemon_address() is None
+        with pytest.raises(ControlMXmlError, match="No private directory"):
+            make_server(port=0)
+    finally:
+        runtime_dir.chmod(0o700)
+        _stop(server, thread)
+
+def test_stale_socket_is_replaced_and_live_one_kept(tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+    server = make_server(socket_path=socket_path)
+    thread = _start(server)
+    try:
+        assert oct(os.stat(socket_path).st_mode & 0o777) == oct(0o600)
+        with pytest.raises(ControlMXmlError, match="already serving"):
+            make_server(socket_path=socket_path)
+    finally:
+        _stop(server, thread)
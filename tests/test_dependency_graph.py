@@ -0,0 +1,106 @@
+import json
+import os
+import pytest
+import xml.etree.ElementTree as ET
+from src.condition_check import ConditionIndex
+from src.dependency_graph import build_dependency_graph, graph_from_files, write_graph
+from src.errors import ControlMXmlError
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+
+# A and B are linked through A's folder-level OUTCOND; C stands alone
+LINKED_XML = """<DEFTABLE>
+  <FOLDER FOLDER_NAME="A">
+    <JOB JOBNAME="A1"><OUTCOND NAME="A1-OK" ODATE="ODAT" SIGN="+"/></JOB>
+    <JOB JOBNAME="A2"><INCOND NAME="A1-OK" ODATE="ODAT" AND_OR="A"/></JOB>
+    <OUTCOND NAME="A-DONE" ODATE="ODAT" SIGN="+"/>
+  </FOLDER>
+  <FOLDER FOLDER_NAME="C"><JOB JOBNAME="C1"/></FOLDER>
+  <FOLDER FOLDER_NAME="B">
+    <JOB JOBNAME="B1"><INCOND NAME="A-DONE" ODATE="PREV" AND_OR="A"/></JOB>
+    <JOB JOBNAME="B2"/>
+  </FOLDER>
+</DEFTABLE>"""
+
+# --- Fixtures ---
+
+def _graph(xml_string, source=None):
+    index = ConditionIndex(source=source)
+    index.visit_tree(ET.fromstring(xml_string))
+    return build_dependency_graph(index)
+
+def _edge_names(graph):
+    return [([graph.node_jobs[n] for n in producers], graph.conditions[c], [graph.node_jobs[n] for n in consumers])
+            for c, producers, consumers in graph.condition_edges()]
+
+
+def test_edges_run_from_producer_to_condition_to_consumer():
+    graph = _graph(LINKED_XML)
+    # Folder-level conditions hang off a node with no job; ODATEs are not compared
+    assert _edge_names(graph) == [(['A1'], 'A1-OK', ['A2']), ([None], 'A-DONE', ['B1'])]
+    assert [graph.folders[f][1] for f in graph.node_folder] == ['A', 'A', 'C', 'B', 'B', 'A']
+    assert len(graph.producer_offsets) == len(graph.consumer_offsets) == len(graph.conditions) + 1
+    assert graph.edge_count == 4
+
+def test_shared_condition_takes_linear_edges():
+    jobs = 300
+    producers = ''.join(f'<JOB JOBNAME="P{i}"><OUTCOND NAME="GO" ODATE="ODAT" SIGN="+"/></JOB>' for i in range(jobs))
+    consumers = ''.join(f'<JOB JOBNAME="C{i}"><INCOND NAME="GO" ODATE="PREV" AND_OR="A"/>'
+                        f'<INCOND NAME="GO" ODATE="ODAT" AND_OR="A"/></JOB>' for i in range(jobs))
+    graph = _graph(f'<DEFTABLE><FOLDER FOLDER_NAME="P">{producers}</FOLDER>'
+                   f'<FOLDER FOLDER_NAME="C">{consumers}</FOLDER></DEFTABLE>')
+    # One edge per job into or out of the condition, not one per producer and consumer pair
+    assert graph.edge_count == 2 * jobs
+    assert graph.folder_components() == [[0, 1]]
+
+def test_folder_components():
+    graph = _graph(LINKED_XML)
+    names = [[graph.folders[f][1] for f in component] for component in graph.folder_components()]
+    assert names == [['A', 'B'], ['C']]
+
+def test_partitions_keep_components_together():
+    graph = _graph(LINKED_XML)
+    assert graph.partition_folders(2) == [[0, 2], [1]]
+    assert graph.partition_folders(5) == [[0, 2], [1]]
+    assert graph.partition_folders(1) == [[0, 1, 2]]
+
+def test_sample_folders_are_independent():
+    graph = graph_from_files([SAMPLE_DEV_XML])
+    assert graph.edge_count > 0
+    assert len(graph.folder_components()) == len(graph.folders)
+
+def test_conditions_cross_files(tmp_path):
+    (tmp_path / "a.xml").write_text('<DEFTABLE><FOLDER FOLDER_NAME="F"><JOB JOBNAME="P">'
+                                    '<OUTCOND NAME="X" ODATE="ODAT" SIGN="+"/></JOB></FOLDER></DEFTABLE>')
+    (tmp_path / "b.xml").write_text('<DEFTABLE><FOLDER FOLDER_NAME="F"><JOB JOBNAME="C">'
+                                    '<INCOND NAME="X" ODATE="ODAT" AND_OR="A"/></JOB></FOLDER></DEFTABLE>')
+    graph = graph_from_files([str(tmp_path / "a.xml"), str(tmp_path / "b.xml")])
+    # Same folder name in two files: two folders, joined by the condition
+    assert [source for source, _ in graph.folders] == [str(tmp_path / "a.xml"), str(tmp_path / "b.xml")]
+    assert graph.folder_components() == [[0, 1]]
+
+def test_unreadable_file_raises(tmp_path):
+    with pytest.raises(ControlMXmlError, match="Could not read"):
+        graph_from_files([str(tmp_path / "missing.xml")])
+
+def test_json_export(tmp_path):
+    output_path = tmp_path / "graph.json"
+    write_graph(_graph(LINKED_XML), str(output_path), partitions=2)
+    graph = json.loads(output_path.read_text())
+    assert [folder['component'] for folder in graph['folders']] == [0, 1, 0]
+    assert graph['conditions'] == [{'id': 0, 'name': 'A1-OK', 'producers': [0], 'consumers': [1]},
+                                   {'id': 1, 'name': 'A-DONE', 'producers': [5], 'consumers': [3]}]
+    assert graph['nodes'][5] == {'id': 5, 'folder': 0, 'job': None}
+    assert graph['partitions'] == [[0, 2], [1]]
+
+def test_dot_export_escapes_names(tmp_path):
+    output_path = tmp_path / "graph.dot"
+    write_graph(_graph(LINKED_XML.replace('A1-OK', 'A1 &quot;OK&quot;')), str(output_path))
+    dot = output_path.read_text()
+    assert dot.startswith('digraph dependencies {') and dot.count('subgraph cluster_') == 3
+    assert 'c0 [label="A1 \\"OK\\"", shape=ellipse];' in dot
+    assert 'n0 -> c0;' in dot and 'c0 -> n1;' in dot
+
+def test_unknown_format_raises(tmp_path):
+    with pytest.raises(ControlMXmlError, match="Unknown graph format"):
+        write_graph(_graph(LINKED_XML), str(tmp_path / "graph.txt"), 'svg')
@@ -0,0 +1,70 @@
+import os
+import pytest
+from src import xml_modifiers
+from src.cli import build_parser, check_args, multi_target_error
+from src.modify_controlm_xml import transform_file, transform_file_targets, _fan_out_order
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+# --- Fixtures ---
+
+@pytest.fixture
+def qa_environment(monkeypatch):
+    """Adds a 'qa' target promoted from dev, next to preprod."""
+    monkeypatch.setitem(xml_modifiers.ENV_CONFIG, 'qa', xml_modifiers.ENV_CONFIG['preprod'])
+    monkeypatch.setattr(xml_modifiers, 'PROMOTION_PATTERNS', {})
+    monkeypatch.setattr(xml_modifiers, 'PARSED_NOTIFICATIONS', {})
+
+def _check_args_error(argv, capsys):
+    """Parses argv as cli.py does; returns the error check_args() reports, or None."""
+    parser = build_parser()
+    args = parser.parse_args(['--input', 'in.xml', '--steps', 'activate'] + argv.split())
+    try:
+        check_args(parser, args)
+    except SystemExit:
+        return capsys.readouterr().err
+    return None
+
+def test_fan_out_order_follows_promotion_chain():
+    assert _fan_out_order(['prod', 'preprod']) == [('preprod', None), ('prod', 'preprod')]
+    assert _fan_out_order(['prod', 'dev']) == [('prod', None), ('dev', None)]
+
+def test_fan_out_matches_chained_runs(tmp_path):
+    outputs = {'prod': str(tmp_path / "prod.xml"), 'preprod': str(tmp_path / "preprod.xml")}
+    assert transform_file_targets(SAMPLE_DEV_XML, outputs, ALL_STEPS)
+
+    assert transform_file(SAMPLE_DEV_XML, str(tmp_path / "preprod_single.xml"), 'preprod', ALL_STEPS)
+    assert transform_file(str(tmp_path / "preprod_single.xml"), str(tmp_path / "prod_single.xml"), 'prod', ALL_STEPS)
+    assert (tmp_path / "preprod.xml").read_bytes() == (tmp_path / "preprod_single.xml").read_bytes()
+    assert (tmp_path / "prod.xml").read_bytes() == (tmp_path / "prod_single.xml").read_bytes()
+
+def test_targets_from_the_same_source_get_their_own_copy(tmp_path, qa_environment):
+    outputs = {'preprod': str(tmp_path / "preprod.xml"), 'qa': str(tmp_path / "qa.xml"),
+               'prod': str(tmp_path / "prod.xml")}
+    assert transform_file_targets(SAMPLE_DEV_XML, outputs, ALL_STEPS)
+    assert (tmp_path / "qa.xml").read_bytes() == (tmp_path / "preprod.xml").read_bytes()
+    assert transform_file(str(tmp_path / "preprod.xml"), str(tmp_path / "prod_single.xml"), 'prod', ALL_STEPS)
+    assert (tmp_path / "prod.xml").read_bytes() == (tmp_path / "prod_single.xml").read_bytes()
+
+def test_failed_target_skips_the_targets_promoted_from_it(tmp_path, monkeypatch):
+    monkeypatch.delitem(xml_modifiers.ENV_CONFIG, 'dev')
+    outputs = {'preprod': str(tmp_path / "preprod.xml"), 'prod': str(tmp_path / "prod.xml")}
+    assert not transform_file_targets(SAMPLE_DEV_XML, outputs, ALL_STEPS)
+    assert not (tmp_path / "preprod.xml").exists()
+    assert not (tmp_path / "prod.xml").exists()
+
+@pytest.mark.parametrize("argv, message", [
+    ("--target-env preprod prod --output a.xml b.xml", None),
+    ("--target-env preprod --output a.xml", None),
+    ("--target-env preprod prod --output a.xml", "one --output per --target-env"),
+    ("--target-env prod prod --output a.xml b.xml", "only be given once"),
+    ("--target-env preprod prod --output a.xml b.xml --stream --changed-only", "--stream, --changed-only can only"),
+    ("--target-env preprod prod --check", "--check can only"),
+])
+def test_multi_target_cli_checks(argv, message, capsys):
+    error = _check_args_error(argv, capsys)
+    assert (error is None) if message is None else (message in error)
+
+def test_multi_target_input_dir_is_rejected():
+    assert "--input-dir takes a single" in multi_target_error(['preprod', 'prod'], input_dir='in')
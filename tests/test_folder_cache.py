@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import pytest
+import xml.etree.ElementTree as ET
+from src import folder_cache, xml_backend
+from src.folder_cache import FolderCache, canonical_form, run_context_digest
+from src.modify_controlm_xml import transform_file
+from src.streaming import stream_transform
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+# --- Fixtures ---
+
+@pytest.fixture
+def expected_output(tmp_path):
+    """Output of a plain streaming run, which incremental runs must match byte for byte."""
+    path = tmp_path / "expected.xml"
+    assert stream_transform(SAMPLE_DEV_XML, str(path), 'preprod', ALL_STEPS)
+    return path.read_bytes()
+
+def _cached_run(input_path, output_path, cache_dir, target_env='preprod', steps=ALL_STEPS):
+    cache = FolderCache(str(cache_dir), run_context_digest(target_env, steps))
+    assert stream_transform(str(input_path), str(output_path), target_env, steps, cache=cache)
+    return cache
+
+
+def test_canonical_form_ignores_source_formatting():
+    first = ET.fromstring('<FOLDER A="1" B=\'x &amp; y\'><JOB/></FOLDER>')
+    second = ET.fromstring("<FOLDER A='1' B=\"x &#38; y\"><JOB></JOB></FOLDER>")
+    reordered = ET.fromstring('<FOLDER B="x &amp; y" A="1"><JOB/></FOLDER>')
+    assert canonical_form(first) == canonical_form(second)
+    assert canonical_form(first) != canonical_form(reordered)
+
+def test_warm_run_is_served_from_cache(tmp_path, expected_output):
+    cache_dir = tmp_path / "cache"
+    cold = _cached_run(SAMPLE_DEV_XML, tmp_path / "cold.xml", cache_dir)
+    warm = _cached_run(SAMPLE_DEV_XML, tmp_path / "warm.xml", cache_dir)
+    folders = len(ET.parse(SAMPLE_DEV_XML).getroot())
+    assert (cold.hits, cold.misses) == (0, folders)
+    assert (warm.hits, warm.misses) == (folders, 0)
+    assert (tmp_path / "cold.xml").read_bytes() == expected_output
+    assert (tmp_path / "warm.xml").read_bytes() == expected_output
+
+def test_only_changed_folders_are_transformed(tmp_path):
+    cache_dir = tmp_path / "cache"
+    _cached_run(SAMPLE_DEV_XML, tmp_path / "first.xml", cache_dir)
+
+    tree = ET.parse(SAMPLE_DEV_XML)
+    tree.getroot()[0].find('JOB').set('DESCRIPTION', 'Changed since last night (Dev)')
+    changed_input = tmp_path / "changed.xml"
+    tree.write(changed_input, encoding='utf-8', xml_declaration=True)
+
+    cache = _cached_run(changed_input, tmp_path / "incremental.xml", cache_dir)
+    assert cache.misses == 1
+    assert cache.hits == len(tree.getroot()) - 1
+    assert stream_transform(str(changed_input), str(tmp_path / "full.xml"), 'preprod', ALL_STEPS)
+    assert (tmp_path / "incremental.xml").read_bytes() == (tmp_path / "full.xml").read_bytes()
+
+@pytest.mark.parametrize("target_env, steps", [('prod', ALL_STEPS), ('preprod', ['activate', 'promote'])])
+def test_run_context_is_part_of_the_key(tmp_path, target_env, steps):
+    cache_dir = tmp_path / "cache"
+    _cached_run(SAMPLE_DEV_XML, tmp_path / "first.xml", cache_dir)
+    cache = _cached_run(SAMPLE_DEV_XML, tmp_path / "other.xml", cache_dir, target_env, steps)
+    assert cache.hits == 0
+
+def test_code_and_backend_are_part_of_the_key(monkeypatch):
+    src_dir = os.path.join(os.path.dirname(__file__), "..", "src")
+    assert all(os.path.exists(os.path.join(src_dir, name + '.py')) for name in folder_cache.FINGERPRINTED_MODULES)
+    digests = {run_context_digest('preprod', ALL_STEPS)}
+    monkeypatch.setattr(folder_cache, 'FINGERPRINTED_MODULES', folder_cache.FINGERPRINTED_MODULES[:-1])
+    digests.add(run_context_digest('preprod', ALL_STEPS))
+    monkeypatch.setattr(xml_backend, 'get_backend', lambda: 'other')
+    digests.add(run_context_digest('preprod', ALL_STEPS))
+    assert len(digests) == 3
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = FolderCache(str(tmp_path / "cache"), b'context', max_bytes=250)
+    for index, key in enumerate(['aa01', 'bb02', 'cc03']):
+        cache.put(key, b'x' * 100)
+        past = time.time() - 100 + index
+        os.utime(cache._path_for(key), (past, past))
+    assert cache.get('aa01') is not None  # refreshes the oldest entry
+    assert cache.evict() == 1
+    assert cache.get('bb02') is None
+    assert cache.get('aa01') is not None and cache.get('cc03') is not None
+
+def test_transform_file_with_cache_dir(tmp_path, expected_output):
+    metrics_path = tmp_path / "metrics.json"
+    for name in ("first.xml", "second.xml"):
+        assert transform_file(SAMPLE_DEV_XML, str(tmp_path / name), 'preprod', ALL_STEPS,
+                              cache_dir=str(tmp_path / "cache"), metrics_path=str(metrics_path))
+        assert (tmp_path / name).read_bytes() == expected_output
+    assert json.loads(metrics_path.read_text())['folder_cache']['misses'] == 0
@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+
+CLI = os.path.join(os.path.dirname(__file__), "..", "src", "cli.py")
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+
+# Modules a single-step run has no use for; each costs 0.3-40ms on a cold start. copy and
+# threading are not among them: ElementTree's C accelerator and logging import them.
+UNNEEDED_MODULES = {'lxml.etree', 'tomllib', 'pickle', 'tempfile', 'http.client', 'urllib.request',
+                    'multiprocessing', 'concurrent.futures', 'shutil', 'bz2', 'lzma', 'hashlib',
+                    'src.batch', 'src.daemon', 'src.folder_cache', 'src.parallel_folders', 'src.check',
+                    'src.dependency_graph', 'src.streaming', 'src.change_set', 'src.metrics',
+                    'src.condition_check'}
+
+# Bound on the import time of the src.* modules of a single-step run, in microseconds: about
+# 30ms here even without cached bytecode, so only a heavy import at module level can exceed it
+SRC_IMPORT_BUDGET_US = 250000
+
+# Runs the CLI with the given arguments and prints sys.modules once it exits
+_LIST_MODULES = ("import atexit, runpy, sys; atexit.register(lambda: print('\\n'.join(sys.modules))); "
+                 "sys.argv = sys.argv[1:]; runpy.run_path(sys.argv[0], run_name='__main__')")
+
+# --- Fixtures ---
+
+def _modules_after(args, tmp_path) -> set:
+    """Runs the CLI with args in a fresh interpreter; returns the names in its sys.modules at exit."""
+    env = dict(os.environ, CONTROLM_XML_BACKEND='etree')
+    result = subprocess.run([sys.executable, '-c', _LIST_MODULES, CLI] + args, capture_output=True, text=True,
+                            env=env)
+    assert result.returncode == 0, result.stderr
+    return set(result.stdout.split())
+
+def _src_import_time_us(args) -> int:
+    """Runs the CLI with args under -X importtime; returns the summed own import time of the src.* modules."""
+    env = dict(os.environ, CONTROLM_XML_BACKEND='etree')
+    result = subprocess.run([sys.executable, '-X', 'importtime', CLI] + args, capture_output=True, text=True, env=env)
+    assert result.returncode == 0, result.stderr
+    total = 0
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:'):
+            own_us, _, name = [field.strip() for field in line[len('import time:'):].split('|')]
+            if name.startswith('src.'):
+                total += int(own_us)
+    return total
+
+def _single_step_run(tmp_path):
+    return ['--no-daemon', '--input', SAMPLE_DEV_XML, '--output', str(tmp_path / "out.xml"),
+            '--target-env', 'preprod', '--steps', 'activate']
+
+
+def test_single_step_run_skips_unneeded_modules(tmp_path):
+    imported = _modules_after(_single_step_run(tmp_path), tmp_path)
+    assert 'src.xml_modifiers' in imported
+    assert imported & UNNEEDED_MODULES == set()
+    assert (tmp_path / "out.xml").exists()
+
+def test_fan_out_run_loads_its_modules_on_use(tmp_path):
+    args = ['--no-daemon', '--input', SAMPLE_DEV_XML, '--target-env', 'preprod', 'prod',
+            '--output', str(tmp_path / "preprod.xml"), str(tmp_path / "prod.xml"), '--steps', 'activate']
+    imported = _modules_after(args, tmp_path)
+    assert 'concurrent.futures' in imported
+    assert (tmp_path / "prod.xml").exists()
+
+def test_single_step_run_src_imports_fit_the_budget(tmp_path):
+    assert _src_import_time_us(_single_step_run(tmp_path)) < SRC_IMPORT_BUDGET_US
@@ -0,0 +1,105 @@
+import os
+import json
+import pytest
+import xml.etree.ElementTree as ET
+from src.metrics import RunMetrics, StepMetrics, MetricsRecorder
+from src.change_journal import ChangeJournal, recording, set_attribute, insert_child
+from src.step_engine import apply_steps
+from src.modify_controlm_xml import transform_file
+from src import xml_modifiers
+from src.xml_modifiers import activate_folders, apply_environment_promotion, standardize_resources, standardize_notifications
+from src.xml_modifiers import PromotionMemo, promotion_memo_counts, use_rule_pack
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+COUNT_FIELDS = ['elements_modified', 'attributes_modified', 'children_inserted', 'children_removed', 'changes']
+
+
+def test_step_functions_return_their_counts():
+    root = ET.parse(SAMPLE_DEV_XML).getroot()
+    assert activate_folders(root) > 0
+    assert apply_environment_promotion(root, 'preprod') > 0
+    assert standardize_resources(root, 'preprod') > 0
+    assert standardize_notifications(root, 'preprod') == len(root.findall('.//JOB'))
+    assert standardize_notifications(root, 'dev') is None
+
+def test_recorder_counts_and_forwards_to_journal():
+    journal = ChangeJournal()
+    recorder = MetricsRecorder(journal)
+    recorder.current = StepMetrics('promote')
+    job = ET.Element('JOB')
+    with recording(recorder):
+        set_attribute(job, 'JOBNAME', 'A')
+        set_attribute(job, 'RUN_AS', 'B')
+        insert_child(job, 0, ET.Element('QUANTITATIVE'))
+    assert len(journal) == 3
+    assert recorder.current.attributes_modified == 2
+    assert recorder.current.children_inserted == 1
+    assert recorder.current.elements_modified == 1
+
+@pytest.mark.parametrize("sequential", [False, True])
+def test_apply_steps_collects_one_result_per_step(sequential):
+    root = ET.parse(SAMPLE_DEV_XML).getroot()
+    metrics = RunMetrics()
+    apply_steps(root, ALL_STEPS, 'preprod', sequential=sequential, metrics=metrics)
+
+    assert [s.step for s in metrics.steps] == ALL_STEPS
+    assert 'transform' in metrics.timings
+    by_step = {s.step: s for s in metrics.steps}
+    assert by_step['activate'].elements_visited == len(root.findall('FOLDER'))
+    assert by_step['resources'].elements_visited == len(root.findall('.//JOB'))
+    assert by_step['notifications'].children_inserted == 2 * len(root.findall('.//JOB'))
+    assert by_step['promote'].attributes_modified == by_step['promote'].changes
+    for step_metrics in metrics.steps:
+        assert step_metrics.wall_time >= 0 and step_metrics.cpu_time >= 0
+
+def test_fused_and_sequential_count_the_same_changes():
+    results = {}
+    for sequential in (False, True):
+        metrics = RunMetrics()
+        apply_steps(ET.parse(SAMPLE_DEV_XML).getroot(), ALL_STEPS, 'prod', sequential=sequential, metrics=metrics)
+        results[sequential] = [[getattr(s, field) for field in COUNT_FIELDS] for s in metrics.steps]
+    assert results[False] == results[True]
+
+def test_skipped_steps_report_zero():
+    metrics = RunMetrics()
+    apply_steps(ET.parse(SAMPLE_DEV_XML).getroot(), ['resources', 'notifications'], 'dev', metrics=metrics)
+    assert [s.as_dict()['elements_visited'] for s in metrics.steps] == [0, 0]
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_transform_file_writes_metrics_json(tmp_path, stream):
+    metrics_path = tmp_path / "metrics.json"
+    assert transform_file(SAMPLE_DEV_XML, str(tmp_path / "out.xml"), 'preprod', ALL_STEPS,
+                          stream=stream, metrics_path=str(metrics_path))
+    data = json.loads(metrics_path.read_text())
+    assert data['mode'] == ('stream' if stream else 'fused')
+    assert set(data['timings']) == ({'stream'} if stream else {'parse', 'transform', 'write'})
+    assert [s['step'] for s in data['steps']] == ALL_STEPS
+    assert data['steps'][1]['attributes_modified'] > 0
+    assert data['peak_rss_mb'] is None or data['peak_rss_mb'] > 0
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_metrics_report_promotion_memo_hits(tmp_path, stream):
+    # A fresh rule pack starts with empty memos
+    use_rule_pack({'environments': xml_modifiers.ENV_CONFIG, 'config_hash': xml_modifiers.rules_config_hash()})
+    metrics_path = tmp_path / "metrics.json"
+    assert transform_file(SAMPLE_DEV_XML, str(tmp_path / "out.xml"), 'preprod', ALL_STEPS,
+                          stream=stream, metrics_path=str(metrics_path))
+    memo = json.loads(metrics_path.read_text())['promotion_memo']
+    assert memo['hits'] > 0 and memo['misses'] > 0
+
+def test_promotion_memos_are_scoped_per_target_and_bounded():
+    use_rule_pack({'environments': xml_modifiers.ENV_CONFIG, 'config_hash': xml_modifiers.rules_config_hash()})
+    preprod, prod = ET.parse(SAMPLE_DEV_XML).getroot(), ET.parse(SAMPLE_DEV_XML).getroot()
+    apply_environment_promotion(preprod, 'preprod')
+    apply_environment_promotion(prod, 'preprod')
+    apply_environment_promotion(prod, 'prod')
+    assert set(xml_modifiers.PROMOTION_MEMOS) == {('dev', 'preprod'), ('preprod', 'prod')}
+    assert promotion_memo_counts()['misses'] == sum(memo.counts()['misses'] for memo in xml_modifiers.PROMOTION_MEMOS.values())
+
+    memo = PromotionMemo(maxsize=2)
+    upper = memo.rewrite('upper', str.upper)
+    for value in ['a', 'b', 'a', 'c', 'b']:
+        upper(value)
+    assert memo.counts() == {'hits': 1, 'misses': 4}
@@ -182,6 +182,17 @@ def test_resources_leaves_other_jobs_unchanged(sample_xml_root_for_resources, ta
     standardize_resources(root, target_env)
     assert get_resource_names(job) == initial_resources
 
+def test_resources_inserted_together_before_variables():
+    root = ET.fromstring(
+        "<DEFTABLE><FOLDER><JOB JOBNAME='X-ADB-Y'><INCOND NAME='A'/>"
+        "<VARIABLE NAME='%%A'/><VARIABLE NAME='%%B'/><QUANTITATIVE NAME='OTHER'/><ON/></JOB></FOLDER></DEFTABLE>")
+    assert standardize_resources(root, 'prod') == 3
+    target_cfg = ENV_CONFIG['prod']
+    assert [(c.tag, c.get('NAME')) for c in root.find('.//JOB')] == [
+        ('INCOND', 'A'), ('QUANTITATIVE', 'CONTROLM-RESOURCE'), ('QUANTITATIVE', target_cfg['dw_resource']),
+        ('QUANTITATIVE', target_cfg['adb_resource']), ('VARIABLE', '%%A'), ('VARIABLE', '%%B'),
+        ('QUANTITATIVE', 'OTHER'), ('ON', None)]
+
 def test_resources_skips_for_dev_env(sample_xml_root_for_resources):
     root = copy.deepcopy(sample_xml_root_for_resources)
     original_xml_string = ET.tostring(root, encoding='unicode')
@@ -325,3 +336,64 @@ def test_standardize_notifications_handles_job_with_no_on_blocks():
     standardize_notifications(root, 'preprod')
     assert any(on.tag == "ON" for on in job)
 
+
+# --- Tests for the compiled promotion dispatch table ---
+
+def test_promotion_skips_non_promotable_tags():
+    xml = """
+<DEFTABLE>
+    <FOLDER FOLDER_NAME="FIN-DEV-X">
+        <JOB JOBNAME="FIN-DEV-X-ADF-J" RUN_AS="svc_dev">
+            <QUANTITATIVE NAME="FIN-DEV-RES" QUANT="1"/>
+            <ON STMT="*" CODE="NOTOK"><DOMAIL DEST="a@example.com" SUBJECT="FIN-DEV-X failed"/></ON>
+        </JOB>
+    </FOLDER>
+</DEFTABLE>
+"""
+    root = ET.fromstring(xml)
+    apply_environment_promotion(root, 'preprod')
+    assert root.find('.//QUANTITATIVE').get('NAME') == 'FIN-DEV-RES'
+    assert root.find('.//DOMAIL').get('SUBJECT') == 'FIN-DEV-X failed'
+    assert root.find('.//JOB').get('JOBNAME') == 'FIN-PREPROD-X-ADF-J-preprod'
+
+def test_promotion_applies_generic_rules_to_unlisted_tags():
+    xml = """
+<DEFTABLE>
+    <SMART_FOLDER FOLDER_NAME="OPS-DEV-SF" APPLICATION="OPS-DEV-APP" DATACENTER="dev_dc_3" RUN_AS="ops_dev" NODEID="hostdev1" JOBNAME="OPS-DEV-SF-preprod"/>
+</DEFTABLE>
+"""
+    root = ET.fromstring(xml)
+    apply_environment_promotion(root, 'preprod')
+    folder = root.find('SMART_FOLDER')
+    assert folder.get('FOLDER_NAME') == 'OPS-PREPROD-SF'
+    assert folder.get('APPLICATION') == 'OPS-PREPROD-APP'
+    assert folder.get('DATACENTER') == 'preprod_dc_1'
+    assert folder.get('RUN_AS') == 'ops_pp'
+    assert folder.get('NODEID') == 'hostpp1'
+    # The job suffix rules only apply to JOB elements
+    assert folder.get('JOBNAME') == 'OPS-PREPROD-SF-preprod'
+
+def test_promotion_user_variable_only_for_user_name():
+    xml = """
+<DEFTABLE>
+    <FOLDER FOLDER_NAME="F">
+        <JOB JOBNAME="J">
+            <VARIABLE NAME="%%user" VALUE="svc_dev"/>
+            <VARIABLE NAME="%%other" VALUE="svc_dev"/>
+        </JOB>
+    </FOLDER>
+</DEFTABLE>
+"""
+    root = ET.fromstring(xml)
+    apply_environment_promotion(root, 'preprod')
+    assert root.find("./FOLDER/JOB/VARIABLE[@NAME='%%user']").get('VALUE') == 'svc_pp'
+    assert root.find("./FOLDER/JOB/VARIABLE[@NAME='%%other']").get('VALUE') == 'svc_dev'
+
+def test_notifications_leave_standardized_jobs_unchanged(sample_xml_root_for_notifications):
+    root = copy.deepcopy(sample_xml_root_for_notifications)
+    jobs = len(root.findall('.//JOB'))
+    assert standardize_notifications(root, 'preprod') == jobs
+    standardized = ET.tostring(root)
+    assert standardize_notifications(root, 'preprod') == 0
+    assert ET.tostring(root) == standardized
+    assert standardize_notifications(root, 'prod') == jobs
@@ -0,0 +1,122 @@
+import logging
+import os
+import pickle
+import pytest
+from src import parallel_folders, xml_backend
+from src.condition_check import ConditionIndex, collecting, find_condition_problems
+from src.errors import ControlMXmlError
+from src.modify_controlm_xml import transform_file
+from src.parallel_folders import parallel_transform
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+# --- Fixtures ---
+
+@pytest.fixture(params=['etree', 'lxml'])
+def backend(request):
+    if request.param == 'lxml' and xml_backend.lxml_module() is None:
+        pytest.skip("lxml is not installed")
+    previous = xml_backend.get_backend()
+    xml_backend.set_backend(request.param)
+    yield request.param
+    xml_backend.set_backend(previous)
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """One top-level element per chunk, so every folder goes through the pool on its own."""
+    monkeypatch.setattr(parallel_folders, 'CHUNK_BYTES', 1)
+
+def _serial_and_parallel(input_path, tmp_path, target_env='preprod', steps=ALL_STEPS):
+    assert transform_file(str(input_path), str(tmp_path / "serial.xml"), target_env, steps)
+    assert transform_file(str(input_path), str(tmp_path / "parallel.xml"), target_env, steps, parallel_folders=2)
+    return (tmp_path / "serial.xml").read_bytes(), (tmp_path / "parallel.xml").read_bytes()
+
+
+@pytest.mark.parametrize("target_env", ['preprod', 'prod'])
+def test_output_matches_serial_run(backend, small_chunks, tmp_path, target_env):
+    serial, parallel = _serial_and_parallel(SAMPLE_DEV_XML, tmp_path, target_env)
+    assert parallel == serial
+
+def test_whole_file_in_one_chunk(backend, tmp_path):
+    serial, parallel = _serial_and_parallel(SAMPLE_DEV_XML, tmp_path)
+    assert parallel == serial
+
+@pytest.mark.parametrize("xml_bytes", [
+    b"<DEFTABLE/>",
+    b"<DEFTABLE>\n</DEFTABLE>",
+    b"<DEFTABLE><FOLDER FOLDER_NAME='A-DEV-1'/></DEFTABLE>",
+    # '>' in attribute values, entities, a comment and CRLF between folders
+    b"<DEFTABLE a='1'>t&amp;<FOLDER FOLDER_NAME='A>DEV-1'/><FOLDER FOLDER_NAME=\"x'>\"><JOB JOBNAME='A-DEV-1-ADF-J'/>"
+    b"</FOLDER  >&amp;x\r\n<!-- c -->y<FOLDER/></DEFTABLE>\n",
+    b"<?xml version='1.0' encoding='ISO-8859-1'?>\n<DEFTABLE>\r\n<FOLDER FOLDER_NAME='A-DEV-\xe9'>"
+    b"<JOB JOBNAME='A-DEV-\xe9-ADF-J'/></FOLDER>\r\n</DEFTABLE>",
+])
+def test_edge_cases_match_serial_run(backend, small_chunks, tmp_path, xml_bytes):
+    input_path = tmp_path / "input.xml"
+    input_path.write_bytes(xml_bytes)
+    serial, parallel = _serial_and_parallel(input_path, tmp_path)
+    assert parallel == serial
+
+@pytest.mark.parametrize("xml_bytes", [
+    b'<DEFTABLE xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+    b'<FOLDER FOLDER_NAME="A-DEV-1" xsi:type="Folder"><JOB JOBNAME="A-DEV-1-ADF-J"/></FOLDER>\n'
+    b'<FOLDER FOLDER_NAME="A-DEV-2"/></DEFTABLE>',
+    # Prefixes ElementTree renames, on job attributes
+    b'<DEFTABLE xmlns:x="urn:x" xmlns:y="urn:y&amp;z">\n<FOLDER FOLDER_NAME="A-DEV-1">'
+    b'<JOB JOBNAME="A-DEV-1-ADF-J" x:id="1" y:note="2"/></FOLDER>\n</DEFTABLE>',
+])
+def test_folders_may_use_prefixes_declared_on_the_root(backend, small_chunks, tmp_path, xml_bytes):
+    input_path = tmp_path / "input.xml"
+    input_path.write_bytes(xml_bytes)
+    serial, parallel = _serial_and_parallel(input_path, tmp_path)
+    assert parallel == serial
+
+@pytest.mark.parametrize("xml_bytes, split", [
+    # The root uses the namespace it declares, as Control-M exports do
+    (open(SAMPLE_DEV_XML, 'rb').read(), True),
+    # xsi is never used, and x is declared before y but used after it
+    (b'<DEFTABLE xmlns:x="urn:x" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:y="urn:y">\n'
+     b'<FOLDER FOLDER_NAME="A-DEV-1" y:note="2"><JOB JOBNAME="A-DEV-1-ADF-J" x:id="1"/></FOLDER>\n</DEFTABLE>', False),
+    # A folder declares its own
+    (b'<DEFTABLE>\n<FOLDER FOLDER_NAME="A-DEV-1" xmlns:x="urn:x" x:id="1"/>\n</DEFTABLE>', False),
+])
+def test_root_namespace_declarations_match_serial_run(backend, small_chunks, tmp_path, caplog, xml_bytes, split):
+    input_path = tmp_path / "input.xml"
+    input_path.write_bytes(xml_bytes)
+    assert parallel_folders.matches_serial_namespaces(str(input_path)) == split
+    serial, parallel = _serial_and_parallel(input_path, tmp_path)
+    assert parallel == serial
+    in_one_process = any("transformed in one process" in r.getMessage() for r in caplog.records)
+    assert in_one_process == (backend == 'etree' and not split)
+
+def test_validate_checks_the_whole_file(small_chunks, tmp_path):
+    input_path = tmp_path / "input.xml"
+    input_path.write_text("""<DEFTABLE>
+      <FOLDER FOLDER_NAME="APP-DEV-A"><JOB JOBNAME="APP-DEV-A-ADF-J"><OUTCOND NAME="A-OK" ODATE="ODAT" SIGN="+"/></JOB></FOLDER>
+      <FOLDER FOLDER_NAME="APP-DEV-B"><JOB JOBNAME="APP-DEV-B-ADF-J"><INCOND NAME="A-OK" ODATE="ODAT" AND_OR="A"/>
+        <INCOND NAME="X-OK" ODATE="ODAT" AND_OR="A"/></JOB></FOLDER>
+    </DEFTABLE>""")
+    index = ConditionIndex()
+    with collecting(index):
+        assert parallel_transform(str(input_path), str(tmp_path / "out.xml"), 'preprod', ['validate'], 2)
+    problems = find_condition_problems(index)
+    assert [finding['name'] for finding in problems['dangling_inputs']] == ['X-OK']
+    assert len(index.folders) == 2
+
+def test_parse_error_removes_partial_output(tmp_path):
+    input_path = tmp_path / "broken.xml"
+    input_path.write_text("<DEFTABLE><FOLDER></DEFTABLE>")
+    output_path = tmp_path / "out.xml"
+    assert not parallel_transform(str(input_path), str(output_path), 'preprod', ALL_STEPS, 2)
+    assert not output_path.exists()
+
+def test_serial_only_options_run_in_one_process(tmp_path, caplog):
+    assert transform_file(SAMPLE_DEV_XML, str(tmp_path / "out.xml"), 'preprod', ALL_STEPS, stream=True,
+                          parallel_folders=2)
+    assert any("--parallel-folders cannot be combined with --stream" in r.getMessage()
+               for r in caplog.records if r.levelno == logging.WARNING)
+
+def test_step_errors_keep_their_step_across_processes():
+    error = pickle.loads(pickle.dumps(ControlMXmlError("bad pattern", step='promote')))
+    assert str(error) == "bad pattern" and error.step == 'promote'
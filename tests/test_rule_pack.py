@@ -0,0 +1,116 @@
+import os
+import subprocess
+import sys
+import json
+import pytest
+import xml.etree.ElementTree as ET
+from src import rule_pack, xml_modifiers
+from src.errors import ControlMXmlError
+from src.modify_controlm_xml import transform_file
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+QA_RULES_TOML = """
+[environments.dev]
+adf_resource = "ADFDEV"
+dw_resource = "DWDEV"
+adb_resource = "ADBDEV"
+env_tag_pattern = "-DEV-"
+user_suffix = "_dev"
+node_env_id = "dev"
+datacenter_pattern = 'dev_dc_\\d+'
+
+[environments.qa]
+promotes_from = "dev"
+notification_dest = "qa-alerts@example.com"
+adf_resource = "APP-AZ-ADF-QA"
+dw_resource = "DWQA"
+adb_resource = "APP-AZ-ADB-QA"
+env_tag_replacement = "-QA-"
+user_suffix = "_qa"
+node_env_id = "qa"
+datacenter_replacement = "qa_dc_1"
+notification_template = '''
+<ON STMT="*" CODE="NOTOK">
+    <DOMAIL URGENCY="R" DEST="{dest}" SUBJECT="QA FAILED Job: %%JOBNAME"/>
+</ON>
+'''
+"""
+
+# --- Fixtures ---
+
+@pytest.fixture
+def restore_default_rules():
+    """Tests that activate other rules put the default rule pack back afterwards."""
+    yield
+    xml_modifiers.load_rules_config()
+
+def _write_rules(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_default_rules_define_the_promotion_path():
+    pack = rule_pack.load_rule_pack()
+    assert list(pack['environments']) == ['dev', 'preprod', 'prod']
+    assert pack['environments']['preprod']['promotes_from'] == 'dev'
+    assert pack['environments']['prod']['promotes_from'] == 'preprod'
+    assert [on.get('CODE') for on in rule_pack.parse_notification_template('preprod', pack['environments']['preprod'])] == ['NOTOK', 'ENDEDOK']
+    patterns = rule_pack.compile_promotion_patterns('dev', pack['environments']['dev'], pack['environments']['preprod'])
+    assert patterns['source_tag_pattern'].search('fin-dev-gl')
+
+def test_import_loads_no_rules():
+    code = ("import src.xml_modifiers as m; assert 'ENV_CONFIG' not in vars(m); "
+            "assert 'preprod' in m.ENV_CONFIG")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            cwd=os.path.join(os.path.dirname(__file__), ".."))
+    assert result.returncode == 0, result.stderr
+
+def test_environments_are_compiled_on_first_use(restore_default_rules):
+    xml_modifiers.load_rules_config()
+    assert xml_modifiers.PARSED_NOTIFICATIONS == {} and xml_modifiers.PROMOTION_PATTERNS == {}
+    notifications = xml_modifiers._get_notification_template('prod')
+    xml_modifiers._get_promotion_patterns_for_target('prod')
+    assert set(xml_modifiers.PARSED_NOTIFICATIONS) == {'prod'} and set(xml_modifiers.PROMOTION_PATTERNS) == {'prod'}
+    assert xml_modifiers._get_notification_template('prod') is notifications
+
+def test_config_hash_follows_the_file_contents(tmp_path):
+    config = json.load(open(rule_pack.DEFAULT_CONFIG_PATH))
+    config_path = _write_rules(tmp_path, "rules.json", json.dumps(config))
+    first = rule_pack.load_rule_pack(config_path)
+    assert rule_pack.config_hash_of(rule_pack.load_rule_pack(config_path)) == rule_pack.config_hash_of(first)
+
+    config['environments']['prod']['dw_resource'] = 'DWPROD2'
+    _write_rules(tmp_path, "rules.json", json.dumps(config))
+    second = rule_pack.load_rule_pack(config_path)
+    assert rule_pack.config_hash_of(second) != rule_pack.config_hash_of(first)
+    assert second['environments']['prod']['dw_resource'] == 'DWPROD2'
+
+@pytest.mark.skipif(sys.version_info < (3, 11), reason="tomllib needs Python 3.11")
+def test_toml_rules_add_an_environment(tmp_path, restore_default_rules):
+    config_path = _write_rules(tmp_path, "rules.toml", QA_RULES_TOML)
+    xml_modifiers.load_rules_config(config_path, 'qa')
+    output_path = tmp_path / "qa.xml"
+    assert transform_file(SAMPLE_DEV_XML, str(output_path), 'qa', ALL_STEPS)
+
+    root = ET.parse(output_path).getroot()
+    assert all('-QA-' in folder.get('FOLDER_NAME') for folder in root.iter('FOLDER'))
+    job = root.find('.//JOB')
+    assert [on.find('DOMAIL').get('DEST') for on in job.findall('ON')] == ['qa-alerts@example.com']
+    assert 'CONTROLM-RESOURCE' in {q.get('NAME') for q in job.findall('QUANTITATIVE')}
+
+@pytest.mark.parametrize("environments, message", [
+    ({}, "non-empty 'environments'"),
+    ({'qa': {'promotes_from': 'staging'}}, "unknown environment 'staging'"),
+    ({'dev': {'env_tag_pattern': '-DEV-('}}, "Invalid env_tag_pattern"),
+    ({'qa': {'notification_template': '<ON>'}}, "Invalid notification template"),
+])
+def test_invalid_rules_are_rejected(environments, message):
+    with pytest.raises(ControlMXmlError, match=message):
+        rule_pack.validate_rules_config({'environments': environments})
+
+def test_unknown_target_env_is_rejected():
+    with pytest.raises(ControlMXmlError, match="Unknown target environment 'qa'"):
+        xml_modifiers.load_rules_config(target_env='qa')
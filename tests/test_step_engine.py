@@ -0,0 +1,83 @@
+import os
+import pytest
+import xml.etree.ElementTree as ET
+import copy
+import itertools
+from src.condition_check import CONDITION_OWNER_TAGS, CONDITION_TAGS
+from src.step_engine import apply_steps, compile_step_visitors, apply_visitors, StepVisitor, STEP_SCOPES
+from src.errors import ControlMXmlError
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+# --- Fixtures ---
+
+@pytest.fixture
+def sample_dev_root():
+    """Provides the root of the sample dev DEFTABLE."""
+    return ET.parse(SAMPLE_DEV_XML).getroot()
+
+
+# --- Fused vs sequential equivalence ---
+
+@pytest.mark.parametrize("target_env", ['preprod', 'prod'])
+@pytest.mark.parametrize("steps", list(itertools.permutations(ALL_STEPS)))
+def test_fused_matches_sequential(sample_dev_root, target_env, steps):
+    fused_root = copy.deepcopy(sample_dev_root)
+    sequential_root = copy.deepcopy(sample_dev_root)
+    apply_steps(fused_root, list(steps), target_env)
+    apply_steps(sequential_root, list(steps), target_env, sequential=True)
+    assert ET.tostring(fused_root) == ET.tostring(sequential_root)
+
+def test_fused_matches_sequential_for_dev_target(sample_dev_root):
+    fused_root = copy.deepcopy(sample_dev_root)
+    sequential_root = copy.deepcopy(sample_dev_root)
+    apply_steps(fused_root, ALL_STEPS, 'dev')
+    apply_steps(sequential_root, ALL_STEPS, 'dev', sequential=True)
+    assert ET.tostring(fused_root) == ET.tostring(sequential_root)
+
+def test_apply_steps_reports_unknown_steps(sample_dev_root):
+    applied, unknown = apply_steps(sample_dev_root, ['activate', 'bogus'], 'preprod')
+    assert applied == ['activate']
+    assert unknown == ['bogus']
+
+
+# --- Visitor pass semantics ---
+
+def test_inserted_children_skip_earlier_visitors():
+    root = ET.fromstring("<DEFTABLE><FOLDER><JOB/></FOLDER></DEFTABLE>")
+    seen = []
+    mark = StepVisitor('mark', lambda el: seen.append(el.tag) or 0)
+    insert = StepVisitor('insert', lambda job: job.append(ET.Element('ON')) or 1,
+                         tags=('JOB',), structural=True)
+    apply_visitors(root, [mark, insert])
+    assert seen == ['FOLDER', 'JOB']
+    assert root.find('.//ON') is not None
+
+def test_inserted_children_receive_later_visitors():
+    root = ET.fromstring("<DEFTABLE><FOLDER><JOB/></FOLDER></DEFTABLE>")
+    seen = []
+    insert = StepVisitor('insert', lambda job: job.append(ET.Element('ON')) or 1,
+                         tags=('JOB',), structural=True)
+    mark = StepVisitor('mark', lambda el: seen.append(el.tag) or 0)
+    apply_visitors(root, [insert, mark])
+    assert seen == ['FOLDER', 'JOB', 'ON']
+
+def test_activate_visitor_only_touches_top_level_folders():
+    root = ET.fromstring("<DEFTABLE><FOLDER><FOLDER/></FOLDER></DEFTABLE>")
+    apply_visitors(root, compile_step_visitors(['activate'], 'preprod'))
+    outer = root.find('FOLDER')
+    assert outer.get('FOLDER_ORDER_METHOD') == 'SYSTEM'
+    assert outer.find('FOLDER').get('FOLDER_ORDER_METHOD') is None
+
+def test_visitor_errors_carry_step_name():
+    root = ET.fromstring("<DEFTABLE><FOLDER/></DEFTABLE>")
+    def fail(element):
+        raise ValueError("boom")
+    with pytest.raises(ControlMXmlError) as exc_info:
+        apply_visitors(root, [StepVisitor('broken', fail)])
+    assert exc_info.value.step == 'broken'
+
+def test_validate_scope_matches_condition_check_tags():
+    # step_engine spells the tags out so that runs without validate do not import condition_check
+    assert frozenset(STEP_SCOPES['validate']['tags']) == CONDITION_OWNER_TAGS | CONDITION_TAGS
@@ -0,0 +1,76 @@
+import os
+import pytest
+import xml.etree.ElementTree as ET
+from src.streaming import stream_transform
+from src.step_engine import apply_steps
+from src.modify_controlm_xml import write_xml
+from src.errors import ControlMXmlError
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+
+def _tree_output(input_path, output_path, target_env, steps):
+    """Runs the steps the non-streaming way and returns the written bytes."""
+    tree = ET.parse(input_path)
+    apply_steps(tree.getroot(), steps, target_env)
+    assert write_xml(tree, str(output_path))
+    with open(output_path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("target_env", ['preprod', 'prod'])
+def test_stream_matches_tree_output(tmp_path, target_env):
+    expected = _tree_output(SAMPLE_DEV_XML, tmp_path / "tree.xml", target_env, ALL_STEPS)
+    stream_output = tmp_path / "stream.xml"
+    assert stream_transform(SAMPLE_DEV_XML, str(stream_output), target_env, ALL_STEPS)
+    assert stream_output.read_bytes() == expected
+
+@pytest.mark.parametrize("xml_string", [
+    "<DEFTABLE/>",
+    "<DEFTABLE>\n</DEFTABLE>",
+    "<DEFTABLE><FOLDER FOLDER_NAME='A-DEV-1'/></DEFTABLE>",
+    "<DEFTABLE>\n  <FOLDER FOLDER_NAME='A-DEV-1'><JOB JOBNAME='A-DEV-1-ADF-J'/></FOLDER>\n  <FOLDER/>\n</DEFTABLE>\n",
+])
+def test_stream_matches_tree_output_edge_cases(tmp_path, xml_string):
+    input_path = tmp_path / "input.xml"
+    input_path.write_text(xml_string)
+    expected = _tree_output(str(input_path), tmp_path / "tree.xml", 'preprod', ALL_STEPS)
+    stream_output = tmp_path / "stream.xml"
+    assert stream_transform(str(input_path), str(stream_output), 'preprod', ALL_STEPS)
+    assert stream_output.read_bytes() == expected
+
+@pytest.mark.parametrize("xml_string", [
+    # Declared on the root, used only by the folders
+    '<DEFTABLE xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n  <FOLDER FOLDER_NAME="A-DEV-1" '
+    'xsi:type="x"><JOB JOBNAME="A-DEV-1-ADF-J"/></FOLDER>\n  <FOLDER FOLDER_NAME="B"/>\n</DEFTABLE>',
+    # Used by the root and a folder
+    '<DEFTABLE xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:noNamespaceSchemaLocation="Folder.xsd">'
+    '<FOLDER FOLDER_NAME="A-DEV-1" xsi:type="x"/></DEFTABLE>',
+])
+def test_stream_keeps_root_namespace_declarations_on_the_root(tmp_path, xml_string):
+    input_path = tmp_path / "input.xml"
+    input_path.write_text(xml_string)
+    expected = _tree_output(str(input_path), tmp_path / "tree.xml", 'preprod', ALL_STEPS)
+    stream_output = tmp_path / "stream.xml"
+    assert stream_transform(str(input_path), str(stream_output), 'preprod', ALL_STEPS)
+    assert stream_output.read_bytes() == expected
+    assert b'<FOLDER xmlns' not in expected
+
+def test_stream_missing_input_returns_false(tmp_path):
+    assert not stream_transform(str(tmp_path / "missing.xml"), str(tmp_path / "out.xml"), 'preprod', ALL_STEPS)
+
+def test_stream_parse_error_removes_partial_output(tmp_path):
+    input_path = tmp_path / "broken.xml"
+    input_path.write_text("<DEFTABLE><FOLDER></DEFTABLE>")
+    output_path = tmp_path / "out.xml"
+    assert not stream_transform(str(input_path), str(output_path), 'preprod', ALL_STEPS)
+    assert not output_path.exists()
+
+def test_stream_step_error_propagates(tmp_path, monkeypatch):
+    import src.xml_modifiers as xml_modifiers
+    monkeypatch.delitem(xml_modifiers.ENV_CONFIG, 'dev')
+    output_path = tmp_path / "out.xml"
+    with pytest.raises(ControlMXmlError) as exc_info:
+        stream_transform(SAMPLE_DEV_XML, str(output_path), 'preprod', ['promote'])
+    assert exc_info.value.step == 'promote'
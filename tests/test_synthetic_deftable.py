@@ -0,0 +1,44 @@
+import xml.etree.ElementTree as ET
+from benchmarks.synthetic_deftable import generate_deftable
+from src.step_engine import apply_steps
+
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+
+def test_generates_requested_shape(tmp_path):
+    path = tmp_path / "synthetic.xml"
+    stats = generate_deftable(str(path), folders=3, jobs_per_folder=4, on_blocks=3, quantitatives=4, variables=1)
+    assert stats == {'folders': 3, 'jobs': 12}
+
+    root = ET.parse(path).getroot()
+    assert len(root.findall('FOLDER')) == 3
+    jobs = root.findall('.//JOB')
+    assert len(jobs) == 12
+    for job in jobs:
+        assert '-DEV-' in job.get('JOBNAME')
+        assert job.get('RUN_AS').endswith('_dev')
+        assert len(job.findall('ON')) == 3
+        assert len(job.findall('VARIABLE')) == 2
+        assert job.find("VARIABLE[@NAME='%%user']") is not None
+    # The first job of each folder has no predecessor to wait on
+    assert len(root.findall('.//INCOND')) == 3 * 3
+
+def test_is_deterministic_per_seed(tmp_path):
+    first, second, other = tmp_path / "a.xml", tmp_path / "b.xml", tmp_path / "c.xml"
+    generate_deftable(str(first), 2, 5, seed=7)
+    generate_deftable(str(second), 2, 5, seed=7)
+    generate_deftable(str(other), 2, 5, seed=8)
+    assert first.read_bytes() == second.read_bytes()
+    assert first.read_bytes() != other.read_bytes()
+
+def test_all_steps_apply_to_synthetic_file(tmp_path):
+    path = tmp_path / "synthetic.xml"
+    generate_deftable(str(path), folders=2, jobs_per_folder=10)
+    root = ET.parse(path).getroot()
+    apply_steps(root, ALL_STEPS, 'preprod')
+
+    serialized = ET.tostring(root, encoding='unicode')
+    assert '-DEV-' not in serialized
+    assert '_dev"' not in serialized
+    for folder in root.findall('FOLDER'):
+        assert folder.get('FOLDER_ORDER_METHOD') == 'SYSTEM'
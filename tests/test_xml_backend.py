@@ -0,0 +1,138 @@
+import os
+import copy
+import pytest
+import xml.etree.ElementTree as ET
+from src import xml_backend
+from src.step_engine import apply_steps
+from src.modify_controlm_xml import transform_file
+from src.xml_modifiers import standardize_notifications, standardize_resources
+from src.xml_modifiers import _compile_notification_factory, _get_notification_template
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+AVAILABLE_BACKENDS = ['etree'] + (['lxml'] if xml_backend.lxml_module() is not None else [])
+
+# --- Fixtures ---
+
+@pytest.fixture(params=AVAILABLE_BACKENDS)
+def backend(request):
+    """Runs the test once per installed backend, restoring the previous one afterwards."""
+    previous = xml_backend.get_backend()
+    xml_backend.set_backend(request.param)
+    yield request.param
+    xml_backend.set_backend(previous)
+
+def _tostring(root):
+    if xml_backend.is_lxml_element(root):
+        return xml_backend.lxml_module().tostring(root)
+    return ET.tostring(root)
+
+
+def test_parse_uses_selected_backend(backend):
+    root = xml_backend.parse(SAMPLE_DEV_XML).getroot()
+    assert xml_backend.is_lxml_element(root) == (backend == 'lxml')
+    assert len(xml_backend.find_jobs(root)) == len(root.findall('.//JOB'))
+
+@pytest.mark.parametrize("target_env", ['preprod', 'prod'])
+def test_transform_output_is_equivalent_across_backends(backend, tmp_path, target_env):
+    output_path = tmp_path / f"{backend}.xml"
+    assert transform_file(SAMPLE_DEV_XML, str(output_path), target_env, ALL_STEPS)
+
+    expected = ET.parse(SAMPLE_DEV_XML)
+    apply_steps(expected.getroot(), ALL_STEPS, target_env)
+    expected.write(str(tmp_path / "expected.xml"), encoding='utf-8', xml_declaration=True)
+    assert output_path.read_bytes() == (tmp_path / "expected.xml").read_bytes()
+
+@pytest.mark.parametrize("mode", [{}, {'sequential': True}, {'stream': True}, {'compact': True},
+                                  {'parallel_folders': 2}])
+def test_every_mode_writes_the_same_bytes_on_each_backend(backend, tmp_path, mode):
+    expected = ET.parse(SAMPLE_DEV_XML)
+    apply_steps(expected.getroot(), ALL_STEPS, 'preprod')
+    expected.write(str(tmp_path / "expected.xml"), encoding='utf-8', xml_declaration=True)
+    assert transform_file(SAMPLE_DEV_XML, str(tmp_path / "out.xml"), 'preprod', ALL_STEPS, **mode)
+    assert (tmp_path / "out.xml").read_bytes() == (tmp_path / "expected.xml").read_bytes()
+
+def test_serialize_spells_values_as_etree_does(backend, tmp_path):
+    input_path = tmp_path / "input.xml"
+    input_path.write_text('<!DOCTYPE DEFTABLE><DEFTABLE A="tab&#9;nl&#10;gt&gt;/"><E/>x/&gt;<F B=""></F></DEFTABLE>')
+    tree = xml_backend.parse(str(input_path))
+    expected = ET.parse(str(input_path))
+    assert xml_backend.serialize(tree) == ET.tostring(expected.getroot(), encoding='utf-8', xml_declaration=True)
+
+def test_serialize_leaves_slashes_outside_tag_ends_alone(backend, tmp_path):
+    input_path = tmp_path / "input.xml"
+    input_path.write_text('<DEFTABLE><JOB DESCRIPTION="a/> b" CMD=\'say "/>"\'>a/> b<E X="/"/>"/>"</JOB>'
+                          '<F/></DEFTABLE>')
+    tree = xml_backend.parse(str(input_path))
+    expected = ET.parse(str(input_path))
+    assert xml_backend.serialize(tree) == ET.tostring(expected.getroot(), encoding='utf-8', xml_declaration=True)
+
+@pytest.mark.parametrize("serialized, expected", [
+    (b'<A><B/>x/&gt;<C X="1"/></A>', b'<A><B />x/&gt;<C X="1" /></A>'),
+    (b'<A X="a/b" Y="/"/>', b'<A X="a/b" Y="/" />'),
+    (b'<A><!-- <B/> --><?pi <C/>?><D T="&#9;"/>&amp;#9;</A>', b'<A><!-- <B/> --><?pi <C/>?><D T="&#09;" />&amp;#9;</A>'),
+], ids=['tag-ends', 'slash-in-value', 'comment-and-pi'])
+def test_etree_format_rewrites_start_tags_only(serialized, expected):
+    assert xml_backend._etree_format(serialized) == expected
+
+@pytest.mark.parametrize("sequential", [False, True])
+def test_fused_matches_sequential(backend, sequential):
+    root = xml_backend.parse(SAMPLE_DEV_XML).getroot()
+    reference = copy.deepcopy(root)
+    apply_steps(root, ALL_STEPS, 'prod', sequential=sequential)
+    apply_steps(reference, ALL_STEPS, 'prod', sequential=not sequential)
+    assert _tostring(root) == _tostring(reference)
+
+def test_modifiers_accept_lxml_elements():
+    lxml_etree = pytest.importorskip("lxml.etree")
+    root = lxml_etree.fromstring("<DEFTABLE><FOLDER><JOB JOBNAME='X-ADF-Y'/></FOLDER></DEFTABLE>")
+    standardize_resources(root, 'preprod')
+    standardize_notifications(root, 'preprod')
+    job = root.find('.//JOB')
+    assert {q.get('NAME') for q in job.findall('QUANTITATIVE')} == {'CONTROLM-RESOURCE', 'APP-AZ-ADF-PP'}
+    assert len(job.findall('ON')) == len(_get_notification_template('preprod'))
+
+def test_copy_for_converts_between_backends():
+    lxml_etree = pytest.importorskip("lxml.etree")
+    template = _get_notification_template('prod')[0]
+    lxml_parent = lxml_etree.Element('JOB')
+    converted = xml_backend.copy_for(template, lxml_parent)
+    assert xml_backend.is_lxml_element(converted)
+    assert ET.canonicalize(lxml_etree.tostring(converted)) == ET.canonicalize(ET.tostring(template))
+    assert xml_backend.copy_for(template, lxml_parent) is not converted
+
+def test_notification_factory_builds_fresh_blocks_per_backend():
+    lxml_etree = pytest.importorskip("lxml.etree")
+    template = _get_notification_template('prod')
+    build = _compile_notification_factory(template)
+    expected = [ET.canonicalize(ET.tostring(t)) for t in template]
+    for job in (ET.Element('JOB'), lxml_etree.Element('JOB'), ET.Element('JOB')):
+        first, second = build(job), build(job)
+        assert all(xml_backend.is_lxml_element(b) == xml_backend.is_lxml_element(job) for b in first)
+        assert [ET.canonicalize(_tostring(b)) for b in first] == expected
+        assert all(a is not b and a not in template for a, b in zip(first, second))
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        xml_backend.set_backend('sax')
+
+def test_compact_parse_shares_equal_strings(backend):
+    root = xml_backend.parse_compact(SAMPLE_DEV_XML).getroot()
+    assert not xml_backend.is_lxml_element(root)
+    assert ET.tostring(root) == ET.tostring(ET.parse(SAMPLE_DEV_XML).getroot())
+    strings = [value for element in root.iter() for value in element.attrib.values()]
+    strings += [element.tail for element in root.iter() if element.tail is not None]
+    shared = {}
+    assert all(shared.setdefault(string, string) is string for string in strings)
+    assert len(shared) < len(strings)
+
+def test_compact_output_matches_etree_run(backend, tmp_path):
+    previous = xml_backend.get_backend()
+    xml_backend.set_backend('etree')
+    try:
+        assert transform_file(SAMPLE_DEV_XML, str(tmp_path / "etree.xml"), 'preprod', ALL_STEPS)
+    finally:
+        xml_backend.set_backend(previous)
+    assert transform_file(SAMPLE_DEV_XML, str(tmp_path / "compact.xml"), 'preprod', ALL_STEPS, compact=True)
+    assert (tmp_path / "compact.xml").read_bytes() == (tmp_path / "etree.xml").read_bytes()
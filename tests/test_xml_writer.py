@@ -0,0 +1,110 @@
+import io
+import os
+import pytest
+import xml.etree.ElementTree as ET
+from src import xml_backend
+from src.modify_controlm_xml import parse_xml, transform_file, write_xml
+from src.step_engine import apply_steps, STEP_VISITOR_FACTORIES, StepVisitor
+from src.xml_writer import IncrementalXmlWriter, atomic_output
+
+SAMPLE_DEV_XML = os.path.join(os.path.dirname(__file__), "..", "sample_data", "sample_controlm_dev.xml")
+ALL_STEPS = ['activate', 'promote', 'resources', 'notifications']
+
+# --- Fixtures ---
+
+@pytest.fixture(params=['etree', 'lxml'])
+def backend(request):
+    if request.param == 'lxml' and xml_backend.lxml_module() is None:
+        pytest.skip("lxml is not installed")
+    previous = xml_backend.get_backend()
+    xml_backend.set_backend(request.param)
+    yield request.param
+    xml_backend.set_backend(previous)
+
+def _leftover_temp_files(directory):
+    return [name for name in os.listdir(directory) if name.endswith('.tmp')]
+
+
+@pytest.mark.parametrize("xml_bytes", [
+    b"<DEFTABLE/>",
+    b"<DEFTABLE a='1'>t&amp;<FOLDER FOLDER_NAME='A-DEV-1'/>x&lt;<FOLDER/>\n</DEFTABLE>",
+    # Declarations on the root, used or not, including a default namespace
+    b'<DEFTABLE xmlns="urn:d" xmlns:x="urn:x" x:a="1"><FOLDER FOLDER_NAME="A-DEV-1"><JOB JOBNAME="A-DEV-1-J"/>'
+    b'</FOLDER></DEFTABLE>',
+    # Namespaces used inside the folders
+    b'<DEFTABLE xmlns:x="urn:x"><FOLDER FOLDER_NAME="A-DEV-1" x:b="2"><JOB JOBNAME="A-DEV-1-J" xmlns:y="urn:y" '
+    b'y:c="3"/></FOLDER><FOLDER/></DEFTABLE>',
+    b'<!DOCTYPE DEFTABLE [<!ENTITY e "v">]><DEFTABLE><FOLDER FOLDER_NAME="A-DEV-&e;"/></DEFTABLE>',
+])
+def test_output_matches_whole_tree_write(backend, tmp_path, xml_bytes):
+    input_path = tmp_path / "input.xml"
+    input_path.write_bytes(xml_bytes)
+    assert transform_file(str(input_path), str(tmp_path / "incremental.xml"), 'preprod', ALL_STEPS)
+    tree = parse_xml(str(input_path))
+    apply_steps(tree.getroot(), ALL_STEPS, 'preprod')
+    assert write_xml(tree, str(tmp_path / "whole.xml"))
+    assert (tmp_path / "incremental.xml").read_bytes() == (tmp_path / "whole.xml").read_bytes()
+
+@pytest.mark.parametrize("xml_bytes, incremental", [
+    (b"<DEFTABLE a='&quot;&lt;&gt;&#10;&#09;'>t<FOLDER FOLDER_NAME='\xc3\xa9 &amp; \xe2\x82\xac'>\r\n<JOB/></FOLDER>"
+     b"&gt;<FOLDER DESCRIPTION='not xmlns:x=1'/></DEFTABLE>", True),
+    # A namespace ElementTree declares on the root, so the whole tree is written
+    (b'<DEFTABLE xmlns:x="urn:x"><FOLDER FOLDER_NAME="A"/><FOLDER x:b="2"/><FOLDER/></DEFTABLE>', False),
+    (b'<DEFTABLE xmlns:x="urn:x" x:a="1"><FOLDER x:b="2"/></DEFTABLE>', False),
+])
+def test_etree_output_is_etree_write(tmp_path, xml_bytes, incremental):
+    tree = ET.ElementTree(ET.fromstring(xml_bytes))
+    writer = IncrementalXmlWriter(tree, str(tmp_path / "incremental.xml"))
+    for element in tree.getroot():
+        writer.write_element(element)
+    assert writer.write_whole_tree is not incremental
+    assert writer.finish()
+    expected = io.BytesIO()
+    tree.write(expected, encoding='utf-8', xml_declaration=True)
+    assert (tmp_path / "incremental.xml").read_bytes() == expected.getvalue()
+
+def test_sample_matches_whole_tree_write(backend, tmp_path):
+    tree = parse_xml(SAMPLE_DEV_XML)
+    apply_steps(tree.getroot(), ALL_STEPS, 'prod')
+    assert write_xml(tree, str(tmp_path / "whole.xml"))
+    assert transform_file(SAMPLE_DEV_XML, str(tmp_path / "incremental.xml"), 'prod', ALL_STEPS)
+    assert (tmp_path / "incremental.xml").read_bytes() == (tmp_path / "whole.xml").read_bytes()
+
+def test_folders_are_written_before_the_output_appears(backend, tmp_path):
+    tree = parse_xml(SAMPLE_DEV_XML)
+    output_path = tmp_path / "out.xml"
+    writer = IncrementalXmlWriter(tree, str(output_path))
+    writer.write_element(tree.getroot()[0])
+    assert not output_path.exists()
+    assert len(_leftover_temp_files(tmp_path)) == 1
+    for element in tree.getroot()[1:]:
+        writer.write_element(element)
+    assert writer.finish()
+    assert output_path.exists() and not _leftover_temp_files(tmp_path)
+
+def test_failed_step_keeps_earlier_output(tmp_path, monkeypatch):
+    output_path = tmp_path / "out.xml"
+    output_path.write_bytes(b"previous run")
+    jobs = len(parse_xml(SAMPLE_DEV_XML).getroot().findall('.//JOB'))
+    seen = []
+
+    def fail_on_last_job(element):
+        # By then the earlier folders have been written
+        seen.append(element)
+        if len(seen) == jobs:
+            raise ValueError("boom")
+        return 0
+    monkeypatch.setitem(STEP_VISITOR_FACTORIES, 'notifications',
+                        lambda target_env: StepVisitor('notifications', fail_on_last_job, tags=('JOB',)))
+    assert not transform_file(SAMPLE_DEV_XML, str(output_path), 'preprod', ALL_STEPS)
+    assert output_path.read_bytes() == b"previous run"
+    assert not _leftover_temp_files(tmp_path)
+
+def test_atomic_output_removes_temp_file_on_error(tmp_path):
+    output_path = tmp_path / "sub" / "out.xml"
+    with pytest.raises(ValueError):
+        with atomic_output(str(output_path)) as f:
+            f.write(b"<DEFTABLE>")
+            raise ValueError("interrupted")
+    assert not output_path.exists()
+    assert not _leftover_temp_files(tmp_path / "sub")